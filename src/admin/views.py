@@ -1,8 +1,14 @@
+from typing import List, Optional, Dict, Any
 from starlette.requests import Request
 from starlette_admin import IntegerField, StringField, FloatField, DateTimeField, BooleanField, EnumField, ImageField, \
     CountryField
 from models import RankName, RewardType, QuestionStatus
 from admin.tortoise_view import TortoiseModelView
+from components.leaderboard import leaderboard
+from components.members import registered_users
+from components.ranks import ranks
+from components.task_catalog import task_catalog
+from components.user_tasks import user_tasks
 
 
 class RankView(TortoiseModelView):
@@ -21,6 +27,24 @@ class RankView(TortoiseModelView):
         IntegerField("price")
     )
 
+    async def create(self, request: Request, data: Dict) -> Any:
+        obj = await super().create(request, data)
+        await ranks.reload()
+        await task_catalog.reload()  # видимость задач зависит от лиг рангов
+        return obj
+
+    async def edit(self, request: Request, pk: Any, data: Dict[str, Any]) -> Any:
+        obj = await super().edit(request, pk, data)
+        await ranks.reload()
+        await task_catalog.reload()  # видимость задач зависит от лиг рангов
+        return obj
+
+    async def delete(self, request: Request, pks: List[int]) -> Optional[int]:
+        deleted = await super().delete(request, pks)
+        await ranks.reload()
+        await task_catalog.reload()  # видимость задач зависит от лиг рангов
+        return deleted
+
 
 class UserView(TortoiseModelView):
     identity = "user"
@@ -38,6 +62,13 @@ class UserView(TortoiseModelView):
 
     def can_create(self, request: Request) -> bool: return False
 
+    async def delete(self, request: Request, pks: List[int]) -> Optional[int]:
+        deleted = await super().delete(request, pks)
+        await registered_users.discard(*map(int, pks))  # queryset.delete() не вызывает сигналы моделей
+        await leaderboard.remove(*map(int, pks))
+        await user_tasks.forget(*map(int, pks))
+        return deleted
+
 
 class ActivityView(TortoiseModelView):
     identity = "user-activity"
@@ -0,0 +1,278 @@
+import logging
+from asyncio import Task, create_task, sleep, CancelledError
+from datetime import datetime
+from time import time
+from redis.exceptions import RedisError
+from tortoise import connections, Model
+from tortoise.transactions import in_transaction
+from components.leaderboard import leaderboard
+from components.ranks import ranks
+from components.redis_db import redis
+from config import WRITE_BEHIND_FLUSH_INTERVAL, WRITE_BEHIND_BATCH
+from models import User
+
+logger = logging.getLogger(__name__)
+
+USER_KEY = "wb:user:{}"  # hash: energy, as_of (unix time), coins и week (еще не записанные в бд приращения)
+DIRTY_KEY = "wb:dirty"  # множество chat_id с незаписанными приращениями
+JOURNAL_KEY = "wb:journal"  # hash chat_id -> "coins:week:energy:as_of", снятые для записи в бд, но не подтвержденные
+FLUSH_LOCK_KEY = "wb:flush:lock"
+IDLE_TTL = 86400  # через сколько секунд без кликов удаляется сброшенное в бд состояние юзера
+
+# Клики юзера: регенерация энергии, добыча с обрезкой энергией, приращения монет. Повторяет логику sync_clicks.
+# Если энергии не хватает даже на один клик, состояние не меняется.
+# Начисление в недельный лидерборд повторяет leaderboard.ADD_SCRIPT без номера пересборки.
+# KEYS: [1] hash юзера, [2] DIRTY_KEY, [3] недельный лидерборд, [4] курсор его пересборки, [5] delta пересборки
+# ARGV: [1] chat_id, [2] клики, [3] press_force, [4] energy_per_sec, [5] max_energy, [6] now,
+#       [7] energy из бд, [8] last_sync_energy из бд (используются, если состояния юзера еще нет в Redis)
+CLICK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'energy', ARGV[7], 'as_of', ARGV[8], 'coins', 0, 'week', 0)
+end
+local state = redis.call('HMGET', KEYS[1], 'energy', 'as_of')
+local press_force = tonumber(ARGV[3])
+local now = tonumber(ARGV[6])
+local secs = math.max(now - tonumber(state[2]), 0)
+local energy = math.min(tonumber(state[1]) + secs * tonumber(ARGV[4]), tonumber(ARGV[5]))
+if energy < press_force then
+    return {1, 0}
+end
+local extraction = math.floor(math.min(tonumber(ARGV[2]) * press_force, math.floor(energy / press_force) * press_force))
+redis.call('HSET', KEYS[1], 'energy', string.format('%.17g', energy - extraction), 'as_of', ARGV[6])
+redis.call('HINCRBY', KEYS[1], 'coins', extraction)
+redis.call('HINCRBY', KEYS[1], 'week', extraction)
+if extraction > 0 then
+    redis.call('ZINCRBY', KEYS[3], extraction, ARGV[1])
+    local cursor = redis.call('GET', KEYS[4])
+    if cursor and tonumber(ARGV[1]) <= tonumber(cursor) then
+        redis.call('HINCRBY', KEYS[5], ARGV[1], extraction)
+    end
+end
+redis.call('PERSIST', KEYS[1])
+redis.call('SADD', KEYS[2], ARGV[1])
+return {0, extraction}
+"""
+
+# Снятие приращений юзера в журнал перед записью в бд (атомарно с удалением из DIRTY_KEY).
+# KEYS: [1] hash юзера, [2] DIRTY_KEY, [3] JOURNAL_KEY; ARGV: [1] chat_id, [2] IDLE_TTL
+DRAIN_SCRIPT = """
+redis.call('SREM', KEYS[2], ARGV[1])
+local state = redis.call('HMGET', KEYS[1], 'coins', 'week', 'energy', 'as_of')
+if not state[3] then return 0 end
+local coins = tonumber(state[1])
+local week = tonumber(state[2])
+local prev = redis.call('HGET', KEYS[3], ARGV[1])
+if prev then
+    local p_coins, p_week = string.match(prev, '^(-?%d+):(-?%d+):')
+    coins = coins + tonumber(p_coins)
+    week = week + tonumber(p_week)
+end
+redis.call('HSET', KEYS[3], ARGV[1], string.format('%d:%d:%s:%s', coins, week, state[3], state[4]))
+redis.call('HSET', KEYS[1], 'coins', 0, 'week', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+FLUSH_STATS_SQL = """
+UPDATE "stats" s
+SET coins = s.coins + v.coins, earned_week_coins = s.earned_week_coins + v.week, energy = v.energy
+FROM unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::float8[]) AS v(user_id, coins, week, energy)
+WHERE s.user_id = v.user_id
+"""
+
+FLUSH_ACTIVITY_SQL = """
+UPDATE "activity" a
+SET last_sync_energy = to_timestamp(v.as_of)
+FROM unnest($1::bigint[], $2::float8[]) AS v(user_id, as_of)
+WHERE a.user_id = v.user_id
+"""
+
+_click_script = redis.register_script(CLICK_SCRIPT)
+_drain_script = redis.register_script(DRAIN_SCRIPT)
+_flusher: Task | None = None
+
+
+class Pending:
+    """
+    Незаписанное в бд состояние юзера: приращения монет и актуальная энергия.
+    """
+    __slots__ = ("coins", "week", "energy", "as_of")
+
+    def __init__(self, coins: int, week: int, energy: float, as_of: float) -> None:
+        self.coins = coins
+        self.week = week
+        self.energy = energy
+        self.as_of = as_of
+
+
+async def apply_clicks(user: User, clicks: int) -> int | None:
+    """
+    Клики в режиме write-behind: энергия и приращения монет меняются в Redis, в бд пишет фоновый flusher.
+    :param user: объект модели User со stats, activity
+    :param clicks: количество кликов
+    :return: добыча в монетах или None, если энергии не хватает даже на один клик
+    """
+    rank = ranks[user.rank_id]
+    no_energy, extraction = await _click_script(
+        keys=[USER_KEY.format(user.id), DIRTY_KEY, leaderboard.key, leaderboard.cursor_key, leaderboard.delta_key],
+        args=[user.id, clicks, rank.press_force, rank.energy_per_sec, rank.max_energy, time(),
+              repr(float(user.stats.energy)), user.activity.last_sync_energy.timestamp()])
+
+    return None if no_energy else extraction
+
+
+async def get_pending(user_id: int) -> Pending | None:
+    """
+    Состояние юзера в Redis, которое еще не записано в бд (вместе с журналом незавершенного сброса).
+    :param user_id: chat_id юзера
+    """
+    async with redis.pipeline(transaction=True) as pipe:
+        state, journal = await (pipe.hmget(USER_KEY.format(user_id), "coins", "week", "energy", "as_of")
+                                .hget(JOURNAL_KEY, user_id).execute())
+
+    if state[2] is None:
+        return None
+
+    pending = Pending(int(state[0]), int(state[1]), float(state[2]), float(state[3]))
+
+    if journal is not None:
+        coins, week, _, _ = journal.decode().split(":")
+        pending.coins += int(coins)
+        pending.week += int(week)
+
+    return pending
+
+
+async def merge_pending(user: User) -> None:
+    """
+    Дополняет user.stats и user.activity (только в памяти) незаписанным состоянием из Redis.
+    Объекты после этого нельзя сохранять целиком, иначе приращения запишутся в бд дважды.
+    :param user: объект модели User со stats (и activity, если нужна дата синхронизации энергии)
+    """
+    pending = await get_pending(user.id)
+
+    if pending is None:
+        return
+
+    user.stats.coins += pending.coins
+    user.stats.earned_week_coins += pending.week
+    user.stats.energy = pending.energy
+
+    if isinstance(user.activity, Model):
+        user.activity.last_sync_energy = datetime.fromtimestamp(pending.as_of,
+                                                                tz=user.activity.last_sync_energy.tzinfo)
+
+
+async def set_energy(user_id: int, energy: float) -> None:
+    """
+    Устанавливает энергию юзера в Redis, если его состояние там есть (например после прилива).
+    :param user_id: chat_id юзера
+    :param energy: новое значение энергии
+    """
+    key = USER_KEY.format(user_id)
+
+    async with redis.pipeline(transaction=True) as pipe:
+        await pipe.watch(key)
+
+        if await pipe.exists(key):
+            pipe.multi()
+            pipe.hset(key, mapping={"energy": repr(float(energy)), "as_of": time()})
+            pipe.sadd(DIRTY_KEY, user_id)
+            await pipe.execute()
+
+
+async def _write_journal(user_ids: list[int]) -> None:
+    """
+    Записывает в бд журнал сброса для user_ids двумя UPDATE в одной транзакции и подтверждает его.
+    """
+    entries = await redis.hmget(JOURNAL_KEY, user_ids)
+    rows = [(user_id, *entry.decode().split(":")) for user_id, entry in zip(user_ids, entries) if entry is not None]
+
+    if not rows:
+        return
+
+    ids = [row[0] for row in rows]
+
+    async with in_transaction("api") as conn:
+        await conn.execute_query(FLUSH_STATS_SQL, [ids, [int(row[1]) for row in rows], [int(row[2]) for row in rows],
+                                                   [float(row[3]) for row in rows]])
+        await conn.execute_query(FLUSH_ACTIVITY_SQL, [ids, [float(row[4]) for row in rows]])
+
+    # Окно между коммитом и HDEL: при падении здесь журнал будет применен повторно (at-least-once)
+    await redis.hdel(JOURNAL_KEY, *ids)
+
+
+async def flush() -> int:
+    """
+    Сбрасывает в бд все накопленные приращения пачками по WRITE_BEHIND_BATCH юзеров.
+    Одновременно сброс выполняет только один воркер.
+    :return: количество сброшенных юзеров
+    """
+    if connections.get("api").capabilities.dialect != "postgres":
+        return 0
+
+    if not await redis.set(FLUSH_LOCK_KEY, 1, nx=True, ex=max(WRITE_BEHIND_FLUSH_INTERVAL * 6, 30)):
+        return 0
+
+    flushed = 0
+
+    try:
+        # Сначала дописываем журнал, оставшийся от упавшего воркера
+        cursor = 0
+
+        while True:
+            cursor, journal = await redis.hscan(JOURNAL_KEY, cursor, count=WRITE_BEHIND_BATCH)
+            await _write_journal([int(user_id) for user_id in journal])
+
+            if cursor == 0:
+                break
+
+        while user_ids := [int(user_id) for user_id in await redis.srandmember(DIRTY_KEY, WRITE_BEHIND_BATCH)]:
+            async with redis.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    await _drain_script(keys=[USER_KEY.format(user_id), DIRTY_KEY, JOURNAL_KEY],
+                                        args=[user_id, IDLE_TTL], client=pipe)
+                await pipe.execute()
+
+            await _write_journal(user_ids)
+            flushed += len(user_ids)
+
+    finally:
+        await redis.delete(FLUSH_LOCK_KEY)
+
+    return flushed
+
+
+async def _flush_forever() -> None:
+    while True:
+        await sleep(WRITE_BEHIND_FLUSH_INTERVAL)
+
+        try:
+            await flush()
+        except CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ошибка сброса кликов в бд")
+
+
+def start_flusher() -> None:
+    global _flusher
+
+    if _flusher is None:
+        _flusher = create_task(_flush_forever())
+
+
+async def stop_flusher() -> None:
+    """
+    Останавливает фоновый сброс и сбрасывает накопленное напоследок.
+    """
+    global _flusher
+
+    if _flusher is not None:
+        _flusher.cancel()
+        _flusher = None
+
+        try:
+            await flush()
+        except (RedisError, OSError):
+            logger.warning("Не удалось сбросить клики при остановке", exc_info=True)
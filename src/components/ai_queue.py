@@ -0,0 +1,609 @@
+import logging
+import re
+from asyncio import Task, Semaphore, create_task, gather, get_running_loop, run, sleep, wait_for, CancelledError
+from collections import deque
+from dataclasses import dataclass
+from itertools import chain
+from time import perf_counter, time
+from typing import Any, Protocol
+from zlib import crc32
+import numpy as np
+from httpx import AsyncClient
+from redis.exceptions import RedisError, ResponseError
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from components import broker
+from components.cache import init_cache, invalidate
+from components.redis_db import redis
+from components.vectors import VectorIndex, normalized, pack, unpack
+from config import AI_BACKEND_URL, AI_QUEUE_BATCH, AI_QUEUE_CONCURRENCY, AI_QUEUE_RETRY_DELAY, \
+    AI_QUEUE_MAX_ATTEMPTS, AI_ANSWER_TIMEOUT, AI_QUESTION_REWARD, TORTOISE_CONFIG, AI_EMBEDDING_URL, EMBEDDING_DIM, \
+    VECTOR_INDEX_PATH, AI_DUPLICATE_THRESHOLD
+from models import Question, QuestionStatus, Reward, RewardType
+
+logger = logging.getLogger(__name__)
+
+STREAM = "ai_questions"
+GROUP = "ai_workers"
+DEAD_STREAM = "ai_questions:dead"
+RECOVER_LOCK_KEY = "{}:recover"  # {} - stream очереди
+RECOVER_LOCK_TTL = 60  # потребители, запущенные в течение этого времени после первого, не ищут потерянные вопросы, сек
+BLOCK_MS = 5000  # сколько ждать новых вопросов в XREADGROUP, мс
+ANSWER_MAX_LENGTH = 1000  # Question.answer
+INDEX_REBUILD_BATCH = 10000  # сколько эмбеддингов читать из бд за запрос при восстановлении индекса
+
+# Ответы записываются только вопросам IN_PROGRESS: повторная обработка того же вопроса (после падения
+# потребителя или повторной постановки в очередь) не создаст вторую награду
+ANSWER_SQL = """
+UPDATE "question" SET "answer" = "answered"."answer", "status" = 'have_answer', "embedding" = "answered"."embedding"
+FROM unnest($1::BIGINT[], $2::TEXT[], $3::BYTEA[]) AS "answered" ("id", "answer", "embedding")
+WHERE "question"."id" = "answered"."id" AND "question"."status" = 'in_progress'
+RETURNING "question"."id", "question"."user_id"
+"""
+
+
+class AnswerBackend(Protocol):
+    name: str
+
+    async def answer(self, question: str) -> str:
+        ...
+
+
+class HttpAnswerBackend:
+    """
+    Модель за HTTP: POST {"question": ...} -> {"answer": ...}.
+    """
+    name = "http"
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self._client = AsyncClient(timeout=AI_ANSWER_TIMEOUT)
+
+    async def answer(self, question: str) -> str:
+        response = await self._client.post(self.url, json={"question": question})
+        response.raise_for_status()
+        return response.json()["answer"]
+
+
+class OfflineAnswerBackend:
+    """
+    Модель без сети для тестов и бенчмарков: отвечает шаблоном через latency секунд, вопросы из fail
+    завершаются ошибкой.
+    """
+    name = "offline"
+
+    def __init__(self, latency: float = 0, fail: set[str] | None = None) -> None:
+        self.latency = latency
+        self.fail = fail or set()
+
+    async def answer(self, question: str) -> str:
+        if self.latency:
+            await sleep(self.latency)
+
+        if question in self.fail:
+            raise RuntimeError(f"Модель не ответила на {question!r}")
+
+        return f"Ответ на вопрос: {question}"
+
+
+class EmbeddingBackend(Protocol):
+    name: str
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        ...
+
+
+class HttpEmbeddingBackend:
+    """
+    Модель эмбеддингов за HTTP: POST {"texts": [...]} -> {"embeddings": [[...], ...]}, одна пачка за запрос.
+    """
+    name = "http"
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self._client = AsyncClient(timeout=AI_ANSWER_TIMEOUT)
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        response = await self._client.post(self.url, json={"texts": texts})
+        response.raise_for_status()
+        return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+
+class OfflineEmbeddingBackend:
+    """
+    Эмбеддинги без сети для тестов и бенчмарков: хеширование слов и пар слов в dim значений со случайным
+    знаком. Близки только вопросы почти из тех же слов, смысл не учитывается.
+    """
+    name = "offline"
+
+    def __init__(self, dim: int = EMBEDDING_DIM) -> None:
+        self.dim = dim
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.casefold())
+
+            for feature in chain(words, map(" ".join, zip(words, words[1:]))):
+                digest = crc32(feature.encode())
+                vectors[row, digest % self.dim] += 1 if digest & 0x80000000 else -1
+
+        return vectors
+
+
+@dataclass(frozen=True, slots=True)
+class Message:
+    id: bytes  # id сообщения в stream, он же время постановки в очередь в мс
+    question_id: int
+    attempt: int  # номер доставки, с 1
+
+    @property
+    def enqueued_at(self) -> float:
+        return int(self.id.split(b"-")[0]) / 1000
+
+
+async def enqueue(*question_ids: int, stream: str = STREAM) -> bool:
+    """
+    Ставит вопросы в очередь. Ошибки Redis не пробрасываются: вопрос, который не удалось поставить, остается
+    IN_PROGRESS до запуска потребителя (AIQueue.recover), поэтому вызывающий должен его удалить или отметить.
+    :param question_ids: id вопросов
+    :param stream: stream очереди (AIQueue.stream)
+    :return: поставлены ли вопросы в очередь
+    """
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for question_id in question_ids:
+                pipe.xadd(stream, {"id": question_id})
+
+            await pipe.execute()
+    except RedisError:
+        logger.warning("Не удалось поставить вопросы %s в очередь", question_ids, exc_info=True)
+        return False
+
+    return True
+
+
+class AIQueue:
+    """
+    Потребитель очереди вопросов AI. Забирает пачку вопросов из Redis stream (группа потребителей, поэтому
+    потребителей может быть несколько), отвечает не больше concurrency параллельно и записывает ответы,
+    статусы и награды одним UPDATE и одним bulk_create. Неподтвержденные сообщения (ошибка модели, падение
+    потребителя) забираются повторно через retry_delay, после max_attempts доставок вопрос получает статус
+    FAILED, а сообщение переносится в dead_stream.
+
+    С моделью эмбеддингов вопросы пачки сначала ищутся в индексе векторов отвеченных вопросов: вопрос
+    со сходством не меньше duplicate_threshold получает ответ на найденный вопрос без запроса к модели,
+    похожие вопросы внутри пачки - один ответ на всех.
+    """
+
+    def __init__(self, backend: AnswerBackend, batch: int = AI_QUEUE_BATCH, concurrency: int = AI_QUEUE_CONCURRENCY,
+                 retry_delay: float = AI_QUEUE_RETRY_DELAY, max_attempts: int = AI_QUEUE_MAX_ATTEMPTS,
+                 timeout: float = AI_ANSWER_TIMEOUT, consumer: str = broker.WORKER_ID,
+                 embedder: EmbeddingBackend | None = None, index: VectorIndex | None = None,
+                 duplicate_threshold: float = AI_DUPLICATE_THRESHOLD, stream: str = STREAM, group: str = GROUP,
+                 dead_stream: str = DEAD_STREAM) -> None:
+        """
+        :param backend: модель
+        :param batch: сколько вопросов забирать из очереди за раз
+        :param concurrency: сколько вопросов отвечать параллельно
+        :param retry_delay: через сколько неподтвержденное сообщение забирается повторно, сек
+        :param max_attempts: максимальное количество доставок сообщения
+        :param timeout: время ожидания ответа модели, сек
+        :param consumer: имя потребителя в группе
+        :param embedder: модель эмбеддингов, None - без поиска похожих вопросов
+        :param index: индекс векторов отвеченных вопросов (обязателен с embedder)
+        :param duplicate_threshold: косинусное сходство, с которого вопросы считаются одинаковыми
+        :param stream: stream очереди
+        :param group: группа потребителей
+        :param dead_stream: stream вопросов, на которые модель не ответила за max_attempts
+        """
+        self.backend = backend
+        self.embedder = embedder
+        self.index = index if embedder is not None else None
+        self.duplicate_threshold = duplicate_threshold
+        self.batch = batch
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.consumer = consumer
+        self.stream = stream
+        self.group = group
+        self.dead_stream = dead_stream
+        self._semaphore = Semaphore(concurrency)
+        self._task: Task | None = None
+        self.started_at = time()
+        self.batches = self.answered = self.skipped = self.errors = self.dead = 0
+        self.reused = self.coalesced = self.embedding_errors = 0
+        self._answer_times: deque[float] = deque(maxlen=1000)  # время ответа модели, сек
+        self._wait_times: deque[float] = deque(maxlen=1000)  # от постановки в очередь до записи ответа, сек
+
+    async def create_group(self) -> None:
+        try:
+            await redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def recover(self) -> None:
+        """
+        Ставит в очередь вопросы IN_PROGRESS, которых в ней нет (например, Redis был недоступен при создании).
+        Выполняет один потребитель из запущенных одновременно (блокировка в Redis), иначе каждый поставил бы
+        те же вопросы и модель отвечала бы на них несколько раз. Лишняя постановка безопасна: ответ
+        записывается только вопросу IN_PROGRESS.
+        """
+        if not await redis.set(RECOVER_LOCK_KEY.format(self.stream), self.consumer, nx=True, ex=RECOVER_LOCK_TTL):
+            return
+
+        queued = {int(fields[b"id"]) for _, fields in await redis.xrange(self.stream)}
+        lost = [question_id for question_id in
+                await Question.filter(status=QuestionStatus.IN_PROGRESS).values_list("id", flat=True)
+                if question_id not in queued]
+
+        if lost:
+            logger.info("Вопросы %s поставлены в очередь повторно", lost)
+            await enqueue(*lost, stream=self.stream)
+
+    async def _load_index(self) -> None:
+        """
+        Открывает файлы индекса векторов. Если их нет (первый запуск, файлы удалены), индекс восстанавливается
+        из Question.embedding.
+        """
+        await get_running_loop().run_in_executor(None, self.index.load)
+
+        if len(self.index):
+            return
+
+        last_id, size = 0, self.index.dim * 4
+
+        while rows := await Question.filter(id__gt=last_id, embedding__not_isnull=True).order_by("id") \
+                .limit(INDEX_REBUILD_BATCH).values_list("id", "embedding"):
+            last_id = rows[-1][0]
+            rows = [(question_id, embedding) for question_id, embedding in rows if len(embedding) == size]
+
+            if rows:
+                self.index.add([question_id for question_id, _ in rows],
+                               np.stack([unpack(embedding) for _, embedding in rows]))
+
+        await get_running_loop().run_in_executor(None, self.index.flush, True)
+        logger.info("Индекс векторов восстановлен из бд: %s строк", len(self.index))
+
+    def _messages(self, entries: list, attempts: dict[bytes, int] | None = None) -> list[Message]:
+        return [Message(id=message_id, question_id=int(fields[b"id"]), attempt=(attempts or {}).get(message_id, 1))
+                for message_id, fields in entries if fields]
+
+    async def _claim_stale(self) -> list[Message]:
+        """
+        Забирает сообщения, не подтвержденные дольше retry_delay (ошибка модели или падение потребителя).
+        """
+        claimed = (await redis.xautoclaim(self.stream, self.group, self.consumer,
+                                          min_idle_time=int(self.retry_delay * 1000), start_id="0-0",
+                                          count=self.batch))[1]
+
+        deleted = [message_id for message_id, fields in claimed if not fields]
+
+        if deleted:  # Redis 6.2 возвращает удаленные из stream сообщения без полей и оставляет их в pending
+            await redis.xack(self.stream, self.group, *deleted)
+            claimed = [entry for entry in claimed if entry[1]]
+
+        if not claimed:
+            return []
+
+        # В диапазоне могут быть и другие неподтвержденные сообщения потребителя, берем с запасом
+        pending = await redis.xpending_range(self.stream, self.group, min=claimed[0][0], max=claimed[-1][0],
+                                             count=len(claimed) + 10 * self.batch, consumername=self.consumer)
+        attempts = {entry["message_id"]: entry["times_delivered"] for entry in pending}
+
+        return self._messages(claimed, attempts)
+
+    async def _read(self) -> list[Message]:
+        stale = await self._claim_stale()
+
+        if stale:
+            return stale
+
+        response = await redis.xreadgroup(self.group, self.consumer, {self.stream: ">"}, count=self.batch,
+                                          block=BLOCK_MS)
+        return self._messages(response[0][1]) if response else []
+
+    async def _answer(self, text: str) -> str:
+        async with self._semaphore:
+            start = perf_counter()
+            answer = await wait_for(self.backend.answer(text), timeout=self.timeout)
+            self._answer_times.append(perf_counter() - start)
+
+        return answer[:ANSWER_MAX_LENGTH]
+
+    async def _embed(self, texts: list[str]) -> np.ndarray | None:
+        """
+        :return: нормализованные эмбеддинги по строкам или None, если модель эмбеддингов не ответила
+        (вопросы отвечаются моделью без поиска похожих)
+        """
+        try:
+            vectors = normalized(await wait_for(self.embedder.embed(texts), timeout=self.timeout))
+        except Exception:
+            self.embedding_errors += 1
+            logger.warning("Модель эмбеддингов не ответила", exc_info=True)
+            return None
+
+        if vectors.shape != (len(texts), self.index.dim):
+            self.embedding_errors += 1
+            logger.warning("Модель эмбеддингов вернула матрицу %s вместо %s", vectors.shape,
+                           (len(texts), self.index.dim))
+            return None
+
+        return vectors
+
+    async def _find_duplicates(self, question_ids: list[int], vectors: np.ndarray) \
+            -> tuple[dict[int, str], dict[int, int]]:
+        """
+        :param question_ids: id вопросов пачки без повторов
+        :param vectors: их эмбеддинги
+        :return: id вопроса -> ответ на похожий отвеченный вопрос; id вопроса -> id первого похожего вопроса
+        пачки, ответ на который он получит
+        """
+        found_ids, scores = await self.index.search_async(vectors, k=1)
+        similar = {question_id: int(found_id) for question_id, found_id, score
+                   in zip(question_ids, found_ids[:, 0], scores[:, 0]) if score >= self.duplicate_threshold}
+        # Вопрос из индекса мог быть удален
+        answers = dict(await Question.filter(id__in=set(similar.values()), answer__not_isnull=True)
+                       .values_list("id", "answer")) if similar else {}
+        reused = {question_id: answers[found_id] for question_id, found_id in similar.items() if found_id in answers}
+
+        rest = [position for position, question_id in enumerate(question_ids) if question_id not in reused]
+        similarity = vectors[rest] @ vectors[rest].T
+        leaders = {}
+
+        for position in range(1, len(rest)):
+            earlier = np.flatnonzero(similarity[position, :position] >= self.duplicate_threshold)
+
+            if len(earlier):
+                question_id, leader = question_ids[rest[position]], question_ids[rest[earlier[0]]]
+                leader = leaders.get(leader, leader)
+
+                if leader != question_id:
+                    leaders[question_id] = leader
+
+        return reused, leaders
+
+    @staticmethod
+    async def _save(answers: dict[int, str], embeddings: dict[int, bytes]) -> list[tuple[int, int]]:
+        """
+        Записывает ответы, эмбеддинги и статус HAVE_ANSWER вопросам IN_PROGRESS и создает награды, все в одной
+        транзакции.
+        :param answers: id вопроса -> ответ
+        :param embeddings: id вопроса -> эмбеддинг (components.vectors.pack)
+        :return: (id вопроса, id юзера) для записанных ответов
+        """
+        async with in_transaction("api") as connection:
+            if connection.capabilities.dialect == "postgres":
+                rows = await connection.execute_query_dict(ANSWER_SQL, [
+                    list(answers), list(answers.values()), [embeddings.get(question_id) for question_id in answers]])
+                saved = [(row["id"], row["user_id"]) for row in rows]
+            else:
+                saved = []
+
+                for question_id, answer in answers.items():
+                    if await Question.filter(id=question_id, status=QuestionStatus.IN_PROGRESS) \
+                            .update(answer=answer, status=QuestionStatus.HAVE_ANSWER,
+                                    embedding=embeddings.get(question_id)):
+                        saved.append((question_id, await Question.get(id=question_id).values_list("user_id",
+                                                                                                  flat=True)))
+
+            if saved:
+                await Reward.bulk_create([Reward(user_id=user_id, type=RewardType.AI_QUESTION,
+                                                 amount=AI_QUESTION_REWARD) for _, user_id in saved])
+
+        return saved
+
+    async def _dead_letter(self, messages: list[Message], errors: dict[int, str]) -> None:
+        question_ids = [message.question_id for message in messages]
+        await Question.filter(id__in=question_ids, status=QuestionStatus.IN_PROGRESS) \
+            .update(status=QuestionStatus.FAILED)
+
+        async with redis.pipeline(transaction=True) as pipe:
+            for message in messages:
+                pipe.xadd(self.dead_stream, {"id": message.question_id, "attempts": message.attempt,
+                                        "error": errors.get(message.question_id, "")[:500]})
+
+            pipe.xack(self.stream, self.group, *(message.id for message in messages))
+            pipe.xdel(self.stream, *(message.id for message in messages))
+            await pipe.execute()
+
+        self.dead += len(messages)
+        logger.warning("Вопросы %s перенесены в %s", question_ids, self.dead_stream)
+
+        for user_id in set(await Question.filter(id__in=question_ids).values_list("user_id", flat=True)):
+            await invalidate(user_id, "questions")
+
+    async def process(self, messages: list[Message]) -> None:
+        """
+        Обрабатывает пачку сообщений: отвечает на вопросы, записывает результаты, подтверждает сообщения.
+        Сообщения с ошибкой модели не подтверждаются и будут забраны повторно через retry_delay.
+        """
+        self.batches += 1
+        questions = dict(await Question.filter(id__in=[message.question_id for message in messages],
+                                               status=QuestionStatus.IN_PROGRESS).values_list("id", "text"))
+        to_answer = [message for message in messages if message.question_id in questions]
+        # Вопрос может быть в пачке дважды (повторная постановка в очередь), отвечаем на него один раз
+        question_ids = list(dict.fromkeys(message.question_id for message in to_answer))
+        vectors = await self._embed([questions[question_id] for question_id in question_ids]) \
+            if self.index is not None and to_answer else None
+        answers, leaders = await self._find_duplicates(question_ids, vectors) if vectors is not None else ({}, {})
+        self.reused += len(answers)
+        self.coalesced += len(leaders)
+
+        to_ask = [question_id for question_id in question_ids if question_id not in answers and
+                  question_id not in leaders]
+        results = await gather(*(self._answer(questions[question_id]) for question_id in to_ask),
+                               return_exceptions=True)
+
+        errors = {}
+
+        for question_id, result in zip(to_ask, results):
+            if isinstance(result, BaseException):
+                errors[question_id] = repr(result)
+            else:
+                answers[question_id] = result
+
+        for question_id, leader in leaders.items():
+            if leader in answers:
+                answers[question_id] = answers[leader]
+            else:
+                errors[question_id] = errors[leader]
+
+        embeddings = {question_id: pack(vector) for question_id, vector in zip(question_ids, vectors)} \
+            if vectors is not None else {}
+        saved = await self._save(answers, embeddings) if answers else []
+
+        if embeddings and saved:
+            positions = {question_id: position for position, question_id in enumerate(question_ids)}
+            self.index.add([question_id for question_id, _ in saved],
+                           vectors[[positions[question_id] for question_id, _ in saved]])
+
+        done = [message for message in messages if message.question_id not in errors]
+        now = time()
+
+        for message in to_answer:
+            if message.question_id in answers:
+                self._wait_times.append(now - message.enqueued_at)
+
+        self.answered += len(saved)
+        self.skipped += len(messages) - len(to_answer)  # вопрос удален или уже обработан
+        self.errors += len(errors)
+
+        if done:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.xack(self.stream, self.group, *(message.id for message in done))
+                pipe.xdel(self.stream, *(message.id for message in done))
+                await pipe.execute()
+
+        for _, user_id in saved:
+            await invalidate(user_id, "questions", "rewards")
+
+        if errors:
+            logger.warning("Модель не ответила на вопросы %s", errors)
+
+        exhausted = [message for message in messages
+                     if message.question_id in errors and message.attempt >= self.max_attempts]
+
+        if exhausted:
+            await self._dead_letter(exhausted, errors)
+
+    async def run_once(self) -> int:
+        """
+        Забирает и обрабатывает одну пачку.
+        :return: количество сообщений в пачке
+        """
+        messages = await self._read()
+
+        if messages:
+            await self.process(messages)
+
+        return len(messages)
+
+    async def _run_forever(self) -> None:
+        await self.create_group()
+        await self.recover()
+
+        if self.index is not None:
+            await self._load_index()
+            self.index.start()
+
+        while True:
+            try:
+                await self.run_once()
+            except CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка обработки очереди вопросов")
+                await sleep(1)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = create_task(self._run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        if self.index is not None:
+            await self.index.stop()
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Счетчики потребителя с момента запуска и перцентили времени по последним 1000 вопросам.
+        """
+        def percentiles(values: deque[float]) -> dict[str, float | None]:
+            ordered = sorted(values)
+
+            if not ordered:
+                return {"p50_ms": None, "p95_ms": None, "max_ms": None}
+
+            return {"p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+                    "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 1),
+                    "max_ms": round(ordered[-1] * 1000, 1)}
+
+        uptime = time() - self.started_at
+
+        return {
+            "consumer": self.consumer,
+            "backend": self.backend.name,
+            "batches": self.batches,
+            "answered": self.answered,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "dead": self.dead,
+            "reused": self.reused,
+            "coalesced": self.coalesced,
+            "embedding_errors": self.embedding_errors,
+            "index": self.index.stats() if self.index is not None else None,
+            "answered_per_min": round(self.answered / uptime * 60, 2) if uptime else None,
+            "answer_latency": percentiles(self._answer_times),
+            "queue_latency": percentiles(self._wait_times),
+        }
+
+
+async def queue_stats() -> dict[str, Any]:
+    """
+    Состояние очереди в Redis, общее для всех потребителей.
+    """
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            length, dead = await pipe.xlen(STREAM).xlen(DEAD_STREAM).execute()
+
+        pending = (await redis.xpending(STREAM, GROUP))["pending"] if length else 0
+    except ResponseError:  # группы еще нет
+        return {"length": 0, "pending": 0, "dead": 0}
+    except RedisError:
+        logger.warning("Не удалось прочитать состояние очереди вопросов", exc_info=True)
+        return {"length": None, "pending": None, "dead": None}
+
+    return {"length": length, "pending": pending, "dead": dead}
+
+
+ai_queue: AIQueue | None = AIQueue(
+    HttpAnswerBackend(AI_BACKEND_URL),
+    embedder=HttpEmbeddingBackend(AI_EMBEDDING_URL) if AI_EMBEDDING_URL else None,
+    index=VectorIndex(VECTOR_INDEX_PATH, EMBEDDING_DIM) if AI_EMBEDDING_URL else None) if AI_BACKEND_URL else None
+
+
+async def main() -> None:
+    if ai_queue is None:
+        raise SystemExit("Не задан AI_BACKEND_URL.")
+
+    await Tortoise.init(config=TORTOISE_CONFIG)
+    await init_cache()
+
+    try:
+        await ai_queue._run_forever()
+    finally:
+        await ai_queue.stop()  # дописываем новые векторы в файлы индекса
+        await Tortoise.close_connections()
+
+
+# Отдельный процесс-потребитель (можно запустить несколько): python -m components.ai_queue
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run(main())
@@ -0,0 +1,119 @@
+import logging
+import os
+import re
+from asyncio import to_thread
+from hashlib import sha256
+from pathlib import Path
+from redis.exceptions import RedisError
+from tortoise import connections
+from components.redis_db import redis
+from config import AVATARS_DIR
+from models import User
+
+logger = logging.getLogger(__name__)
+
+MIGRATE_CHUNK = 500  # сколько аватаров переносить из бд в хранилище за раз
+
+# Имя файла в хранилище = sha256 содержимого + расширение по сигнатуре формата
+AVATAR_NAME_RE = re.compile(r"^[0-9a-f]{64}\.(jpg|png|gif|webp|bin)$")
+
+_SIGNATURES = ((b"\xff\xd8\xff", "jpg"), (b"\x89PNG\r\n\x1a\n", "png"), (b"GIF8", "gif"))
+
+
+def _extension(data: bytes) -> str:
+    for signature, extension in _SIGNATURES:
+        if data.startswith(signature):
+            return extension
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+
+    return "bin"
+
+
+def avatar_path(name: str) -> Path | None:
+    """
+    Путь к файлу аватара в хранилище или None, если имя некорректно.
+    :param name: имя аватара (User.avatar_hash)
+    """
+    return Path(AVATARS_DIR, name) if AVATAR_NAME_RE.match(name) else None
+
+
+def _write(data: bytes) -> str:
+    name = f"{sha256(data).hexdigest()}.{_extension(data)}"
+    path = Path(AVATARS_DIR, name)
+
+    if not path.exists():  # одинаковые аватары хранятся одним файлом
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)  # атомарно, читатели не увидят недописанный файл
+
+    return name
+
+
+async def save_avatar(data: bytes) -> str:
+    """
+    Сохраняет аватар в хранилище (content-addressed).
+    :param data: содержимое картинки
+    :return: имя аватара для User.avatar_hash
+    """
+    return await to_thread(_write, data)
+
+
+async def _detach(user_id: int, data: bytes, name: str) -> None:
+    connection = connections.get("api")
+
+    if connection.capabilities.dialect == "postgres":
+        # Условие на avatar защищает от затирания, если бот успел записать новый аватар
+        await connection.execute_query(
+            'UPDATE "user" SET "avatar_hash" = $1, "avatar" = NULL WHERE "id" = $2 AND "avatar" = $3',
+            [name, user_id, data])
+    else:
+        await User.filter(id=user_id).update(avatar_hash=name, avatar=None)
+
+
+async def move_avatars(*user_ids: int) -> dict[int, str]:
+    """
+    Переносит аватары из колонки User.avatar (туда их пишет бот) в хранилище и очищает колонку.
+    :param user_ids: chat_id юзеров, по умолчанию все юзеры с аватаром в бд
+    :return: chat_id -> имя аватара
+    """
+    moved = {}
+    last_user_id = 0
+
+    while True:
+        query = User.filter(avatar__isnull=False, id__gt=last_user_id)
+
+        if user_ids:
+            query = query.filter(id__in=user_ids)
+
+        rows = await query.order_by("id").limit(MIGRATE_CHUNK).values_list("id", "avatar")
+
+        if not rows:
+            return moved
+
+        for user_id, data in rows:
+            name = await save_avatar(data)
+            await _detach(user_id, data, name)
+            moved[user_id] = name
+
+        last_user_id = rows[-1][0]
+        logger.info("Аватары перенесены в хранилище: %s", len(moved))
+
+
+async def move_all_avatars() -> None:
+    """
+    Переносит в хранилище все аватары из бд. Выполняется одним воркером (блокировка в Redis).
+    """
+    try:
+        if not await redis.set("avatars:move", 1, nx=True, ex=3600):
+            return
+    except RedisError:
+        logger.warning("Перенос аватаров пропущен: Redis недоступен", exc_info=True)
+        return
+
+    try:
+        await move_avatars()
+    finally:
+        await redis.delete("avatars:move")
@@ -0,0 +1,89 @@
+import logging
+from asyncio import Task, create_task, sleep, CancelledError
+from inspect import isawaitable
+from typing import Callable, Any
+from uuid import uuid4
+from redis.exceptions import RedisError
+from components.redis_db import redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "events:"
+WORKER_ID = uuid4().hex  # уникальный id процесса, чтобы не обрабатывать собственные сообщения
+
+_handlers: dict[str, list[Callable[[str], Any]]] = {}
+_listener: Task | None = None
+
+
+def subscribe(channel: str, handler: Callable[[str], Any]) -> None:
+    """
+    Регистрирует обработчик событий канала. Обработчик вызывается в каждом воркере, кроме отправителя
+    (отправитель должен сам применить изменение локально).
+    :param channel: название канала без префикса
+    :param handler: функция или корутина, принимающая payload сообщения
+    """
+    _handlers.setdefault(channel, []).append(handler)
+
+
+async def publish(channel: str, payload: str = "") -> None:
+    """
+    Рассылает событие всем воркерам через Redis pub/sub. Ошибки Redis не пробрасываются.
+    :param channel: название канала без префикса
+    :param payload: данные события
+    """
+    try:
+        await redis.publish(CHANNEL_PREFIX + channel, f"{WORKER_ID}:{payload}")
+    except RedisError:
+        logger.warning("Не удалось отправить событие в канал %s", channel, exc_info=True)
+
+
+def _dispatch(message: dict) -> None:
+    channel = message["channel"].decode()[len(CHANNEL_PREFIX):]
+    sender, _, payload = message["data"].decode().partition(":")
+
+    if sender == WORKER_ID:
+        return
+
+    for handler in _handlers.get(channel, ()):
+        try:
+            result = handler(payload)
+
+            if isawaitable(result):
+                create_task(result)
+        except Exception:
+            logger.exception("Ошибка обработчика события %s", channel)
+
+
+async def _listen() -> None:
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        _dispatch(message)
+
+        except CancelledError:
+            raise
+        except Exception:
+            logger.warning("Соединение pub/sub потеряно, переподключение", exc_info=True)
+            await sleep(1)
+
+
+def start_listener() -> None:
+    """
+    Запускает фоновое прослушивание событий в текущем воркере.
+    """
+    global _listener
+
+    if _listener is None:
+        _listener = create_task(_listen())
+
+
+async def stop_listener() -> None:
+    global _listener
+
+    if _listener is not None:
+        _listener.cancel()
+        _listener = None
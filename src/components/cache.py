@@ -0,0 +1,131 @@
+import logging
+from functools import wraps
+from hashlib import md5
+from typing import Any, Callable
+from aiogram.utils.web_app import WebAppInitData
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
+from redis.asyncio import from_url
+from starlette.requests import Request
+from starlette.responses import Response
+from components.cache_backend import TwoTierBackend
+from components.coders import ResponseCoder, UJsonCoder
+from config import REDIS_URL, CACHE_L1_SIZE, CACHE_L1_MAX_BYTES, CACHE_L1_TTL
+from models import User
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_PARAM = "__fastapi_cache_response"  # параметр Response, который @cache добавляет в сигнатуру эндпойнта
+
+# Реестр тегов: тег (namespace кеша) -> функции эндпойнтов, закешированных под этим тегом
+_tags: dict[str, set[str]] = {}
+
+
+async def init_cache(enable: bool = True) -> None:
+    """
+    Функция инициализации кеша.
+    """
+    redis = await from_url(REDIS_URL, db=10, encoding="utf-8", decode_responses=False)
+    backend = TwoTierBackend(RedisBackend(redis), maxsize=CACHE_L1_SIZE, maxbytes=CACHE_L1_MAX_BYTES,
+                             l1_ttl=CACHE_L1_TTL)
+    FastAPICache.init(backend=backend, prefix="fastapi-cache", coder=UJsonCoder, enable=enable)
+
+
+def _func_name(func: Callable) -> str:
+    return f"{func.__module__}:{func.__name__}"
+
+
+def _chat_id(kwargs: dict[str, Any]) -> int | None:
+    for value in kwargs.values():
+        if isinstance(value, WebAppInitData):
+            return value.user.id
+
+        if isinstance(value, User):
+            return value.id
+
+    return None
+
+
+def user_key_builder(func: Callable, namespace: str = "", *, request: Request | None = None,
+                     response: Response | None = None, args: tuple = (), kwargs: dict[str, Any]) -> str:
+    """
+    Ключ кеша {prefix}:{тег}:{chat_id}:{функция}[:{хеш остальных параметров}]. В отличие от ключа по умолчанию
+    не зависит от init data (она меняется при каждом открытии приложения) и позволяет удалить записи юзера.
+    """
+    chat_id = _chat_id(kwargs)
+    key = f"{namespace}:{chat_id}:{_func_name(func)}"
+    other = {name: value for name, value in kwargs.items() if not isinstance(value, (WebAppInitData, User))}
+
+    if other or args:
+        key += ":" + md5(f"{args}:{sorted(other.items())}".encode()).hexdigest()
+
+    return key
+
+
+def user_cache(tag: str, expire: int) -> Callable:
+    """
+    Декоратор @cache с ключом по юзеру и тегом для инвалидации (invalidate). Эндпойнт должен принимать
+    init_data или user. Параметры, кроме юзера, входят в ключ хешем, такие записи invalidate не удаляет.
+    :param tag: тег (namespace) записей, например "profile"
+    :param expire: время жизни записи, сек
+    """
+    def wrapper(func: Callable) -> Callable:
+        _tags.setdefault(tag, set()).add(_func_name(func))
+        cached = cache(expire=expire, namespace=tag, coder=ResponseCoder, key_builder=user_key_builder)(func)
+
+        @wraps(cached)
+        async def endpoint(*args: Any, **kwargs: Any) -> Any:
+            result = await cached(*args, **kwargs)
+            response = result if isinstance(result, Response) else kwargs.get(RESPONSE_PARAM)
+
+            # Запись на сервере удаляется при изменениях, а браузер не знает об этом, поэтому вместо
+            # max-age={expire} от @cache он должен перепроверять ответ при каждом запросе
+            if response is not None:
+                response.headers["Cache-Control"] = "private, no-cache"
+
+            return result
+
+        return endpoint
+
+    return wrapper
+
+
+async def invalidate(chat_id: int, *tags: str) -> None:
+    """
+    Удаляет закешированные ответы юзера по тегам. Ошибки бэкенда не пробрасываются.
+    :param chat_id: chat_id юзера
+    :param tags: теги из user_cache
+    """
+    if not FastAPICache.get_enable():
+        return
+
+    backend = FastAPICache.get_backend()
+    prefix = FastAPICache.get_prefix()
+
+    for tag in tags:
+        for func_name in _tags.get(tag, ()):
+            try:
+                await backend.clear(key=f"{prefix}:{tag}:{chat_id}:{func_name}")
+            except Exception:
+                logger.warning("Не удалось удалить кеш %s юзера %s", tag, chat_id, exc_info=True)
+
+
+async def invalidate_all(*tags: str) -> None:
+    """
+    Удаляет закешированные ответы всех юзеров по тегам (перебор ключей в Redis через SCAN, только для редких
+    изменений, общих для всех юзеров). Ошибки бэкенда не пробрасываются.
+    :param tags: теги из user_cache
+    """
+    if not FastAPICache.get_enable():
+        return
+
+    backend = FastAPICache.get_backend()
+    prefix = FastAPICache.get_prefix()
+
+    for tag in tags:
+        try:
+            await backend.clear(namespace=f"{prefix}:{tag}")
+        except Exception:
+            logger.warning("Не удалось удалить кеш %s", tag, exc_info=True)
+
@@ -0,0 +1,123 @@
+import logging
+from math import ceil
+from typing import Any
+from fastapi_cache.backends import Backend
+from fastapi_cache.backends.redis import RedisBackend
+from redis.exceptions import RedisError
+from components import broker
+from components.lru import BytesTTLCache
+
+logger = logging.getLogger(__name__)
+
+SCAN_COUNT = 1000  # сколько ключей Redis перебирать за одну команду SCAN при удалении по namespace
+
+
+class TwoTierBackend(Backend):
+    """
+    Бэкенд fastapi-cache из двух уровней: L1 - LRU в памяти воркера, L2 - Redis, общий для всех воркеров.
+    Чтение сначала из L1 (без сетевых запросов), при промахе из Redis с сохранением в L1. Удаление записей
+    рассылается остальным воркерам через broker, чтобы они убрали свои копии из L1. Если событие потеряно
+    (переподключение pub/sub), копия в L1 живет не дольше l1_ttl.
+    """
+    channel = "cache"
+
+    def __init__(self, remote: RedisBackend, maxsize: int, maxbytes: int, l1_ttl: float) -> None:
+        """
+        :param remote: бэкенд Redis (L2)
+        :param maxsize: максимальное количество записей в L1
+        :param maxbytes: максимальный размер L1 в байтах
+        :param l1_ttl: максимальное время жизни записи в L1, сек
+        """
+        self.remote = remote
+        self.local = BytesTTLCache(maxsize=maxsize, maxbytes=maxbytes)
+        self.l1_ttl = l1_ttl
+        self.remote_hits = self.remote_misses = 0
+        broker.subscribe(self.channel, self._on_cleared)
+
+    async def get_with_ttl(self, key: str) -> tuple[int, bytes | None]:
+        ttl, value = self.local.get_with_ttl(key)
+
+        if value is not None:
+            return ceil(ttl), value
+
+        ttl, value = await self.remote.get_with_ttl(key)
+
+        if value is None:
+            self.remote_misses += 1
+        else:
+            self.remote_hits += 1
+            self._remember(key, value, ttl)
+
+        return ttl, value
+
+    async def get(self, key: str) -> bytes | None:
+        return (await self.get_with_ttl(key))[1]
+
+    async def set(self, key: str, value: bytes, expire: int | None = None) -> None:
+        await self.remote.set(key, value, expire)
+        self._remember(key, value, expire)
+
+    async def _clear_namespace(self, namespace: str) -> int:
+        """
+        Удаляет записи namespace из Redis перебором SCAN частями по SCAN_COUNT (RedisBackend.clear выполняет
+        KEYS по всей базе и блокирует Redis на время перебора).
+        """
+        cleared, keys = 0, []
+
+        async for key in self.remote.redis.scan_iter(match=f"{namespace}:*", count=SCAN_COUNT):
+            keys.append(key)
+
+            if len(keys) >= SCAN_COUNT:
+                cleared += await self.remote.redis.unlink(*keys)
+                keys.clear()
+
+        if keys:
+            cleared += await self.remote.redis.unlink(*keys)
+
+        return cleared
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        # Сначала Redis, иначе воркер, получивший событие, успел бы снова прочитать оттуда старую запись
+        if namespace:
+            cleared = await self._clear_namespace(namespace)
+            self.local.pop_prefix(f"{namespace}:")
+            await broker.publish(self.channel, f"{namespace}:*")
+        elif key:
+            cleared = await self.remote.clear(key=key)
+            self.local.pop(key)
+            await broker.publish(self.channel, key)
+        else:
+            cleared = 0
+
+        return cleared
+
+    def _remember(self, key: str, value: bytes, ttl: int | None) -> None:
+        # ttl Redis: -1 - без срока, -2 - ключа уже нет
+        self.local.set(key, value, self.l1_ttl if ttl is None or ttl == -1 else min(ttl, self.l1_ttl))
+
+    def _on_cleared(self, payload: str) -> None:
+        if payload.endswith(":*"):
+            self.local.pop_prefix(payload[:-1])
+        else:
+            self.local.pop(payload)
+
+    async def stats(self) -> dict[str, Any]:
+        """
+        Счетчики уровней кеша. Для L1 - с запуска воркера, для L2 попадания и промахи воркера,
+        а вытеснения и истечения - по всему серверу Redis.
+        """
+        local = self.local
+        remote = {"hits": self.remote_hits, "misses": self.remote_misses, "evictions": None, "expired": None}
+
+        try:
+            info = await self.remote.redis.info("stats")
+            remote["evictions"], remote["expired"] = info["evicted_keys"], info["expired_keys"]
+        except RedisError:
+            logger.warning("Не удалось получить статистику Redis", exc_info=True)
+
+        return {
+            "worker": broker.WORKER_ID,
+            "l1": {"hits": local.hits, "misses": local.misses, "evictions": local.evictions,
+                   "entries": len(local), "bytes": local.size, "max_bytes": local.maxbytes},
+            "l2": remote,
+        }
@@ -0,0 +1,101 @@
+from datetime import datetime
+from math import floor
+from pytz import timezone
+from tortoise import connections, Model
+from tortoise.transactions import in_transaction
+from components import accumulator
+from components.leaderboard import leaderboard
+from components.ranks import ranks
+from components.tools import current_energy, credit_stats
+from config import ATOMIC_SYNC_CLICKS, CLICKS_WRITE_BEHIND
+from models import User, Activity
+
+# Регенерация энергии, обрезка добычи энергией и начисление монет одним запросом.
+# Параметры ранга передаются из реестра рангов: $3 - press_force, $4 - energy_per_sec, $5 - max_energy.
+# Строки stats и activity блокируются FOR UPDATE, чтобы параллельные синхронизации не тратили одну энергию дважды.
+# Если энергии не хватает даже на один клик, ничего не пишется и запрос не возвращает строк.
+SYNC_CLICKS_SQL = """
+WITH cur AS (
+    SELECT s.id AS stats_id, a.id AS activity_id, $3::float8 AS press_force,
+           LEAST(s.energy + GREATEST(EXTRACT(EPOCH FROM (now() - a.last_sync_energy)), 0) * $4::float8,
+                 $5::float8) AS energy
+    FROM "stats" s
+    JOIN "activity" a ON a.user_id = s.user_id
+    WHERE s.user_id = $1
+    FOR UPDATE OF s, a
+), calc AS (
+    SELECT cur.*, LEAST($2 * cur.press_force, FLOOR(cur.energy / cur.press_force) * cur.press_force) AS extraction
+    FROM cur
+    WHERE cur.energy >= cur.press_force
+), upd_activity AS (
+    UPDATE "activity" a SET last_sync_energy = now() FROM calc WHERE a.id = calc.activity_id
+)
+UPDATE "stats" s
+SET energy = calc.energy - calc.extraction,
+    coins = s.coins + FLOOR(calc.extraction)::bigint,
+    earned_week_coins = s.earned_week_coins + FLOOR(calc.extraction)::bigint
+FROM calc
+WHERE s.id = calc.stats_id
+RETURNING FLOOR(calc.extraction)::bigint AS extraction
+"""
+
+
+def atomic_mode_available() -> bool:
+    return (ATOMIC_SYNC_CLICKS and not CLICKS_WRITE_BEHIND
+            and connections.get("api").capabilities.dialect == "postgres")
+
+
+async def extract_clicks(user: User, clicks: int) -> int | None:
+    """
+    Синхронизирует энергию и начисляет монеты за клики, добыча обрезается доступной энергией.
+    :param user: объект модели User с activity (stats подгружается, если его нет и он нужен режиму)
+    :param clicks: количество кликов
+    :return: добыча в монетах или None, если энергии не хватает даже на один клик
+    """
+    if CLICKS_WRITE_BEHIND:
+        await _fetch_missing(user, "stats")
+        return await accumulator.apply_clicks(user, clicks)
+
+    rank = ranks[user.rank_id]
+
+    if atomic_mode_available():
+        # Номер пересборки лидерборда читается до коммита, пока строка stats заблокирована (leaderboard.generation)
+        async with in_transaction("api") as connection:
+            rows = await connection.execute_query_dict(
+                SYNC_CLICKS_SQL, [user.id, clicks, rank.press_force, rank.energy_per_sec, rank.max_energy])
+
+            if not rows:
+                return None
+
+            generation = await leaderboard.generation(user.id) if rows[0]["extraction"] else None
+
+        await leaderboard.add(user.id, rows[0]["extraction"], generation)
+        return rows[0]["extraction"]
+
+    await _fetch_missing(user, "stats")
+
+    now = datetime.now(tz=timezone("Europe/Moscow"))
+    energy = current_energy(user, now)
+
+    if energy < rank.press_force:
+        return None
+
+    extraction = clicks * rank.press_force
+
+    if extraction > energy:  # Обрезаем энергию под количество доступных кликов ^^
+        extraction = floor(energy / rank.press_force) * rank.press_force
+
+    user.stats.energy = energy - extraction
+    user.activity.last_sync_energy = now
+
+    await credit_stats(user.id, coins=int(extraction), energy=user.stats.energy)
+    await Activity.filter(id=user.activity.id).update(last_sync_energy=now)
+
+    return int(extraction)
+
+
+async def _fetch_missing(user: User, *relations: str) -> None:
+    missing = [relation for relation in relations if not isinstance(getattr(user, relation), Model)]
+
+    if missing:
+        await user.fetch_related(*missing)
@@ -1,6 +1,7 @@
 from typing import Any
 from fastapi.encoders import jsonable_encoder
 from fastapi_cache import Coder
+from starlette.responses import Response
 from ujson import dumps, loads
 
 
@@ -12,3 +13,29 @@ class UJsonCoder(Coder):
     @classmethod
     def decode(cls, value: bytes) -> Any:
         return loads(value)
+
+
+class ResponseCoder(UJsonCoder):
+    """
+    Кодер для эндпойнтов, возвращающих Response: хранит готовое тело со статусом и content-type
+    ("{статус} {content-type}\\n{тело}"), при попадании тело отдается как есть, без декодирования json.
+    Остальные значения кодируются как в UJsonCoder.
+    """
+    marker = b"\x00"  # json не может начинаться с нулевого байта
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        if isinstance(value, Response):
+            return b"%s%d %s\n%s" % (cls.marker, value.status_code, (value.media_type or "").encode(), value.body)
+
+        return super().encode(value)
+
+    @classmethod
+    def decode_as_type(cls, value: bytes, *, type_: Any) -> Any:
+        if value.startswith(cls.marker):
+            head, _, body = value.partition(b"\n")
+            status_code, _, media_type = head[len(cls.marker):].decode().partition(" ")
+            # Response не сериализует bytes повторно (render возвращает их как есть)
+            return Response(content=body, status_code=int(status_code), media_type=media_type or None)
+
+        return super().decode_as_type(value, type_=type_)
@@ -0,0 +1,151 @@
+import logging
+import pickle
+from asyncio import get_running_loop
+from collections import Counter
+from unicodedata import normalize as unicode_normalize, combining
+import pycountry
+from babel import localedata
+from config import COUNTRY_MATCH_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_LENGTH = 100  # длиннее названий стран не бывает, дальше текст не сравнивается
+
+# Языки, названия на которых выигрывают при совпадении названий разных стран (остальные - по алфавиту)
+PREFERRED_LOCALES = ("en", "ru")
+
+# Распространенные названия, которых нет ни в Babel, ни в pycountry
+ALIASES = {
+    "uk": "GB", "england": "GB", "scotland": "GB", "wales": "GB", "great britain": "GB", "britain": "GB",
+    "america": "US", "usa": "US", "united states of america": "US", "сша": "US", "америка": "US",
+    "англия": "GB", "великобритания": "GB", "рф": "RU", "uae": "AE", "оаэ": "AE", "holland": "NL",
+    "голландия": "NL", "korea": "KR", "корея": "KR",
+}
+
+
+def normalize(name: str) -> str:
+    """
+    Ключ индекса: регистр и диакритика убраны (é -> e, ё -> е), знаки препинания заменены пробелами.
+    """
+    name = unicode_normalize("NFKD", name[:MAX_QUERY_LENGTH].casefold())
+    name = "".join(char if char.isalnum() else " " for char in name if not combining(char))
+    return " ".join(name.split())
+
+
+def trigrams(name: str) -> set[str]:
+    padded = f" {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CountryResolver:
+    """
+    Поиск страны по названию на любом языке без сетевых запросов. Индекс нормализованное название -> alpha-2
+    строится один раз на процесс из локализованных названий Babel (все языки), названий и кодов pycountry
+    и ALIASES. Точное совпадение - поиск в словаре, для опечаток - поиск по триграммам (сходство Жаккара
+    не меньше COUNTRY_MATCH_THRESHOLD).
+    """
+
+    def __init__(self) -> None:
+        self._index: dict[str, str] = {}
+        self._names: list[str] = []  # названия для поиска по триграммам, позиция = id в _postings
+        self._sizes: list[int] = []  # количество триграмм названия
+        self._postings: dict[str, list[int]] = {}  # триграмма -> id названий
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._index)
+
+    @staticmethod
+    def _territories(identifier: str) -> dict[str, str]:
+        """
+        Названия территорий из файла данных языка без наследуемых (их дает родительский язык, он тоже в списке).
+        Файл читается напрямую, а не через localedata.load: данные нужны только для индекса и не остаются
+        в кеше Babel (~100 Мб на все языки).
+        """
+        with open(localedata.resolve_locale_filename(identifier), "rb") as file:
+            return pickle.load(file).get("territories", {})
+
+    def _names_by_priority(self):
+        codes = {country.alpha_2 for country in pycountry.countries}
+
+        for country in pycountry.countries:
+            for attr in ("name", "common_name", "official_name", "alpha_2", "alpha_3"):
+                if name := getattr(country, attr, None):
+                    yield name, country.alpha_2
+
+        for name, code in ALIASES.items():
+            yield name, code
+
+        identifiers = sorted(identifier for identifier in localedata.locale_identifiers() if "_" not in identifier)
+        identifiers.sort(key=lambda identifier: identifier not in PREFERRED_LOCALES)
+
+        for identifier in identifiers:
+            for code, name in self._territories(identifier).items():
+                if code in codes:
+                    yield name, code
+
+    def load(self) -> None:
+        """
+        Строит индекс (~2 сек CPU, поэтому при старте выполняется в пуле потоков через load_async).
+        """
+        index: dict[str, str] = {}
+
+        for name, code in self._names_by_priority():
+            if key := normalize(name):
+                index.setdefault(key, code)
+
+        names = [name for name in index if len(name) > 3]  # коды и короткие названия ищутся только точно
+        sizes, postings = [], {}
+
+        for position, name in enumerate(names):
+            grams = trigrams(name)
+            sizes.append(len(grams))
+
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+
+        self._index, self._names, self._sizes, self._postings = index, names, sizes, postings
+        logger.info("Индекс стран: %s названий", len(index))
+
+    async def load_async(self) -> None:
+        await get_running_loop().run_in_executor(None, self.load)
+
+    def resolve(self, name: str) -> str | None:
+        """
+        :param name: название страны на любом языке, с опечатками
+        :return: alpha-2 код страны или None, если похожего названия нет
+        """
+        if not self.loaded:
+            self.load()
+
+        key = normalize(name)
+
+        if not key:
+            return None
+
+        code = self._index.get(key)
+
+        if code is not None:
+            return code
+
+        grams = trigrams(key)
+        shared = Counter()
+
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+
+        best, best_score = None, 0.0
+
+        for position, count in shared.items():
+            score = count / (len(grams) + self._sizes[position] - count)
+
+            if score > best_score:
+                best, best_score = position, score
+
+        if best is None or best_score < COUNTRY_MATCH_THRESHOLD:
+            return None
+
+        return self._index[self._names[best]]
+
+
+countries = CountryResolver()
@@ -0,0 +1,134 @@
+import logging
+from datetime import datetime, date, time, timedelta
+from typing import Any
+from pytz import timezone
+from redis.exceptions import RedisError
+from components.cache import invalidate
+from components.redis_db import redis
+from config import LAUNCHES_SERIES_REWARDS
+from models import User, Reward, RewardType, Activity
+
+logger = logging.getLogger(__name__)
+
+MOSCOW = timezone("Europe/Moscow")
+
+
+class DailyGate:
+    """
+    Отметка "юзер уже заходил сегодня" (сутки по Москве). Первый запрос дня ставит в Redis ключ SET NX,
+    истекающий в ближайшую полночь, остальные запросы дня (в том числе параллельные и в других воркерах)
+    пропускают обработку входа. Локальное множество воркера отсекает повторы без обращения к Redis
+    и заменяет Redis, если тот недоступен.
+    """
+    key = "daily:{}:{}"  # день, chat_id
+
+    def __init__(self) -> None:
+        self._day: date | None = None
+        self._local: set[int] = set()
+
+    def _local_for(self, today: date) -> set[int]:
+        if self._day != today:  # наступили новые сутки, вчерашние отметки больше не нужны
+            self._day = today
+            self._local = set()
+
+        return self._local
+
+    async def acquire(self, user_id: int, now: datetime) -> bool:
+        """
+        Ставит отметку дня для юзера.
+        :param user_id: chat_id юзера
+        :param now: текущее время по Москве
+        :return: True, если это первый запрос юзера за сутки
+        """
+        local = self._local_for(now.date())
+
+        if user_id in local:
+            return False
+
+        local.add(user_id)
+        midnight = MOSCOW.localize(datetime.combine(now.date() + timedelta(days=1), time.min))
+
+        try:
+            return bool(await redis.set(self.key.format(now.date().isoformat(), user_id), 1, nx=True,
+                                        ex=max(int((midnight - now).total_seconds()), 1)))
+        except RedisError:
+            logger.warning("Отметка входа без Redis, chat_id %s", user_id, exc_info=True)
+            return True
+
+    async def release(self, user_id: int, now: datetime) -> None:
+        """
+        Снимает отметку дня (если обработка входа не записалась в бд).
+        """
+        self._local_for(now.date()).discard(user_id)
+
+        try:
+            await redis.delete(self.key.format(now.date().isoformat(), user_id))
+        except RedisError:
+            logger.warning("Не удалось снять отметку входа, chat_id %s", user_id, exc_info=True)
+
+
+daily_gate = DailyGate()
+
+
+def _as_date(value: date | datetime) -> date:
+    # У только что созданной Activity в памяти лежат datetime из default, из бд приходят date
+    return value.date() if isinstance(value, datetime) else value
+
+
+async def get_daily_reward(user: User) -> Reward | None:
+    """
+    Функция для получения награды за серию авторизаций в игре. Меняет activity и создает награду только
+    при первом запросе юзера за сутки (по Москве), остальные запросы дня не обращаются к бд.
+    :param user: User авторизовавшегося юзера с "activity"
+    :return: созданная награда за серию или None
+    """
+    return await daily_login(user.id, user.activity)
+
+
+async def daily_login(user_id: int, activity: Any) -> Reward | None:
+    """
+    Обработка входа юзера за сутки (см. get_daily_reward).
+    :param user_id: chat_id юзера
+    :param activity: Activity юзера или другой объект с полями last_login_date, last_daily_reward, active_days,
+    поля меняются на месте
+    :return: созданная награда за серию или None
+    """
+    now = datetime.now(tz=MOSCOW)
+    today = now.date()
+
+    if not await daily_gate.acquire(user_id, now):
+        return None
+
+    last_login_date = _as_date(activity.last_login_date)
+    fields = ["last_login_date"]
+    reward = None
+
+    if _as_date(activity.last_daily_reward) == today - timedelta(days=1):  # награда за вход на следующий день
+        activity.active_days += 1
+        activity.last_daily_reward = today
+        fields += ["active_days", "last_daily_reward"]
+
+        amount, inspirations, replenishments = \
+            LAUNCHES_SERIES_REWARDS[min(activity.active_days, len(LAUNCHES_SERIES_REWARDS)) - 1]
+        reward = Reward(type=RewardType.LAUNCHES_SERIES, user_id=user_id, amount=amount,
+                        inspirations=inspirations, replenishments=replenishments)
+
+    elif last_login_date <= today - timedelta(days=2):  # пропущены сутки, серия сбрасывается
+        activity.active_days = 0
+        activity.last_daily_reward = today
+        fields += ["active_days", "last_daily_reward"]
+
+    activity.last_login_date = today
+
+    try:
+        # Пишем только поля серии, чтобы не перезаписать last_sync_energy параллельной синхронизации кликов
+        await Activity.filter(user_id=user_id).update(**{field: getattr(activity, field) for field in fields})
+
+        if reward is not None:
+            await reward.save()
+            await invalidate(user_id, "rewards")
+    except Exception:
+        await daily_gate.release(user_id, now)
+        raise
+
+    return reward
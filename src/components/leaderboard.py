@@ -0,0 +1,286 @@
+import logging
+from asyncio import Task, create_task, sleep, CancelledError
+from time import monotonic
+from uuid import uuid4
+from redis.exceptions import RedisError
+from tortoise import BaseDBAsyncClient
+from tortoise.signals import post_delete
+from tortoise.transactions import in_transaction
+from components.redis_db import redis
+from config import LEADERBOARD_REBUILD_PERIOD
+from models import Stats, User
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK = 10000  # сколько строк stats читать из бд и добавлять в Redis за раз при пересборке
+LOCK_TTL = 300  # максимальное время пересборки, сек
+
+# Снятие блокировки только ее владельцем (блокировка могла истечь и достаться другому воркеру)
+# KEYS: [1] ключ блокировки; ARGV: [1] токен владельца
+UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Строки пересборки блокируются до записи курсора в Redis: начисление, которое ждет блокировку, видит курсор
+# уже за своей строкой, а пересборка, которая ждет незакоммиченное начисление, читает строку вместе с ним.
+# Строки с нулем не отфильтровываются в запросе: их блокировка тоже нужна.
+REBUILD_CHUNK_SQL = """
+SELECT "user_id", "earned_week_coins" FROM "stats" WHERE "user_id" > $1 ORDER BY "user_id" LIMIT $2 FOR SHARE
+"""
+
+# Начисление недельных монет после коммита в бд. ARGV[3] - номер первой пересборки, снимок бд которой включает
+# начисление (Leaderboard.generation): в лидерборд, собранный ей или более поздней, и в ее delta начисление
+# не добавляется. Пустой ARGV[3] (номер неизвестен) - в delta, если пересборка уже прочитала строку юзера.
+# Без ARGV[3] тот же фрагмент повторяет accumulator.CLICK_SCRIPT (клики пишутся в бд после Redis).
+# KEYS: [1] лидерборд, [2] курсор пересборки, [3] delta, [4] номер последней начатой пересборки,
+#       [5] номер пересборки, собравшей лидерборд; ARGV: [1] монеты, [2] chat_id, [3] номер пересборки
+ADD_SCRIPT = """
+local included = tonumber(ARGV[3])
+if not included or tonumber(redis.call('GET', KEYS[5]) or 0) < included then
+    redis.call('ZINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+local cursor = redis.call('GET', KEYS[2])
+if cursor then
+    if included then
+        if tonumber(redis.call('GET', KEYS[4]) or 0) < included then
+            redis.call('HINCRBY', KEYS[3], ARGV[2], ARGV[1])
+        end
+    elseif tonumber(ARGV[2]) <= tonumber(cursor) then
+        redis.call('HINCRBY', KEYS[3], ARGV[2], ARGV[1])
+    end
+end
+"""
+
+# Подмена лидерборда собранным множеством вместе с начислениями, сделанными во время пересборки
+# KEYS: [1] лидерборд, [2] временный ключ, [3] курсор пересборки, [4] delta, [5] номер пересборки, собравшей
+# лидерборд; ARGV: [1] номер этой пересборки
+SWAP_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('RENAME', KEYS[2], KEYS[1])
+else
+    redis.call('DEL', KEYS[1])
+end
+local delta = redis.call('HGETALL', KEYS[4])
+for i = 1, #delta, 2 do
+    redis.call('ZINCRBY', KEYS[1], delta[i + 1], delta[i])
+end
+redis.call('DEL', KEYS[3], KEYS[4])
+redis.call('SET', KEYS[5], ARGV[1])
+return #delta / 2
+"""
+
+_unlock_script = redis.register_script(UNLOCK_SCRIPT)
+_add_script = redis.register_script(ADD_SCRIPT)
+_swap_script = redis.register_script(SWAP_SCRIPT)
+
+
+class Leaderboard:
+    """
+    Недельный лидерборд: Redis sorted set chat_id -> earned_week_coins. Обновляется ZINCRBY при каждом
+    начислении недельных монет (O(log n)), топ и место юзера читаются без сортировки таблицы stats.
+    Источник истины - stats.earned_week_coins: множество пересобирается из бд при старте, если его нет,
+    и раз в LEADERBOARD_REBUILD_PERIOD (исправляет расхождения от неудачных ZINCRBY). Если Redis недоступен,
+    топ и место читаются из бд.
+    """
+    key = "leaderboard:week"
+    lock_key = "leaderboard:week:rebuild"
+    cursor_key = "leaderboard:week:cursor"  # последний chat_id, прочитанный пересборкой из бд
+    delta_key = "leaderboard:week:delta"  # начисления во время пересборки, chat_id -> монеты
+    rebuilt_key = "leaderboard:week:rebuilt"  # есть, пока не наступило время периодической пересборки
+    generation_key = "leaderboard:week:generation"  # номер последней начатой пересборки
+    built_key = "leaderboard:week:built"  # номер пересборки, собравшей текущее множество
+
+    def __init__(self) -> None:
+        self._rebuilder: Task | None = None
+
+    async def generation(self, user_id: int) -> int | None:
+        """
+        Номер первой пересборки, снимок бд которой включит начисление юзеру. Вызывать в транзакции начисления
+        после UPDATE stats юзера и до коммита: блокировка строки упорядочивает начисление с чтением пересборки.
+        :param user_id: chat_id юзера
+        :return: номер для add или None, если Redis недоступен
+        """
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                generation, cursor = await pipe.get(self.generation_key).get(self.cursor_key).execute()
+        except RedisError:
+            logger.warning("Не удалось прочитать состояние пересборки %s", self.key, exc_info=True)
+            return None
+
+        generation = int(generation or 0)
+
+        # Идущая пересборка, еще не прочитавшая строку юзера, прочитает ее после коммита начисления
+        return generation if cursor is not None and user_id > int(cursor) else generation + 1
+
+    async def add(self, user_id: int, coins: int, generation: int | None = None) -> None:
+        """
+        Добавляет юзеру недельные монеты после коммита начисления в бд. Ошибки Redis не пробрасываются
+        (расхождение исправит пересборка).
+        :param user_id: chat_id юзера
+        :param coins: количество монет
+        :param generation: результат generation, полученный в транзакции начисления. Без него начисление,
+        закоммиченное до того, как пересборка прочитала строку юзера, может попасть в лидерборд дважды
+        """
+        if not coins:
+            return
+
+        try:
+            await _add_script(keys=[self.key, self.cursor_key, self.delta_key, self.generation_key, self.built_key],
+                              args=[coins, user_id, "" if generation is None else generation])
+        except RedisError:
+            logger.warning("Не удалось обновить %s для %s", self.key, user_id, exc_info=True)
+
+    async def top(self, count: int) -> list[tuple[int, int]]:
+        """
+        Первые count юзеров по убыванию недельных монет.
+        :return: список (chat_id, монеты)
+        """
+        try:
+            leaders = await redis.zrevrange(self.key, 0, count - 1, withscores=True)
+        except RedisError:
+            logger.warning("Не удалось прочитать %s, топ читается из бд", self.key, exc_info=True)
+            return await (Stats.filter(earned_week_coins__gt=0).order_by("-earned_week_coins", "user_id")
+                          .limit(count).values_list("user_id", "earned_week_coins"))
+
+        return [(int(user_id), int(coins)) for user_id, coins in leaders]
+
+    async def place(self, user_id: int) -> tuple[int, int] | None:
+        """
+        Место юзера (с 1) и его недельные монеты или None, если на этой неделе он ничего не заработал.
+        :param user_id: chat_id юзера
+        """
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                rank, coins = await pipe.zrevrank(self.key, user_id).zscore(self.key, user_id).execute()
+        except RedisError:
+            logger.warning("Не удалось прочитать %s, место читается из бд", self.key, exc_info=True)
+            coins = await Stats.filter(user_id=user_id).first().values_list("earned_week_coins", flat=True)
+
+            if not coins:
+                return None
+
+            return await Stats.filter(earned_week_coins__gt=coins).count() + 1, coins
+
+        return None if rank is None else (rank + 1, int(coins))
+
+    async def remove(self, *user_ids: int) -> None:
+        if not user_ids:
+            return
+
+        try:
+            await redis.zrem(self.key, *user_ids)
+        except RedisError:
+            logger.warning("Не удалось удалить юзеров из %s", self.key, exc_info=True)
+
+    async def reset(self) -> None:
+        await redis.delete(self.key)
+
+    async def _lock(self, wait: bool) -> str | None:
+        """
+        :param wait: ждать, пока пересборку в другом воркере закончат (не дольше LOCK_TTL)
+        :return: токен блокировки или None, если она занята
+        """
+        token, deadline = uuid4().hex, monotonic() + LOCK_TTL
+
+        while not await redis.set(self.lock_key, token, nx=True, ex=LOCK_TTL):
+            if not wait or monotonic() > deadline:
+                return None
+
+            await sleep(0.1)
+
+        return token
+
+    @staticmethod
+    async def _read_chunk(connection: BaseDBAsyncClient, last_user_id: int) -> list[tuple[int, int]]:
+        if connection.capabilities.dialect == "postgres":
+            rows = await connection.execute_query_dict(REBUILD_CHUNK_SQL, [last_user_id, REBUILD_CHUNK])
+            return [(row["user_id"], row["earned_week_coins"]) for row in rows]
+
+        return await (Stats.filter(user_id__gt=last_user_id).order_by("user_id").limit(REBUILD_CHUNK)
+                      .using_db(connection).values_list("user_id", "earned_week_coins"))
+
+    async def rebuild(self, force: bool = False, wait: bool = False) -> None:
+        """
+        Пересобирает лидерборд по stats.earned_week_coins. Выполняется одним воркером (блокировка в Redis),
+        новое множество собирается во временном ключе и подменяет старое атомарно вместе с начислениями,
+        сделанными во время пересборки.
+        :param force: пересобрать, даже если лидерборд уже есть в Redis
+        :param wait: если пересобирает другой воркер, дождаться его и пересобрать заново (его данные могли
+        быть прочитаны из бд до изменения, например до обнуления недели), иначе ничего не делать
+        """
+        try:
+            if not force and await redis.exists(self.key):
+                return
+
+            token = await self._lock(wait)
+
+            if token is None:
+                return
+
+            try:
+                tmp_key = f"{self.key}:tmp"
+
+                async with redis.pipeline(transaction=True) as pipe:
+                    generation = (await pipe.delete(tmp_key, self.delta_key).incr(self.generation_key)
+                                  .set(self.cursor_key, 0, ex=LOCK_TTL).execute())[1]
+
+                last_user_id = 0
+
+                while True:
+                    async with in_transaction("api") as connection:
+                        rows = await self._read_chunk(connection, last_user_id)
+
+                        if not rows:
+                            break
+
+                        last_user_id = rows[-1][0]
+                        scores = {user_id: coins for user_id, coins in rows if coins > 0}
+
+                        async with redis.pipeline(transaction=True) as pipe:
+                            if scores:
+                                pipe.zadd(tmp_key, scores)
+
+                            await pipe.set(self.cursor_key, last_user_id, ex=LOCK_TTL).execute()
+
+                applied = await _swap_script(keys=[self.key, tmp_key, self.cursor_key, self.delta_key, self.built_key],
+                                             args=[generation])
+                logger.info("%s пересобран, начислений во время пересборки: %s", self.key, applied)
+            finally:
+                await redis.delete(self.cursor_key, self.delta_key)
+                await _unlock_script(keys=[self.lock_key], args=[token])
+
+        except RedisError:
+            logger.warning("Не удалось пересобрать %s", self.key, exc_info=True)
+
+    async def _rebuild_forever(self) -> None:
+        while True:
+            await sleep(LEADERBOARD_REBUILD_PERIOD / 10)
+
+            try:
+                # Пересобирает один воркер за период: тот, кто первым поставил отметку
+                if await redis.set(self.rebuilt_key, 1, nx=True, ex=LEADERBOARD_REBUILD_PERIOD):
+                    await self.rebuild(force=True)
+            except CancelledError:
+                raise
+            except Exception:
+                logger.exception("Не удалось пересобрать %s", self.key)
+
+    def start_rebuilder(self) -> None:
+        if self._rebuilder is None:
+            self._rebuilder = create_task(self._rebuild_forever())
+
+    async def stop_rebuilder(self) -> None:
+        if self._rebuilder is not None:
+            self._rebuilder.cancel()
+            self._rebuilder = None
+
+
+leaderboard = Leaderboard()
+
+
+@post_delete(User)
+async def _on_user_deleted(sender, instance: User, using_db) -> None:
+    await leaderboard.remove(instance.id)
@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """
+    Ограниченный LRU кеш с TTL на каждую запись. Живет в памяти одного воркера, не потокобезопасен
+    (рассчитан на работу внутри event loop).
+    """
+    __slots__ = ("maxsize", "ttl", "_data")
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        """
+        :param maxsize: максимальное количество записей, при переполнении вытесняется самая старая по использованию
+        :param ttl: время жизни записи по умолчанию в секундах
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+
+        if item is None:
+            return default
+
+        if item[0] <= monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        self._data[key] = (monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+class BytesTTLCache:
+    """
+    LRU кеш значений bytes с TTL на каждую запись, ограниченный количеством записей и суммарным размером
+    ключей и значений. Считает попадания, промахи и вытеснения. Как и TTLCache, живет в памяти одного воркера.
+    """
+    __slots__ = ("maxsize", "maxbytes", "size", "hits", "misses", "evictions", "_data")
+
+    def __init__(self, maxsize: int, maxbytes: int) -> None:
+        """
+        :param maxsize: максимальное количество записей
+        :param maxbytes: максимальный суммарный размер ключей и значений в байтах
+        """
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def get_with_ttl(self, key: str) -> tuple[float, bytes | None]:
+        """
+        :return: (оставшееся время жизни в секундах, значение) или (0, None), если записи нет
+        """
+        item = self._data.get(key)
+
+        if item is not None:
+            ttl = item[0] - monotonic()
+
+            if ttl > 0:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return ttl, item[1]
+
+            self.pop(key)
+
+        self.misses += 1
+        return 0, None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.pop(key)
+        size = len(key) + len(value)
+
+        if ttl <= 0 or size > self.maxbytes:  # такая запись вытеснила бы весь кеш
+            return
+
+        self._data[key] = (monotonic() + ttl, value)
+        self.size += size
+
+        while len(self._data) > self.maxsize or self.size > self.maxbytes:
+            old_key, (_, old_value) = self._data.popitem(last=False)
+            self.size -= len(old_key) + len(old_value)
+            self.evictions += 1
+
+    def pop(self, key: str) -> bytes | None:
+        item = self._data.pop(key, None)
+
+        if item is None:
+            return None
+
+        self.size -= len(key) + len(item[1])
+        return item[1]
+
+    def pop_prefix(self, prefix: str) -> int:
+        """
+        Удаляет все записи с ключом, начинающимся с prefix.
+        :return: количество удаленных записей
+        """
+        keys = [key for key in self._data if key.startswith(prefix)]
+
+        for key in keys:
+            self.pop(key)
+
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,116 @@
+import logging
+from redis.exceptions import RedisError
+from tortoise.signals import post_save, post_delete
+from components import broker
+from components.redis_db import redis
+from models import User
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK = 10000  # сколько chat_id добавлять в Redis за одну команду при пересборке
+
+
+class RegisteredUsers:
+    """
+    Множество chat_id зарегистрированных юзеров: Redis set, общий для всех воркеров, и локальное зеркало
+    в памяти воркера. Позволяет проверять регистрацию без запроса в бд. Юзеры, созданные в обход API
+    (например ботом), находятся запросом в бд при первом обращении и после этого добавляются во множество.
+    """
+    key = "registered_users"
+    channel = "registered_users:removed"
+
+    def __init__(self) -> None:
+        self._local: set[int] = set()
+        broker.subscribe(self.channel, self._on_removed)
+
+    async def contains(self, user_id: int) -> bool:
+        """
+        Проверка регистрации юзера: локальное зеркало -> Redis -> бд.
+        :param user_id: chat_id юзера
+        """
+        if user_id in self._local:
+            return True
+
+        try:
+            found = await redis.sismember(self.key, user_id)
+        except RedisError:
+            found = False
+
+        if found:
+            self._local.add(user_id)
+            return True
+
+        if await User.exists(id=user_id):
+            await self.add(user_id)
+            return True
+
+        return False
+
+    async def add(self, *user_ids: int) -> None:
+        if not user_ids:
+            return
+
+        self._local.update(user_ids)
+
+        try:
+            await redis.sadd(self.key, *user_ids)
+        except RedisError:
+            logger.warning("Не удалось добавить юзеров в %s", self.key, exc_info=True)
+
+    async def discard(self, *user_ids: int) -> None:
+        if not user_ids:
+            return
+
+        self._local.difference_update(user_ids)
+
+        try:
+            await redis.srem(self.key, *user_ids)
+        except RedisError:
+            logger.warning("Не удалось удалить юзеров из %s", self.key, exc_info=True)
+
+        await broker.publish(self.channel, ",".join(map(str, user_ids)))
+
+    def _on_removed(self, payload: str) -> None:
+        self._local.difference_update(int(user_id) for user_id in payload.split(","))
+
+    async def rebuild(self) -> None:
+        """
+        Пересобирает множество по таблице User. Выполняется одним воркером (блокировка в Redis),
+        новое множество собирается во временном ключе и подменяет старое атомарно.
+        """
+        try:
+            if not await redis.set(f"{self.key}:rebuild", 1, nx=True, ex=60):
+                return
+
+            user_ids = await User.all().values_list("id", flat=True)
+            tmp_key = f"{self.key}:tmp"
+
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.delete(tmp_key)
+
+                for i in range(0, len(user_ids), REBUILD_CHUNK):
+                    pipe.sadd(tmp_key, *user_ids[i:i + REBUILD_CHUNK])
+
+                if user_ids:
+                    pipe.rename(tmp_key, self.key)
+                else:
+                    pipe.delete(self.key)
+
+                await pipe.execute()
+
+        except RedisError:
+            logger.warning("Не удалось пересобрать %s", self.key, exc_info=True)
+
+
+registered_users = RegisteredUsers()
+
+
+@post_save(User)
+async def _on_user_saved(sender, instance: User, created: bool, using_db, update_fields) -> None:
+    if created:
+        await registered_users.add(instance.id)
+
+
+@post_delete(User)
+async def _on_user_deleted(sender, instance: User, using_db) -> None:
+    await registered_users.discard(instance.id)
@@ -0,0 +1,79 @@
+from tortoise.transactions import in_transaction
+
+LOCK_ID = 7_310_002  # id advisory lock postgres, чтобы воркеры не выполняли миграции одновременно
+
+# Идемпотентные изменения схемы, которых нет в generate_schemas (он создает только отсутствующие таблицы).
+# Выполняются по порядку при каждом старте, поэтому каждая миграция должна быть безопасна для повтора.
+MIGRATIONS = (
+    # Счетчики рефералов и наград в профиле
+    'CREATE INDEX IF NOT EXISTS "idx_user_referrer_id" ON "user" ("referrer_id")',
+    'CREATE INDEX IF NOT EXISTS "idx_reward_user_id" ON "reward" ("user_id")',
+    # Аватары в хранилище файлов, в профиле только имя файла
+    'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS "avatar_hash" VARCHAR(80)',
+    # Уникальность (user_id, task_id) для вставки взятой задачи с ON CONFLICT. Имя совпадает с ограничением,
+    # которое generate_schemas создает в новой бд. Дубликаты от get_or_create удаляются, остается выполненная
+    # или самая ранняя запись.
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'uid_usertask_user_id_3f97f6') THEN
+            DELETE FROM "usertask" "a" USING "usertask" "b"
+            WHERE "a"."user_id" = "b"."user_id" AND "a"."task_id" = "b"."task_id" AND "a"."id" <> "b"."id"
+              AND ("a"."completed_time" IS NULL, "a"."id") > ("b"."completed_time" IS NULL, "b"."id");
+            CREATE UNIQUE INDEX "uid_usertask_user_id_3f97f6" ON "usertask" ("user_id", "task_id");
+        END IF;
+    END $$
+    """,
+    # Реферальная цепочка на юзере (components.tools.referrer_path): заполняется для двух уровней,
+    # по длине REFERRAL_MINING_INCOME
+    'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS "referrer_path" VARCHAR(255)',
+    """
+    UPDATE "user" "lead" SET "referrer_path" = concat_ws(',', "lead"."referrer_id", "referrer"."referrer_id")
+    FROM "user" "referrer"
+    WHERE "referrer"."id" = "lead"."referrer_id" AND "lead"."referrer_path" IS NULL
+    """,
+    # Одна строка MINING_REFERRAL на юзера для начисления через INSERT ... ON CONFLICT DO UPDATE.
+    # Дубликаты складываются в самую раннюю запись.
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'uid_reward_mining_referral') THEN
+            UPDATE "reward" SET "amount" = "total"."amount"
+            FROM (SELECT min("id") AS "id", sum("amount") AS "amount" FROM "reward"
+                  WHERE "type" = 'mining_referral' GROUP BY "user_id" HAVING count(*) > 1) "total"
+            WHERE "reward"."id" = "total"."id";
+            DELETE FROM "reward" "a" USING "reward" "b"
+            WHERE "a"."type" = 'mining_referral' AND "b"."type" = 'mining_referral'
+              AND "a"."user_id" = "b"."user_id" AND "a"."id" > "b"."id";
+            CREATE UNIQUE INDEX "uid_reward_mining_referral" ON "reward" ("user_id", "type")
+            WHERE "type" = 'mining_referral';
+        END IF;
+    END $$
+    """,
+    # Эмбеддинги вопросов float32 в BYTEA (components.vectors.pack). Текстовая колонка не заполнялась,
+    # значения не переносятся.
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'question' AND column_name = 'embedding' AND data_type = 'text') THEN
+            ALTER TABLE "question" ALTER COLUMN "embedding" TYPE BYTEA USING NULL;
+        END IF;
+    END $$
+    """,
+)
+
+
+async def migrate() -> None:
+    """
+    Выполняет MIGRATIONS в одной транзакции под advisory lock. Только для postgres: другие бд используются
+    в тестах и создаются generate_schemas сразу с актуальной схемой.
+    """
+    async with in_transaction("api") as conn:
+        if conn.capabilities.dialect != "postgres":
+            return
+
+        await conn.execute_query("SELECT pg_advisory_xact_lock($1)", [LOCK_ID])
+
+        for sql in MIGRATIONS:
+            await conn.execute_script(sql)
@@ -0,0 +1,61 @@
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from better_profanity import profanity
+from spellchecker import SpellChecker
+from config import MODERATION_THREADS
+
+# Проверки орфографии и мата - чистый Python (CPU), выполняются в ограниченном пуле потоков, чтобы не
+# останавливать event loop воркера. Перевод - в components.translation.
+_moderation_pool = ThreadPoolExecutor(max_workers=MODERATION_THREADS, thread_name_prefix="moderation")
+
+
+class ModerationError(Exception):
+    """
+    Вопрос не прошел проверки, текст исключения - ответ юзеру.
+    """
+
+
+@cache
+def _spell_checker() -> SpellChecker:
+    """
+    Словарь частот английских слов, загружается один раз на процесс. После загрузки только читается,
+    поэтому один объект используется всеми потоками пула.
+    """
+    profanity.load_censor_words(whitelist_words=["god"])  # список нецензурных слов, глобальный для better_profanity
+    return SpellChecker(language="en")
+
+
+def _check(question: str) -> None:
+    spell = _spell_checker()
+    words = question.split()
+
+    # Слова из словаря не исправляются, кандидаты ищутся только для неизвестных (самая дорогая часть проверки)
+    if any(not spell.candidates(word) for word in spell.unknown(words)):
+        raise ModerationError("❓ Я не могу прочесть твое заклинание, послушник мой.")
+
+    if len(question) < 10:
+        raise ModerationError("🌀 Слишком короткое сообщение, аколит.")
+
+    if len(words) < 2:
+        raise ModerationError("👁‍🗨 Слишком мало слов в сообщении, аколит.")
+
+    if "*" in profanity.censor(question):
+        raise ModerationError("💢 Послушник мой, нельзя использовать мат в заклинаниях!")
+
+
+async def load() -> None:
+    """
+    Загружает словари в пуле потоков, чтобы первый вопрос после старта воркера не ждал загрузки.
+    """
+    await get_running_loop().run_in_executor(_moderation_pool, _spell_checker)
+
+
+async def check_question(question: str) -> None:
+    """
+    Базовые проверки вопроса на английском (корректность ввода, длина, мат) в пуле потоков.
+    :param question: вопрос, переведенный на английский
+    :raise ModerationError: вопрос не прошел проверку
+    """
+    await get_running_loop().run_in_executor(_moderation_pool, _check, question)
+
@@ -0,0 +1,123 @@
+from datetime import date, datetime
+from pydantic import BaseModel, ConfigDict
+from tortoise.expressions import RawSQL
+from components import accumulator
+from components.avatars import move_avatars
+from components.daily import daily_login
+from components.ranks import ranks
+from components.tools import regenerate_energy
+from config import CLICKS_WRITE_BEHIND
+from models import User, RankName
+
+# Количества вместо списков: профиль читается одним запросом независимо от числа рефералов и наград
+LEADS_COUNT_SQL = '(SELECT COUNT(*) FROM "user" "lead" WHERE "lead"."referrer_id" = "user"."id")'
+REWARDS_COUNT_SQL = '(SELECT COUNT(*) FROM "reward" WHERE "reward"."user_id" = "user"."id")'
+# Аватар, записанный ботом в бд и еще не перенесенный в хранилище (сам blob не читается)
+AVATAR_IN_DB_SQL = '("user"."avatar" IS NOT NULL)'
+
+ACTIVITY_FIELDS = ("reg_date", "last_login_date", "last_daily_reward", "last_sync_energy", "next_inspiration",
+                   "next_mining", "is_active_mining", "active_days")
+STATS_FIELDS = ("coins", "energy", "earned_week_coins", "invited_friends", "inspirations", "replenishments")
+
+
+class ProfileRank(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    league: int
+    name: RankName
+    press_force: float
+    max_energy: float
+    energy_per_sec: float
+    price: int
+
+
+class ProfileActivity(BaseModel):
+    reg_date: date
+    last_login_date: date
+    last_daily_reward: date
+    last_sync_energy: datetime
+    next_inspiration: datetime
+    next_mining: datetime
+    is_active_mining: bool
+    active_days: int
+
+
+class ProfileStats(BaseModel):
+    coins: int
+    energy: float
+    earned_week_coins: int
+    invited_friends: int
+    inspirations: int
+    replenishments: int
+
+
+class Profile(BaseModel):
+    id: int
+    rank: ProfileRank
+    referrer_id: int | None
+    country: str
+    referral_code: str
+    username: str
+    activity: ProfileActivity
+    stats: ProfileStats
+    leads_count: int
+    rewards_count: int
+    avatar_hash: str | None  # картинка: GET /user/avatar/{avatar_hash}
+
+
+async def get_profile(user_id: int) -> Profile | None:
+    """
+    Профиль юзера одним запросом (user + stats + activity, количества рефералов и наград подзапросами),
+    ранг берется из реестра рангов. Обрабатывает ежедневный вход, энергия считается на момент запроса.
+    :param user_id: chat_id юзера
+    :return: профиль или None, если юзера нет
+    """
+    rows = await (User.filter(id=user_id)
+                  .annotate(leads_count=RawSQL(LEADS_COUNT_SQL), rewards_count=RawSQL(REWARDS_COUNT_SQL),
+                            avatar_in_db=RawSQL(AVATAR_IN_DB_SQL))
+                  .values("id", "rank_id", "referrer_id", "country", "referral_code", "username", "avatar_hash",
+                          "avatar_in_db", "leads_count", "rewards_count",
+                          **{f"activity_{field}": f"activity__{field}" for field in ACTIVITY_FIELDS},
+                          **{f"stats_{field}": f"stats__{field}" for field in STATS_FIELDS}))
+
+    if not rows:
+        return None
+
+    row = rows[0]
+    rank = ranks[row["rank_id"]]
+    profile = Profile(
+        id=row["id"],
+        rank=ProfileRank.model_validate(rank),
+        referrer_id=row["referrer_id"],
+        country=row["country"],
+        referral_code=row["referral_code"],
+        username=row["username"],
+        activity=ProfileActivity(**{field: row[f"activity_{field}"] for field in ACTIVITY_FIELDS}),
+        stats=ProfileStats(**{field: row[f"stats_{field}"] for field in STATS_FIELDS}),
+        leads_count=row["leads_count"],
+        rewards_count=row["rewards_count"],
+        avatar_hash=row["avatar_hash"],
+    )
+
+    if row["avatar_in_db"]:
+        profile.avatar_hash = (await move_avatars(user_id)).get(user_id, profile.avatar_hash)
+
+    if await daily_login(user_id, profile.activity) is not None:  # получаем ежедневную награду за вход
+        profile.rewards_count += 1
+
+    if CLICKS_WRITE_BEHIND and (pending := await accumulator.get_pending(user_id)) is not None:
+        profile.stats.coins += pending.coins  # монеты и энергия, еще не записанные в бд
+        profile.stats.earned_week_coins += pending.week
+        profile.stats.energy = pending.energy
+        profile.activity.last_sync_energy = datetime.fromtimestamp(pending.as_of,
+                                                                   tz=profile.activity.last_sync_energy.tzinfo)
+
+    # энергия на момент запроса (только в ответе, в бд не пишется), время пересчета отдается вместе с ней,
+    # чтобы закешированный профиль оставался согласованным: клиент досчитывает регенерацию от last_sync_energy
+    now = datetime.now(tz=profile.activity.last_sync_energy.tzinfo)
+    profile.stats.energy = regenerate_energy(profile.stats.energy, profile.activity.last_sync_energy,
+                                             rank.energy_per_sec, rank.max_energy, now)
+    profile.activity.last_sync_energy = now
+
+    return profile
@@ -0,0 +1,85 @@
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+from components import broker
+from models import Rank, RankName
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class RankInfo:
+    """
+    Неизменяемая копия строки Rank.
+    """
+    id: int
+    name: RankName
+    league: int
+    press_force: float
+    max_energy: float
+    energy_per_sec: float
+    price: int
+
+
+class RankRegistry:
+    """
+    Таблица рангов в памяти воркера. Ранги почти не меняются, поэтому загружаются один раз при старте,
+    а обработчики берут параметры ранга отсюда вместо join-а rank в каждом запросе. После изменения
+    рангов в админке таблица пересобирается во всех воркерах через событие broker.
+    """
+    channel = "ranks"
+
+    def __init__(self) -> None:
+        self._by_id: Mapping[int, RankInfo] = MappingProxyType({})
+        self._by_league: Mapping[int, tuple[RankInfo, ...]] = MappingProxyType({})
+        broker.subscribe(self.channel, self._on_changed)
+
+    def __getitem__(self, rank_id: int) -> RankInfo:
+        return self._by_id[rank_id]
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, rank_id: int) -> RankInfo | None:
+        return self._by_id.get(rank_id)
+
+    def league(self, league: int) -> tuple[RankInfo, ...]:
+        """
+        Ранги лиги по возрастанию id.
+        :param league: номер лиги
+        """
+        return self._by_league.get(league, ())
+
+    def leagues(self) -> tuple[int, ...]:
+        return tuple(self._by_league)
+
+    async def load(self) -> None:
+        """
+        Загружает ранги из бд и атомарно подменяет таблицу.
+        """
+        rows = await Rank.all().order_by("id").values("id", "name", "league", "press_force", "max_energy",
+                                                      "energy_per_sec", "price")
+        by_id = {row["id"]: RankInfo(**row) for row in rows}
+        by_league: dict[int, tuple[RankInfo, ...]] = {}
+
+        for rank in by_id.values():
+            by_league[rank.league] = by_league.get(rank.league, ()) + (rank,)
+
+        self._by_id, self._by_league = MappingProxyType(by_id), MappingProxyType(by_league)
+
+    async def reload(self) -> None:
+        """
+        Пересобирает таблицу в текущем воркере и оповещает остальные воркеры.
+        """
+        await self.load()
+        await broker.publish(self.channel)
+
+    async def _on_changed(self, _: str) -> None:
+        try:
+            await self.load()
+        except Exception:
+            logger.exception("Не удалось перезагрузить ранги")
+
+
+ranks = RankRegistry()
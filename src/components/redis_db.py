@@ -0,0 +1,6 @@
+from redis.asyncio import from_url
+from config import REDIS_URL, APP_REDIS_DB
+
+# Общий клиент Redis для состояния приложения (членство юзеров, события между воркерами и т.д.),
+# соединения создаются лениво внутри event loop воркера
+redis = from_url(REDIS_URL, db=APP_REDIS_DB, encoding="utf-8", decode_responses=False)
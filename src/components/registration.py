@@ -0,0 +1,132 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pytz import timezone
+from tortoise import connections
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+from components.cache import invalidate
+from components.members import registered_users
+from components.tools import referrer_path
+from config import INVITE_FRIENDS_REWARDS
+from models import User, Stats, Activity, Reward, RewardType
+
+INVITED_FRIENDS_SQL = """
+UPDATE "stats" SET "invited_friends" = "stats"."invited_friends" + "invited"."count"
+FROM unnest($1::BIGINT[], $2::BIGINT[]) AS "invited" ("user_id", "count")
+WHERE "stats"."user_id" = "invited"."user_id"
+RETURNING "stats"."user_id", "stats"."invited_friends"
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class NewUser:
+    id: int  # chat_id в телеграм
+    username: str
+    country: str
+    referral_code: str | None = None  # код из реферальной ссылки, по которой пришел юзер
+
+
+@dataclass(slots=True)
+class RegistrationResult:
+    created: list[int] = field(default_factory=list)  # chat_id созданных юзеров
+    existing: list[int] = field(default_factory=list)  # chat_id уже зарегистрированных юзеров (пропущены)
+    unknown_referral_codes: list[str] = field(default_factory=list)  # коды, по которым не нашлось реферрера
+
+
+def _invite_rewards(previous: int, current: int) -> list[int]:
+    """
+    Награды за приглашенных друзей, пройденные при росте invited_friends с previous до current.
+    """
+    return [amount for count, amount in INVITE_FRIENDS_REWARDS.items() if previous < count <= current]
+
+
+async def _add_invited_friends(invited: Counter[int]) -> dict[int, int]:
+    """
+    Увеличивает invited_friends реферреров одним UPDATE.
+    :param invited: id реферрера -> количество новых рефералов
+    :return: id реферрера -> invited_friends после увеличения
+    """
+    connection = connections.get("api")
+
+    if connection.capabilities.dialect == "postgres":
+        rows = await connection.execute_query_dict(INVITED_FRIENDS_SQL, [list(invited), list(invited.values())])
+        return {row["user_id"]: row["invited_friends"] for row in rows}
+
+    for referrer_id, count in invited.items():
+        await Stats.filter(user_id=referrer_id).update(invited_friends=F("invited_friends") + count)
+
+    return dict(await Stats.filter(user_id__in=list(invited)).values_list("user_id", "invited_friends"))
+
+
+async def register_users(new_users: list[NewUser]) -> RegistrationResult:
+    """
+    Пакетная регистрация юзеров: User, Stats и Activity создаются через bulk_create в одной транзакции,
+    реферреры находятся одним запросом по referral_code, invited_friends и награды за приглашенных друзей
+    начисляются на всю пачку сразу. Уже зарегистрированные юзеры пропускаются, поэтому пакет можно повторить.
+    :param new_users: новые юзеры, из повторов chat_id в пакете берется последний
+    """
+    result = RegistrationResult()
+    new_users = list({new_user.id: new_user for new_user in new_users}.values())
+
+    if not new_users:
+        return result
+
+    now = datetime.now(tz=timezone("Europe/Moscow"))
+    codes = {new_user.referral_code for new_user in new_users if new_user.referral_code}
+
+    async with in_transaction("api"):
+        ids = [new_user.id for new_user in new_users]
+        existing = set(await User.filter(id__in=ids).values_list("id", flat=True))
+        referrers = {}
+
+        if codes:
+            rows = await User.filter(referral_code__in=codes).only("id", "referral_code", "referrer_path",
+                                                                        "referrer_id")
+            referrers = {referrer.referral_code: referrer for referrer in rows}
+
+        users, invited = [], Counter()
+
+        for new_user in new_users:
+            if new_user.id in existing:
+                result.existing.append(new_user.id)
+                continue
+
+            user = User(id=new_user.id, username=new_user.username, country=new_user.country)
+            referrer = referrers.get(new_user.referral_code)
+
+            if referrer is not None:
+                user.referrer_id, user.referrer_path = referrer.id, referrer_path(referrer)
+                invited[referrer.id] += 1
+            elif new_user.referral_code:
+                result.unknown_referral_codes.append(new_user.referral_code)
+
+            users.append(user)
+            result.created.append(user.id)
+
+        if not users:
+            return result
+
+        await User.bulk_create(users)
+        await Stats.bulk_create([Stats(user_id=user.id) for user in users])
+        # Значения по умолчанию дат Activity вычислены при импорте моделей, поэтому задаем их явно
+        await Activity.bulk_create([Activity(user_id=user.id, reg_date=now.date(), last_login_date=now.date(),
+                                             last_daily_reward=(now - timedelta(hours=35)).date(),
+                                             last_sync_energy=now, next_inspiration=now - timedelta(days=1),
+                                             next_mining=now - timedelta(days=1)) for user in users])
+
+        if invited:
+            invited_friends = await _add_invited_friends(invited)
+            rewards = [Reward(user_id=referrer_id, type=RewardType.INVITE_FRIENDS, amount=amount)
+                       for referrer_id, current in invited_friends.items()
+                       for amount in _invite_rewards(current - invited[referrer_id], current)]
+
+            if rewards:
+                await Reward.bulk_create(rewards)
+
+    await registered_users.add(*result.created)  # bulk_create не вызывает сигналы моделей
+
+    for referrer_id in invited:
+        await invalidate(referrer_id, "profile", "rewards")
+
+    return result
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from config import REGISTRATION_BATCH_SIZE
 
 
 class GetRewardRequest(BaseModel):
@@ -11,3 +12,14 @@ class SyncClicksRequest(BaseModel):
 
 class ChangeRegionRequest(BaseModel):
     country: str  # страна
+
+
+class RegisterUserRequest(BaseModel):
+    id: int  # chat_id в телеграм
+    username: str = Field(max_length=50)
+    country: str = Field(max_length=50)
+    referral_code: str | None = Field(default=None, max_length=40)  # код из реферальной ссылки
+
+
+class RegisterUsersRequest(BaseModel):
+    users: list[RegisterUserRequest] = Field(max_length=REGISTRATION_BATCH_SIZE)  # новые юзеры
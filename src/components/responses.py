@@ -20,3 +20,39 @@ class CustomJSONResponse(UJSONResponse):
             response['message'] = {'status': status, 'text': message}
 
         UJSONResponse.__init__(self, content=response, status_code=status_code)
+
+    @classmethod
+    def from_body(cls, body: bytes, status_code: int = 200) -> "CustomJSONResponse":
+        """
+        Респонс с уже закодированным телом, без повторной сериализации.
+        :param body: тело респонса (json)
+        :param status_code: статус код, starlette.status
+        """
+        response = cls.__new__(cls)
+        response.status_code = status_code
+        response.background = None
+        response.body = body
+        response.init_headers()
+
+        return response
+
+
+class StaticJSONResponse:
+    """
+    Респонс только с сообщением, закодированный один раз при создании: экземпляры - константы модулей роутеров,
+    поэтому сообщение кодируется при импорте, а не в каждом запросе. Вызов возвращает новый CustomJSONResponse
+    с готовым телом: экземпляр Response изменяем (заголовки, background), поэтому один и тот же объект нельзя
+    отдавать в разные запросы.
+    """
+    __slots__ = ("body", "status_code")
+
+    def __init__(self, message: str, status_code: int = 200) -> None:
+        """
+        :param message: сообщение
+        :param status_code: статус код, starlette.status
+        """
+        self.body = CustomJSONResponse(message=message, status_code=status_code).body
+        self.status_code = status_code
+
+    def __call__(self) -> CustomJSONResponse:
+        return CustomJSONResponse.from_body(self.body, self.status_code)
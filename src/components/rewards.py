@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from tortoise import connections
+from tortoise.transactions import in_transaction
+from components.leaderboard import leaderboard
+from components.tools import update_stats
+from models import Reward, RewardType, Question, QuestionStatus
+
+# Удаление и сумма в одном запросе: параллельный запрос ждет блокировки строк и не видит удаленные награды
+CLAIM_ALL_SQL = """
+WITH "claimed" AS (
+    DELETE FROM "reward" WHERE "user_id" = $1 RETURNING "type", "amount", "inspirations", "replenishments"
+)
+SELECT count(*) AS "count", coalesce(sum("amount"), 0) AS "coins",
+       coalesce(sum("inspirations"), 0) AS "inspirations", coalesce(sum("replenishments"), 0) AS "replenishments",
+       coalesce(bool_or("type" = 'ai_question'), FALSE) AS "ai_question"
+FROM "claimed"
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class ClaimedRewards:
+    count: int  # количество полученных наград
+    coins: int
+    inspirations: int
+    replenishments: int
+    ai_question: bool  # среди наград была награда за вопрос AI
+
+
+async def _delete_all(user_id: int) -> ClaimedRewards:
+    connection = connections.get("api")
+
+    if connection.capabilities.dialect == "postgres":
+        row = (await connection.execute_query_dict(CLAIM_ALL_SQL, [user_id]))[0]
+        return ClaimedRewards(count=row["count"], coins=int(row["coins"]), inspirations=int(row["inspirations"]),
+                              replenishments=int(row["replenishments"]), ai_question=row["ai_question"])
+
+    rows = await Reward.filter(user_id=user_id).select_for_update() \
+        .values("id", "type", "amount", "inspirations", "replenishments")
+    await Reward.filter(id__in=[row["id"] for row in rows]).delete()
+
+    return ClaimedRewards(count=len(rows), coins=sum(row["amount"] for row in rows),
+                          inspirations=sum(row["inspirations"] for row in rows),
+                          replenishments=sum(row["replenishments"] for row in rows),
+                          ai_question=any(row["type"] == RewardType.AI_QUESTION for row in rows))
+
+
+async def claim_all(user_id: int) -> ClaimedRewards:
+    """
+    Получение всех наград юзера в одной транзакции: DELETE ... RETURNING с суммой наград, одно начисление
+    на счет и не больше одного обновления статуса вопроса AI. Награду получает только один из параллельных
+    запросов. Монеты добавляются в лидерборд после коммита: при откате транзакции их там быть не должно.
+    :param user_id: chat_id юзера
+    """
+    async with in_transaction("api"):
+        claimed = await _delete_all(user_id)
+
+        if claimed.ai_question:
+            await Question.filter(user_id=user_id).update(status=QuestionStatus.RECEIVED_REWARD)
+
+        generation = await update_stats(user_id, coins=claimed.coins, inspirations=claimed.inspirations,
+                                        replenishments=claimed.replenishments)
+
+    await leaderboard.add(user_id, claimed.coins, generation)
+
+    return claimed
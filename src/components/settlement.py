@@ -0,0 +1,129 @@
+import logging
+from argparse import ArgumentParser
+from asyncio import run
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from time import perf_counter
+from pytz import timezone
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from components import accumulator
+from components.cache import init_cache, invalidate
+from components.leaderboard import leaderboard
+from config import LEADERBOARD_REWARDS, SETTLEMENT_CHUNK, CLICKS_WRITE_BEHIND, TORTOISE_CONFIG
+from models import Stats, Leader, Reward, RewardType, Settlement
+
+logger = logging.getLogger(__name__)
+
+LOCK_ID = 7_310_001  # id advisory lock postgres для подведения итогов недели
+
+
+@dataclass(slots=True)
+class SettlementResult:
+    week: date
+    leaders: int
+    reset_stats: int
+    seconds: float
+
+
+def week_start(dt: datetime) -> date:
+    """
+    Понедельник недели (по Москве), в которую попадает dt.
+    """
+    moscow_dt = dt.astimezone(timezone("Europe/Moscow"))
+    return (moscow_dt - timedelta(days=moscow_dt.weekday())).date()
+
+
+def reward_for(place: int) -> tuple[int, int, int] | None:
+    """
+    Награда за место в лидерборде из LEADERBOARD_REWARDS.
+    :return: (монеты, вдохновения, приливы) или None, если место без награды
+    """
+    for last_place, amount, inspirations, replenishments in LEADERBOARD_REWARDS:
+        if place <= last_place:
+            return amount, inspirations, replenishments
+
+    return None
+
+
+async def settle_week(week: date | None = None, publish: bool = True) -> SettlementResult | None:
+    """
+    Подведение итогов недели: снимок топа в Leader, награды LEADERBOARD лидерам и обнуление earned_week_coins
+    у всех юзеров одним UPDATE. Все выполняется в одной транзакции под advisory lock, повторный запуск
+    за ту же неделю ничего не делает (отметка в Settlement).
+    :param week: понедельник подводимой недели, по умолчанию текущая неделя
+    :param publish: до транзакции сбросить в бд клики из Redis, после - пересобрать лидерборд в Redis и удалить
+    кеш лидеров. False - только изменения в бд (например, в транзакции, которая будет откачена)
+    :return: итоги или None, если неделя уже подведена или итоги подводит другой процесс
+    """
+    week = week or week_start(datetime.now(tz=timezone("Europe/Moscow")))
+    start = perf_counter()
+
+    if publish and CLICKS_WRITE_BEHIND:
+        await accumulator.flush()  # дописываем в бд клики, еще лежащие в Redis
+
+    async with in_transaction("api") as conn:
+        if conn.capabilities.dialect == "postgres":
+            locked = await conn.execute_query_dict("SELECT pg_try_advisory_xact_lock($1) AS locked", [LOCK_ID])
+
+            if not locked[0]["locked"]:
+                return None
+
+        if await Settlement.filter(week=week).using_db(conn).exists():
+            return None
+
+        top = await (Stats.filter(earned_week_coins__gt=0)
+                     .order_by("-earned_week_coins", "user_id")
+                     .limit(LEADERBOARD_REWARDS[-1][0])
+                     .using_db(conn)
+                     .values_list("user_id", "earned_week_coins"))
+
+        leaders, rewards = [], []
+
+        for place, (user_id, coins) in enumerate(top, start=1):
+            leaders.append(Leader(place=place, user_id=user_id, earned_week_coins=coins))
+            amount, inspirations, replenishments = reward_for(place)
+            rewards.append(Reward(type=RewardType.LEADERBOARD, user_id=user_id, amount=amount,
+                                  inspirations=inspirations, replenishments=replenishments))
+
+        await Leader.all().using_db(conn).delete()
+        await Leader.bulk_create(leaders, batch_size=SETTLEMENT_CHUNK, using_db=conn)
+        await Reward.bulk_create(rewards, batch_size=SETTLEMENT_CHUNK, using_db=conn)
+
+        reset_stats = await Stats.filter(earned_week_coins__not=0).using_db(conn).update(earned_week_coins=0)
+        await Settlement.create(week=week, leaders=len(leaders), reset_stats=reset_stats, using_db=conn)
+
+    if publish:
+        # Новая неделя, в Redis остаются только начисления после обнуления. Пересборка, начатая другим
+        # воркером до обнуления, вернула бы монеты прошлой недели, поэтому ждем ее и пересобираем заново.
+        await leaderboard.rebuild(force=True, wait=True)
+
+        # Кеш сбрасывается только лидерам (новая награда), обнуление earned_week_coins в закешированных профилях
+        # остальных юзеров устаревает в пределах PROFILE_CACHE_TTL
+        for leader in leaders:
+            await invalidate(leader.user_id, "rewards", "profile")
+
+    return SettlementResult(week=week, leaders=len(leaders), reset_stats=reset_stats, seconds=perf_counter() - start)
+
+
+async def main(week: date | None) -> None:
+    await Tortoise.init(config=TORTOISE_CONFIG)
+    await init_cache()
+
+    try:
+        result = await settle_week(week)
+    finally:
+        await Tortoise.close_connections()
+
+    if result is None:
+        print("Итоги недели уже подведены или подводятся другим процессом.")
+    else:
+        print(f"Неделя {result.week}: награждено лидеров {result.leaders}, обнулено stats {result.reset_stats} "
+              f"за {result.seconds:.2f} сек ({result.reset_stats / max(result.seconds, 1e-9):.0f} строк/сек)")
+
+
+# Запуск из src (например cron в воскресенье 23:59 по Москве): python -m components.settlement [--week 2024-09-02]
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Подведение итогов недели лидерборда.")
+    parser.add_argument("--week", type=date.fromisoformat, default=None, help="понедельник подводимой недели")
+    run(main(parser.parse_args().week))
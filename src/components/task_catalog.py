@@ -0,0 +1,192 @@
+import logging
+from asyncio import Task as AsyncioTask, create_task, sleep, CancelledError
+from dataclasses import dataclass
+from hashlib import md5
+from types import MappingProxyType
+from typing import Any, Mapping
+from tortoise.signals import post_save, post_delete
+from components import broker
+from components.cache import invalidate_all
+from components.ranks import ranks
+from components.redis_db import redis
+from config import TASK_CATALOG_REFRESH
+from models import Task, InstantReward, Condition, VisitLinkCondition, TgChannelCondition, Visibility, \
+    RankVisibility, ConditionType, VisibilityType
+
+logger = logging.getLogger(__name__)
+
+RELOAD_DELAY = 1  # сигналы об изменении задач за это время объединяются в одну перезагрузку, сек
+
+TASK_FIELDS = {
+    "id": "id",
+    "description": "description",
+    "coins": "reward__tokens",
+    "inspirations": "reward__inspirations",
+    "replenishments": "reward__replenishments",
+    "condition_type": "condition__type",
+    "url": "condition__visit_link_condition__url",
+    "channel_id": "condition__tg_channel_condition__channel_id",
+    "visibility_type": "visibility__type",
+    "visibility_rank_id": "visibility__rank_visibility__rank_id",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class TaskInfo:
+    """
+    Задача с наградой, условием выполнения и видимостью. Словари общие для всех запросов, не изменять.
+    """
+    id: int
+    description: str
+    coins: int
+    inspirations: int
+    replenishments: int
+    condition_type: ConditionType
+    condition: dict[str, str]  # {"url": ...} или {"channel_id": ...}
+    min_league: int | None  # задача видна лигам >= min_league, None - не видна никому
+    response: dict[str, Any]  # TaskResponse для списка задач (is_started = False), общий для всех запросов
+
+
+class TaskCatalog:
+    """
+    Каталог задач в памяти воркера. Задачи со всеми связями загружаются одним запросом, для каждой лиги
+    заранее собирается список видимых задач, поэтому список задач юзера - это выборка по лиге без запросов
+    в бд. Каталог перезагружается при изменении задач через ORM (сигналы, событие broker для остальных
+    воркеров) и периодически раз в TASK_CATALOG_REFRESH на случай изменений в обход API.
+    """
+    channel = "tasks"
+
+    def __init__(self) -> None:
+        self._by_id: Mapping[int, TaskInfo] = MappingProxyType({})
+        self._by_league: Mapping[int, tuple[TaskInfo, ...]] = MappingProxyType({})
+        self._refresher: AsyncioTask | None = None
+        self._pending_reload: AsyncioTask | None = None
+        self.version = ""  # хеш загруженных из бд строк, одинаковый во всех воркерах
+        broker.subscribe(self.channel, self._on_changed)
+
+    def get(self, task_id: int) -> TaskInfo | None:
+        return self._by_id.get(task_id)
+
+    def visible(self, task: TaskInfo, league: int) -> bool:
+        return task.min_league is not None and league >= task.min_league
+
+    def for_league(self, league: int) -> tuple[TaskInfo, ...]:
+        """
+        Задачи, видимые лиге, по возрастанию id.
+        :param league: номер лиги юзера
+        """
+        tasks = self._by_league.get(league)
+
+        if tasks is None:  # лига появилась после загрузки каталога
+            tasks = tuple(task for task in self._by_id.values() if self.visible(task, league))
+
+        return tasks
+
+    @staticmethod
+    def _task_info(row: dict[str, Any]) -> TaskInfo:
+        if row["condition_type"] == ConditionType.VISIT_LINK:
+            condition = {"url": row["url"]}
+        else:
+            condition = {"channel_id": row["channel_id"]}
+
+        if row["visibility_type"] == VisibilityType.ALLWAYS:
+            min_league = 0
+        elif row["visibility_type"] == VisibilityType.RANK and (rank := ranks.get(row["visibility_rank_id"])):
+            min_league = rank.league
+        else:
+            min_league = None
+
+        reward = {"coins": row["coins"], "inspirations": row["inspirations"], "replenishments": row["replenishments"]}
+        response = {"id": row["id"], "description": row["description"], "reward": reward, "condition": condition,
+                    "condition_type": row["condition_type"], "is_started": False}
+
+        return TaskInfo(id=row["id"], description=row["description"], coins=row["coins"],
+                        inspirations=row["inspirations"], replenishments=row["replenishments"],
+                        condition_type=row["condition_type"], condition=condition, min_league=min_league,
+                        response=response)
+
+    async def load(self) -> bool:
+        """
+        Загружает задачи из бд и атомарно подменяет каталог. Видимость считается по лигам реестра рангов,
+        поэтому загружать после ranks.load().
+        :return: изменился ли каталог
+        """
+        rows = await Task.all().order_by("id").values(**TASK_FIELDS)
+        by_id = {row["id"]: self._task_info(row) for row in rows}
+        by_league = {league: tuple(task for task in by_id.values() if self.visible(task, league))
+                     for league in ranks.leagues()}
+        changed = by_id != self._by_id
+
+        self._by_id, self._by_league = MappingProxyType(by_id), MappingProxyType(by_league)
+        self.version = md5(repr(rows).encode()).hexdigest()
+
+        return changed
+
+    async def reload(self) -> None:
+        """
+        Перезагружает каталог в текущем воркере, оповещает остальные воркеры и сбрасывает кеш списков задач.
+        """
+        await self.load()
+        await broker.publish(self.channel)
+        await invalidate_all("tasks")
+
+    def schedule_reload(self) -> None:
+        """
+        Перезагрузка после изменения задач через ORM. Изменения одной задачи затрагивают несколько моделей
+        (награда, условие, видимость), поэтому сигналы за RELOAD_DELAY объединяются в одну перезагрузку.
+        """
+        if self._pending_reload is None:
+            self._pending_reload = create_task(self._reload_later())
+
+    async def _reload_later(self) -> None:
+        await sleep(RELOAD_DELAY)
+        self._pending_reload = None
+
+        try:
+            await self.reload()
+        except Exception:
+            logger.exception("Не удалось перезагрузить каталог задач")
+
+    async def _on_changed(self, _: str) -> None:
+        try:
+            await self.load()
+        except Exception:
+            logger.exception("Не удалось перезагрузить каталог задач")
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            await sleep(TASK_CATALOG_REFRESH)
+
+            try:
+                previous = self.version
+
+                # Изменение в обход API находят все воркеры, кеш сбрасывает один: тот, кто первым поставил отметку
+                if await self.load() and await redis.set(f"{self.channel}:invalidated:{previous}:{self.version}",
+                                                         1, nx=True, ex=TASK_CATALOG_REFRESH):
+                    await invalidate_all("tasks")
+            except CancelledError:
+                raise
+            except Exception:
+                logger.exception("Не удалось обновить каталог задач")
+
+    def start_refresher(self) -> None:
+        if self._refresher is None:
+            self._refresher = create_task(self._refresh_forever())
+
+    async def stop_refresher(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+
+task_catalog = TaskCatalog()
+
+
+@post_save(Task, InstantReward, Condition, VisitLinkCondition, TgChannelCondition, Visibility, RankVisibility)
+async def _on_task_saved(sender, instance, created: bool, using_db, update_fields) -> None:
+    task_catalog.schedule_reload()
+
+
+@post_delete(Task, InstantReward, Condition, VisitLinkCondition, TgChannelCondition, Visibility, RankVisibility)
+async def _on_task_deleted(sender, instance, using_db) -> None:
+    task_catalog.schedule_reload()
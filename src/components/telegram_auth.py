@@ -0,0 +1,77 @@
+import hmac
+from hashlib import sha256
+from operator import itemgetter
+from re import compile as re_compile
+from time import time
+from urllib.parse import parse_qsl
+from aiogram.utils.web_app import WebAppInitData, parse_webapp_init_data
+from components.lru import TTLCache
+
+_HASH_RE = re_compile(r"(?:^|&)hash=([0-9a-fA-F]{64})(?:&|$)")
+
+
+class InitDataVerifier:
+    """
+    Проверка window.Telegram.WebApp.initData с кешем уже проверенных строк.
+    Секрет из токена бота вычисляется один раз на процесс, а разобранный WebAppInitData
+    кешируется по hash из init data, пока auth_date не слишком старый.
+    """
+
+    def __init__(self, token: str, maxsize: int, ttl: float, max_age: float) -> None:
+        """
+        :param token: токен бота
+        :param maxsize: максимальное количество закешированных init data
+        :param ttl: время жизни записи в кеше в секундах
+        :param max_age: максимальный возраст auth_date в секундах, после которого init data больше не кешируется
+        """
+        self.max_age = max_age
+        self._secret = hmac.new(key=b"WebAppData", msg=token.encode(), digestmod=sha256).digest()
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def check_signature(self, init_data: str) -> bool:
+        """
+        То же, что aiogram check_webapp_signature, но с заранее вычисленным секретом.
+        :param init_data: строка init data
+        """
+        try:
+            parsed_data = dict(parse_qsl(init_data, strict_parsing=True))
+        except ValueError:
+            return False
+
+        hash_ = parsed_data.pop("hash", None)
+
+        if hash_ is None:
+            return False
+
+        data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(parsed_data.items(), key=itemgetter(0)))
+        calculated_hash = hmac.new(key=self._secret, msg=data_check_string.encode(), digestmod=sha256).hexdigest()
+
+        return hmac.compare_digest(calculated_hash, hash_)
+
+    def parse(self, init_data: str) -> WebAppInitData:
+        """
+        Валидирует init data и возвращает WebAppInitData, бросает ValueError, если данные не валидны.
+        :param init_data: строка init data
+        """
+        match = _HASH_RE.search(init_data)
+
+        if match is not None:
+            cached = self._cache.get(match.group(1))
+
+            # Сравниваем строку целиком, иначе можно было бы подменить данные, оставив чужой hash
+            if cached is not None and cached[0] == init_data:
+                return cached[1]
+
+        if not self.check_signature(init_data):
+            raise ValueError("Invalid init data signature")
+
+        parsed = parse_webapp_init_data(init_data)
+        ttl = min(self._cache.ttl, self.max_age - (time() - parsed.auth_date.timestamp()))
+
+        if match is not None and ttl > 0:
+            self._cache.set(match.group(1), (init_data, parsed), ttl=ttl)
+
+        return parsed
+
+    def clear(self) -> None:
+        self._cache.clear()
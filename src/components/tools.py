@@ -1,61 +1,38 @@
-from datetime import timedelta, datetime
-from aiogram.utils.web_app import safe_parse_webapp_init_data, WebAppInitData
-from fastapi import HTTPException, Security
+from datetime import datetime
+from functools import cache
+from hmac import compare_digest
+from typing import Annotated, Callable, Awaitable, Any
+from aiogram.utils.web_app import WebAppInitData
+from fastapi import HTTPException, Security, Depends
 from fastapi.security import APIKeyHeader
 from httpx import Response
 from pytz import timezone
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND
-from config import TOKEN
-from models import User, Reward, Task, RankVisibility, RewardType, VisibilityType
-from better_profanity import profanity
-from spellchecker import SpellChecker
-
-
-async def get_daily_reward(user: User) -> None:
-    """
-    Функция для получения награды за серию авторизаций в игре.
-    :param user: User авторизовавшегося юзера с "activity"
-    """
-    dt_after_get_rw = datetime.fromisoformat(user.activity.last_daily_reward.isoformat()).replace(tzinfo=timezone("Europe/Moscow"))
-    dt_last_login = datetime.fromisoformat(user.activity.last_login_date.isoformat()).replace(tzinfo=timezone("Europe/Moscow"))
-
-    time_d_after_get_reward = datetime.now(tz=timezone("Europe/Moscow")) - dt_after_get_rw
-    time_d_after_last_login = datetime.now(tz=timezone("Europe/Moscow")) - dt_last_login
-
-    if timedelta(days=2) > time_d_after_get_reward > timedelta(days=1):
-        user.activity.active_days += 1
-        user.activity.last_daily_reward = datetime.now(tz=timezone("Europe/Moscow"))
-
-        match user.activity.active_days:
-            case 1:
-                await Reward.create(type=RewardType.LAUNCHES_SERIES, user_id=user.id, amount=500)
-            case 2:
-                await Reward.create(type=RewardType.LAUNCHES_SERIES, user_id=user.id, amount=1000)
-            case 3:
-                await Reward.create(type=RewardType.LAUNCHES_SERIES, user_id=user.id, amount=1000,
-                                    inspirations=1)
-            case 4:
-                await Reward.create(type=RewardType.LAUNCHES_SERIES, user_id=user.id, amount=1000,
-                                    inspirations=1, replenishments=1)
-            case 5:
-                await Reward.create(type=RewardType.LAUNCHES_SERIES, user_id=user.id, amount=1000,
-                                    inspirations=2, replenishments=1)
-            case 6:
-                await Reward.create(type=RewardType.LAUNCHES_SERIES, user_id=user.id, amount=5000,
-                                    inspirations=2, replenishments=2)
-            case 7:
-                await Reward.create(type=RewardType.LAUNCHES_SERIES, user_id=user.id, amount=10000,
-                                    inspirations=2, replenishments=2)
-            case _:
-                await Reward.create(type=RewardType.LAUNCHES_SERIES, user_id=user.id, amount=10000,
-                                    inspirations=2, replenishments=2)
-
-    elif timedelta(days=2) <= time_d_after_last_login:
-        user.activity.active_days = 0
-        user.activity.last_daily_reward = datetime.now(tz=timezone("Europe/Moscow"))
-
-    user.activity.last_login_date = datetime.now(tz=timezone("Europe/Moscow"))
-    await user.activity.save()
+from tortoise import connections
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+from components.cache import invalidate
+from components.leaderboard import leaderboard
+from components.members import registered_users
+from components.ranks import ranks
+from components.telegram_auth import InitDataVerifier
+from config import TOKEN, INIT_DATA_CACHE_SIZE, INIT_DATA_CACHE_TTL, INIT_DATA_CACHE_MAX_AGE, METRICS_TOKEN, \
+    REFERRAL_MINING_INCOME, INVITE_FRIENDS_REWARDS
+from models import User, Reward, RewardType, Stats
+
+init_data_verifier = InitDataVerifier(token=TOKEN, maxsize=INIT_DATA_CACHE_SIZE, ttl=INIT_DATA_CACHE_TTL,
+                                      max_age=INIT_DATA_CACHE_MAX_AGE)
+
+# Связи User, которые можно подгрузить одним JOIN (только FK и OneToOne, без обратных FK)
+USER_RELATIONS = frozenset(("rank", "stats", "activity", "referrer", "leader_place"))
+
+MINING_REFERRAL_SQL = """
+INSERT INTO "reward" ("user_id", "type", "amount", "inspirations", "replenishments")
+SELECT "income"."user_id", 'mining_referral', "income"."amount", 0, 0
+FROM unnest($1::BIGINT[], $2::BIGINT[]) AS "income" ("user_id", "amount")
+ON CONFLICT ("user_id", "type") WHERE "type" = 'mining_referral'
+DO UPDATE SET "amount" = "reward"."amount" + EXCLUDED."amount"
+"""
 
 
 async def get_referral_reward(lead: User, referral_code: str) -> None:
@@ -67,89 +44,141 @@ async def get_referral_reward(lead: User, referral_code: str) -> None:
     referrer = await User.filter(referral_code=referral_code).select_related("stats").first()
     if referrer:
         lead.referrer_id = referrer.id
+        lead.referrer_path = referrer_path(referrer)
         await lead.save()
 
         referrer.stats.invited_friends += 1
-        await referrer.stats.save()
+        await referrer.stats.save(update_fields=["invited_friends"])
 
-        match referrer.stats.invited_friends:
-            case 1:
-                await Reward.create(type=RewardType.INVITE_FRIENDS, user_id=referrer.id, amount=2000)
-            case 5:
-                await Reward.create(type=RewardType.INVITE_FRIENDS, user_id=referrer.id, amount=5000)
-            case 100:
-                await Reward.create(type=RewardType.INVITE_FRIENDS, user_id=referrer.id, amount=50000)
-            case 1000:
-                await Reward.create(type=RewardType.INVITE_FRIENDS, user_id=referrer.id, amount=250000)
+        amount = INVITE_FRIENDS_REWARDS.get(referrer.stats.invited_friends)
+        if amount is not None:
+            await Reward.create(type=RewardType.INVITE_FRIENDS, user_id=referrer.id, amount=amount)
 
+        await invalidate(referrer.id, "profile", "rewards")
 
-async def send_referral_mining_reward(extraction: int, referrer_id: int = None) -> None:
+
+def referrer_path(referrer: User) -> str:
     """
-    Отправка процентов с добычи по майнингу реферреру.
-    :param referrer_id: айди реферрера
-    :param extraction: добыча с майнинга реферала
+    Реферальная цепочка лида: реферрер и его предки, не больше len(REFERRAL_MINING_INCOME) уровней.
+    Юзеры, зарегистрированные ботом, не имеют referrer_path, для них предок берется из referrer_id.
+    :param referrer: объект модели User реферрера с полями referrer_path и referrer_id
     """
+    parents = referrer.referrer_path if referrer.referrer_path is not None else str(referrer.referrer_id or "")
+    ancestors = [str(referrer.id), *parents.split(",")]
+    return ",".join(filter(None, ancestors[:len(REFERRAL_MINING_INCOME)]))
+
 
+async def send_referral_mining_reward(user: User, extraction: int) -> None:
+    """
+    Отправка процентов с добычи по майнингу предкам по реферальной цепочке. Все уровни начисляются одним
+    INSERT ... ON CONFLICT DO UPDATE (amount = amount + x) по уникальному индексу (user_id, type).
+    :param user: объект модели User реферала
+    :param extraction: добыча с майнинга реферала
+    """
     # Если нет реферрера то не выполняем
-    print("mining refererer id" + str(referrer_id))
-    if referrer_id is None:
+    if user.referrer_id is None:
         return
 
-    referrer_rw = await Reward.filter(user_id=referrer_id, type=RewardType.MINING_REFERRAL).first()
-    income_5_perc = int(extraction * 0.05)
+    # Цепочку юзеров, зарегистрированных до появления referrer_path, достраиваем один раз
+    if user.referrer_path is None:
+        referrer = await User.filter(id=user.referrer_id).only("id", "referrer_path", "referrer_id").get()
+        user.referrer_path = referrer_path(referrer)
+        await User.filter(id=user.id).update(referrer_path=user.referrer_path)
+
+    ancestors = [int(ancestor_id) for ancestor_id in user.referrer_path.split(",")]
+    incomes = [int(extraction * share) for share in REFERRAL_MINING_INCOME[:len(ancestors)]]
+    connection = connections.get("api")
 
-    if referrer_rw is not None:
-        referrer_rw.amount += income_5_perc
-        await referrer_rw.save()
+    if connection.capabilities.dialect == "postgres":
+        await connection.execute_query(MINING_REFERRAL_SQL, [ancestors, incomes])
     else:
-        await Reward.create(user_id=referrer_id, type=RewardType.MINING_REFERRAL, amount=income_5_perc)
+        for ancestor_id, income in zip(ancestors, incomes):
+            reward, created = await Reward.get_or_create(user_id=ancestor_id, type=RewardType.MINING_REFERRAL,
+                                                         defaults={"amount": income})
+            if not created:
+                await Reward.filter(id=reward.id).update(amount=F("amount") + income)
 
-    referrer_upper = await User.filter(id=referrer_id).first()
-    referrer_upper_id = referrer_upper.referrer_id
+    for ancestor_id in ancestors:
+        await invalidate(ancestor_id, "rewards")
 
-    # Если у реферрера нет реферрера то не выполняем
-    if referrer_upper_id is None:
-        return
 
-    referrer_upper_rw = await Reward.filter(user_id=referrer_upper_id, type=RewardType.MINING_REFERRAL).first()
-    income_1_perc = int(extraction * 0.01)
+def regenerate_energy(energy: float, as_of: datetime, energy_per_sec: float, max_energy: float,
+                      now: datetime | None = None) -> float:
+    """
+    Энергия на момент now. В бд хранится пара (энергия, время, на которое она посчитана), регенерация
+    вычисляется при чтении, поэтому писать энергию нужно только при ее расходе или изменении бустером.
+    :param energy: энергия на момент as_of (Stats.energy)
+    :param as_of: время, на которое посчитана energy (Activity.last_sync_energy)
+    :param energy_per_sec: регенерация ранга в секунду
+    :param max_energy: максимум энергии ранга
+    :param now: момент расчета, по умолчанию текущее время
+    """
+    now = now or datetime.now(tz=timezone("Europe/Moscow"))
+    secs_from_last_sync = max((now - as_of).total_seconds(), 0)
+
+    return min(energy + secs_from_last_sync * energy_per_sec, max_energy)
 
-    if referrer_upper_rw is not None:
-        referrer_upper_rw.amount += income_1_perc
-        await referrer_upper_rw.save()
-    else:
-        await Reward.create(user_id=referrer_upper_id, type=RewardType.MINING_REFERRAL, amount=income_1_perc)
 
+def current_energy(user: User, now: datetime | None = None) -> float:
+    """
+    Текущая энергия юзера без записи в бд.
+    :param user: объект модели User с включенными: activity, stats
+    :param now: момент расчета, по умолчанию текущее время
+    """
+    rank = ranks[user.rank_id]
+    return regenerate_energy(user.stats.energy, user.activity.last_sync_energy, rank.energy_per_sec,
+                             rank.max_energy, now)
 
-async def sync_energy(user: User) -> None:
+
+async def credit_stats(user_id: int, coins: int = 0, inspirations: int = 0, replenishments: int = 0,
+                       earned_week: bool = True, **fields: Any) -> None:
     """
-    Функция для синхронизации энергии. Обновляет дату синхронизации и меняет кол-во энергии.
-    :param user: объект модели User с включенными: activity, stats, rank
+    Начисление (или списание отрицательными значениями) на счет юзера одним относительным UPDATE
+    (coins = coins + x), чтобы не затирать параллельные начисления, в т.ч. сброс кликов из Redis.
+    Недельные монеты добавляются в лидерборд после коммита.
+    :param user_id: chat_id юзера
+    :param coins: монеты
+    :param inspirations: бустеры вдохновения
+    :param replenishments: бустеры прилива
+    :param earned_week: учитывать монеты в earned_week_coins (лидерборд недели)
+    :param fields: абсолютные значения других полей Stats
     """
-    dt_last_sync_energy = datetime.fromisoformat(user.activity.last_sync_energy.isoformat())
-    secs_from_last_sync = (datetime.now(tz=timezone("Europe/Moscow")) - dt_last_sync_energy).seconds
+    if not (coins and earned_week):
+        await update_stats(user_id, coins, inspirations, replenishments, earned_week, **fields)
+        return
+
+    async with in_transaction("api"):
+        generation = await update_stats(user_id, coins, inspirations, replenishments, **fields)
+
+    await leaderboard.add(user_id, coins, generation)
 
-    accumulated_energy = max(secs_from_last_sync, 1) * user.rank.energy_per_sec
-    user.stats.energy += accumulated_energy
 
-    if user.stats.energy > user.rank.max_energy:
-        user.stats.energy = user.rank.max_energy
+async def update_stats(user_id: int, coins: int = 0, inspirations: int = 0, replenishments: int = 0,
+                       earned_week: bool = True, **fields: Any) -> int | None:
+    """
+    UPDATE stats из credit_stats без начисления в лидерборд, для транзакций с другими запросами. Вызывать
+    в транзакции, после ее коммита недельные монеты добавить leaderboard.add(user_id, coins, generation).
+    :return: generation для leaderboard.add или None, если недельных монет нет
+    """
+    if coins:
+        fields["coins"] = F("coins") + coins
 
-    user.activity.last_sync_energy = datetime.now(tz=timezone("Europe/Moscow"))
+        if earned_week:
+            fields["earned_week_coins"] = F("earned_week_coins") + coins
 
-    await user.stats.save()
-    await user.activity.save()
+    if inspirations:
+        fields["inspirations"] = F("inspirations") + inspirations
 
+    if replenishments:
+        fields["replenishments"] = F("replenishments") + replenishments
 
-async def check_task_visibility(task: Task, user: User):
-    if task.visibility.type == VisibilityType.RANK:
-        rank_visibility = await RankVisibility.get(visibility=task.visibility)
-        return user.rank.league >= rank_visibility.rank.league
+    if fields:
+        await Stats.filter(user_id=user_id).update(**fields)
 
-    elif task.visibility.type == VisibilityType.ALLWAYS:
-        return True
+    if coins and earned_week:
+        return await leaderboard.generation(user_id)
 
-    return False
+    return None
 
 
 async def assert_status_code(response: Response, status_code: int) -> None:
@@ -172,10 +201,9 @@ async def validate_telegram_hash(
     """
     # Валидируем init data tg юзера
     try:
-        init_data = safe_parse_webapp_init_data(token=TOKEN, init_data=x_telegram_init_data)
-        user = await User.filter(id=init_data.user.id).first()
+        init_data = init_data_verifier.parse(x_telegram_init_data)
 
-        if user:
+        if await registered_users.contains(init_data.user.id):
             return init_data
         else:
             raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Для начала работы нажмите /start.")
@@ -184,16 +212,52 @@ async def validate_telegram_hash(
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Данные юзера Telegram не валидны.")
 
 
-async def ai_msg_base_check(question: str) -> None:
+async def validate_metrics_token(
+        x_metrics_token: str = Security(APIKeyHeader(name="X-Metrics-Token", auto_error=False))) -> None:
+    """
+    Fastapi Depend для служебных эндпойнтов: заголовок должен совпадать с METRICS_TOKEN. Без METRICS_TOKEN
+    эндпойнты недоступны.
+    :param x_metrics_token: заголовок с токеном
+    """
+    if METRICS_TOKEN is None or x_metrics_token is None or not compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+
+
+async def validate_bot_token(
+        x_bot_token: str = Security(APIKeyHeader(name="X-Bot-Token", auto_error=False))) -> None:
+    """
+    Fastapi Depend для эндпойнтов, которые вызывает бот: заголовок должен совпадать с токеном бота.
+    :param x_bot_token: заголовок с токеном
+    """
+    if x_bot_token is None or not compare_digest(x_bot_token, TOKEN):
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+
+
+def user_loader(*relations: str) -> Callable[..., Awaitable[User]]:
     """
-    Функция для базовых проверок вопроса на английском (длина, корректность ввода, мат).
-    :param question: вопрос, заданный юзером через бот
+    Фабрика Fastapi Depend, возвращающего юзера из init_data с подгруженными одним JOIN связями relations.
+    Для одного набора связей всегда возвращается одна и та же функция, поэтому Fastapi кеширует результат
+    на весь запрос, и юзер не запрашивается повторно в разных зависимостях.
+    :param relations: связи из USER_RELATIONS ("rank", "stats", "activity", ...)
+    :return:
     """
-    profanity.load_censor_words(whitelist_words=["god"])  # подгружаем список нецензурных слов
-    spell = SpellChecker(language='en')  # спелл объект для проверки орфографии
-    corrects_words = [spell.correction(word) for word in question.split()]  # список автооткорректированных слов
+    unknown = set(relations) - USER_RELATIONS
+
+    if unknown:
+        raise ValueError(f"Связи {unknown} нельзя подгрузить через select_related.")
+
+    return _user_loader(tuple(sorted(set(relations))))
+
+
+@cache
+def _user_loader(relations: tuple[str, ...]) -> Callable[..., Awaitable[User]]:
+    async def load_user(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> User:
+        user = await User.filter(id=init_data.user.id).select_related(*relations).first()
+
+        if user is None:
+            await registered_users.discard(init_data.user.id)
+            raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Для начала работы нажмите /start.")
+
+        return user
 
-    assert None not in corrects_words, "❓ Я не могу прочесть твое заклинание, послушник мой."
-    assert len(question) >= 10, "🌀 Слишком короткое сообщение, аколит."
-    assert len(question.split()) >= 2, "👁‍🗨 Слишком мало слов в сообщении, аколит."
-    assert "*" not in profanity.censor(question), "💢 Послушник мой, нельзя использовать мат в заклинаниях!"
+    return load_user
@@ -0,0 +1,223 @@
+import logging
+from asyncio import Task, create_task, get_running_loop, shield, sleep, wait_for, TimeoutError as AsyncTimeoutError
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from time import perf_counter
+from typing import Any, Protocol
+from unicodedata import normalize as unicode_normalize
+from deep_translator import GoogleTranslator
+from redis.exceptions import RedisError
+from components.lru import TTLCache
+from components.redis_db import redis
+from config import TRANSLATION_THREADS, TRANSLATION_TIMEOUT, TRANSLATION_CACHE_SIZE, TRANSLATION_LOCAL_TTL, \
+    TRANSLATION_CACHE_TTL, TRANSLATION_BACKEND
+
+logger = logging.getLogger(__name__)
+
+
+class TranslationError(Exception):
+    """
+    Переводчик не ответил за TRANSLATION_TIMEOUT или вернул ошибку.
+    """
+
+
+class TranslationBackend(Protocol):
+    name: str
+
+    async def translate(self, text: str, target: str) -> str:
+        ...
+
+
+class GoogleBackend:
+    """
+    deep_translator.GoogleTranslator в ограниченном пуле потоков (запрос блокирующий). deep_translator не задает
+    таймаут HTTP запроса, поэтому зависший запрос занимает поток пула и после таймаута в Translator.
+    """
+    name = "google"
+
+    def __init__(self, threads: int) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="translation")
+
+    @staticmethod
+    def _translate(text: str, target: str) -> str:
+        # GoogleTranslator хранит параметры запроса в объекте, поэтому на каждый перевод свой
+        return GoogleTranslator(source="auto", target=target).translate(text)
+
+    async def translate(self, text: str, target: str) -> str:
+        return await get_running_loop().run_in_executor(self._pool, self._translate, text, target)
+
+
+class OfflineBackend:
+    """
+    Переводчик без сети для тестов и бенчмарков: возвращает перевод из словаря или текст без изменений
+    через latency секунд.
+    """
+    name = "offline"
+
+    def __init__(self, translations: dict[str, str] | None = None, latency: float = 0) -> None:
+        """
+        :param translations: нормализованный текст -> перевод
+        :param latency: имитация времени ответа переводчика, сек
+        """
+        self.translations = translations or {}
+        self.latency = latency
+        self.calls = 0
+
+    async def translate(self, text: str, target: str) -> str:
+        self.calls += 1
+
+        if self.latency:
+            await sleep(self.latency)
+
+        return self.translations.get(text, text)
+
+
+def normalize(text: str) -> str:
+    """
+    Ключ кеша: NFKC, пробелы схлопнуты, по краям обрезаны. Регистр сохраняется - он может менять перевод.
+    """
+    return " ".join(unicode_normalize("NFKC", text).split())
+
+
+class Translator:
+    """
+    Перевод с кешем из двух уровней: LRU в памяти воркера и Redis, общий для всех воркеров. Одинаковые
+    параллельные запросы в воркере объединяются в один запрос к переводчику. Ошибки не кешируются.
+    """
+
+    def __init__(self, backend: TranslationBackend, maxsize: int, local_ttl: float, ttl: int, timeout: float,
+                 prefix: str = "translation") -> None:
+        """
+        :param backend: переводчик
+        :param maxsize: максимальное количество переводов в памяти воркера
+        :param local_ttl: время жизни перевода в памяти воркера, сек
+        :param ttl: время жизни перевода в Redis, сек
+        :param timeout: время ожидания переводчика, сек
+        :param prefix: префикс ключей в Redis ({prefix}:{язык}:{md5 текста}), свой у тестов и бенчмарков
+        """
+        self.backend = backend
+        self.prefix = prefix
+        self.local = TTLCache(maxsize=maxsize, ttl=local_ttl)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._pending: dict[tuple[str, str], Task] = {}
+        self.local_hits = self.remote_hits = self.coalesced = 0
+        self.upstream_calls = self.upstream_errors = self.upstream_timeouts = 0
+        self.upstream_time = self.upstream_max_time = 0.0
+
+    def use(self, backend: TranslationBackend) -> None:
+        """
+        Подменяет переводчик и очищает кеш воркера (кеш в Redis общий и не очищается).
+        """
+        self.backend = backend
+        self.local.clear()
+
+    async def translate(self, text: str, target: str = "en") -> str:
+        """
+        :param text: текст на любом языке
+        :param target: язык перевода
+        :raise TranslationError: переводчик не ответил за timeout или вернул ошибку
+        """
+        text = normalize(text)
+
+        if not text:
+            return text
+
+        key = (target, text)
+        translation = self.local.get(key)
+
+        if translation is not None:
+            self.local_hits += 1
+            return translation
+
+        task = self._pending.get(key)
+
+        if task is None:
+            task = self._pending[key] = create_task(self._fetch(key))
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # shield: отмена одного из ожидающих запросов не отменяет перевод для остальных
+        return await shield(task)
+
+    async def _fetch(self, key: tuple[str, str]) -> str:
+        target, text = key
+        redis_key = f"{self.prefix}:{target}:{md5(text.encode()).hexdigest()}"
+
+        try:
+            cached = await redis.get(redis_key)
+        except RedisError:
+            logger.warning("Не удалось прочитать перевод из Redis", exc_info=True)
+            cached = None
+
+        if cached is not None:
+            self.remote_hits += 1
+            translation = cached.decode()
+            self.local.set(key, translation)
+            return translation
+
+        translation = await self._upstream(text, target)
+        self.local.set(key, translation)
+
+        try:
+            await redis.set(redis_key, translation, ex=self.ttl)
+        except RedisError:
+            logger.warning("Не удалось записать перевод в Redis", exc_info=True)
+
+        return translation
+
+    async def _upstream(self, text: str, target: str) -> str:
+        self.upstream_calls += 1
+        start = perf_counter()
+
+        try:
+            return await wait_for(self.backend.translate(text, target), timeout=self.timeout)
+        except AsyncTimeoutError:
+            self.upstream_timeouts += 1
+            logger.warning("Перевод не получен за %s сек", self.timeout)
+            raise TranslationError(text)
+        except Exception as e:
+            self.upstream_errors += 1
+            logger.warning("Ошибка перевода", exc_info=True)
+            raise TranslationError(text) from e
+        finally:
+            elapsed = perf_counter() - start
+            self.upstream_time += elapsed
+            self.upstream_max_time = max(self.upstream_max_time, elapsed)
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Счетчики воркера с момента запуска. hit_rate - доля запросов без обращения к переводчику.
+        """
+        requests = self.local_hits + self.remote_hits + self.coalesced + self.upstream_calls
+
+        return {
+            "backend": self.backend.name,
+            "requests": requests,
+            "hit_rate": round(1 - self.upstream_calls / requests, 4) if requests else None,
+            "local": {"hits": self.local_hits, "entries": len(self.local)},
+            "remote": {"hits": self.remote_hits},
+            "coalesced": self.coalesced,
+            "upstream": {"calls": self.upstream_calls, "errors": self.upstream_errors,
+                         "timeouts": self.upstream_timeouts,
+                         "avg_ms": round(self.upstream_time / self.upstream_calls * 1000, 1)
+                         if self.upstream_calls else None,
+                         "max_ms": round(self.upstream_max_time * 1000, 1)},
+        }
+
+
+translator = Translator(
+    backend=OfflineBackend() if TRANSLATION_BACKEND == "offline" else GoogleBackend(threads=TRANSLATION_THREADS),
+    maxsize=TRANSLATION_CACHE_SIZE, local_ttl=TRANSLATION_LOCAL_TTL, ttl=TRANSLATION_CACHE_TTL,
+    timeout=TRANSLATION_TIMEOUT)
+
+
+async def translate(text: str, target: str = "en") -> str:
+    """
+    Перевод через общий translator воркера.
+    :param text: текст на любом языке
+    :param target: язык перевода
+    :raise TranslationError: переводчик не ответил за TRANSLATION_TIMEOUT или вернул ошибку
+    """
+    return await translator.translate(text, target)
@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime
+from redis.exceptions import RedisError
+from tortoise import connections
+from tortoise.signals import post_delete
+from components.redis_db import redis
+from models import User, UserTask
+
+logger = logging.getLogger(__name__)
+
+STATE_TTL = 3600  # время жизни состояния юзера в Redis после последнего обращения, сек
+
+# Бит 0 ключа started - признак того, что состояние загружено из бд (id задач начинаются с 1). Без него
+# ключ создан SETBIT-ом до загрузки, содержит не все задачи и читается из бд.
+# KEYS: [1] started, [2] completed; ARGV: [1] 1 - completed, 0 - started, [2] id задачи, [3] STATE_TTL
+SET_BIT_SCRIPT = """
+redis.call('SETBIT', KEYS[tonumber(ARGV[1]) + 1], ARGV[2], 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+"""
+
+# Загруженное из бд состояние объединяется с битами, которые отметили start/complete после чтения бд
+# (перезапись вернула бы такие задачи в доступные до истечения STATE_TTL).
+# KEYS: [1] started, [2] completed, [3] временный ключ; ARGV: [1] started из бд, [2] completed из бд, [3] STATE_TTL
+LOAD_SCRIPT = """
+redis.call('SET', KEYS[3], ARGV[1])
+redis.call('BITOP', 'OR', KEYS[1], KEYS[1], KEYS[3])
+redis.call('SET', KEYS[3], ARGV[2])
+redis.call('BITOP', 'OR', KEYS[2], KEYS[2], KEYS[3])
+redis.call('DEL', KEYS[3])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return {redis.call('GET', KEYS[1]), redis.call('GET', KEYS[2])}
+"""
+
+START_TASK_SQL = """
+INSERT INTO "usertask" ("user_id", "task_id", "create_time") VALUES ($1, $2, $3)
+ON CONFLICT ("user_id", "task_id") DO NOTHING RETURNING "id"
+"""
+
+
+def _to_bits(ids: set[int]) -> bytes:
+    bits = bytearray(max(ids, default=0) // 8 + 1)
+
+    for id_ in ids:
+        bits[id_ // 8] |= 0x80 >> id_ % 8  # порядок бит как у SETBIT: бит 0 - старший бит первого байта
+
+    return bytes(bits)
+
+
+def _from_bits(bits: bytes) -> set[int]:
+    return {index * 8 + bit for index, byte in enumerate(bits) if byte for bit in range(8) if byte & (0x80 >> bit)}
+
+
+class UserTasks:
+    """
+    Взятые и выполненные задачи юзеров: два Redis bitset на юзера (бит = id задачи), загружаются из бд
+    одним запросом при первом обращении. Чтение не зависит от количества строк UserTask, запись - одна
+    условная вставка или обновление в бд. Уникальность (user_id, task_id) гарантирует индекс в бд.
+    """
+    started_key = "user_tasks:started:{}"
+    completed_key = "user_tasks:completed:{}"
+    load_key = "user_tasks:load:{}"
+
+    def __init__(self) -> None:
+        self._set_bit = redis.register_script(SET_BIT_SCRIPT)
+        self._load_script = redis.register_script(LOAD_SCRIPT)
+
+    def _keys(self, user_id: int) -> list[str]:
+        return [self.started_key.format(user_id), self.completed_key.format(user_id)]
+
+    async def get(self, user_id: int) -> tuple[set[int], set[int]]:
+        """
+        :param user_id: chat_id юзера
+        :return: (id взятых и не выполненных задач, id выполненных задач)
+        """
+        keys = self._keys(user_id)
+
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                started, completed = await pipe.get(keys[0]).get(keys[1]).execute()
+        except RedisError:
+            logger.warning("Не удалось прочитать задачи юзера %s из Redis", user_id, exc_info=True)
+            started = None
+
+        if started and started[0] & 0x80:
+            return self._decode(started, completed)
+
+        return await self._load(user_id)
+
+    @staticmethod
+    def _decode(started: bytes, completed: bytes | None) -> tuple[set[int], set[int]]:
+        started_ids, completed_ids = _from_bits(started), _from_bits(completed or b"")
+        started_ids.discard(0)
+        return started_ids - completed_ids, completed_ids
+
+    async def _load(self, user_id: int) -> tuple[set[int], set[int]]:
+        rows = await UserTask.filter(user_id=user_id).values_list("task_id", "completed_time")
+        started_ids = {task_id for task_id, completed_time in rows if completed_time is None}
+        completed_ids = {task_id for task_id, completed_time in rows if completed_time is not None}
+
+        try:
+            started, completed = await self._load_script(
+                keys=[*self._keys(user_id), self.load_key.format(user_id)],
+                args=[_to_bits(started_ids | {0}), _to_bits(completed_ids), STATE_TTL])
+        except RedisError:
+            logger.warning("Не удалось записать задачи юзера %s в Redis", user_id, exc_info=True)
+            return started_ids, completed_ids
+
+        return self._decode(started, completed)
+
+    async def _mark(self, user_id: int, task_id: int, completed: bool) -> None:
+        try:
+            await self._set_bit(keys=self._keys(user_id), args=[int(completed), task_id, STATE_TTL])
+        except RedisError:  # состояние в Redis устарело, удаляем, чтобы оно загрузилось из бд заново
+            logger.warning("Не удалось отметить задачу юзера %s в Redis", user_id, exc_info=True)
+            await self.forget(user_id)
+
+    async def start(self, user_id: int, task_id: int, now: datetime) -> bool:
+        """
+        Берет задачу одной вставкой (повторная вставка игнорируется уникальным индексом).
+        :return: False, если задача уже была взята
+        """
+        connection = connections.get("api")
+
+        if connection.capabilities.dialect == "postgres":
+            created = (await connection.execute_query(START_TASK_SQL, [user_id, task_id, now]))[0] > 0
+        else:
+            created = (await UserTask.get_or_create(user_id=user_id, task_id=task_id))[1]
+
+        await self._mark(user_id, task_id, completed=False)  # и при повторе: восстанавливает бит после гонки
+
+        return created
+
+    async def complete(self, user_id: int, task_id: int, now: datetime) -> bool | None:
+        """
+        Отмечает взятую задачу выполненной одним условным обновлением.
+        :return: True - выполнена сейчас, False - уже была выполнена, None - задача не взята
+        """
+        if await UserTask.filter(user_id=user_id, task_id=task_id, completed_time__isnull=True) \
+                .update(completed_time=now):
+            await self._mark(user_id, task_id, completed=True)
+            return True
+
+        if await UserTask.exists(user_id=user_id, task_id=task_id):
+            await self._mark(user_id, task_id, completed=True)
+            return False
+
+        return None
+
+    async def forget(self, *user_ids: int) -> None:
+        try:
+            await redis.delete(*(key for user_id in user_ids for key in self._keys(user_id)))
+        except RedisError:
+            logger.warning("Не удалось удалить задачи юзеров из Redis", exc_info=True)
+
+
+user_tasks = UserTasks()
+
+
+@post_delete(User)
+async def _on_user_deleted(sender, instance: User, using_db) -> None:
+    await user_tasks.forget(instance.id)
@@ -0,0 +1,266 @@
+import fcntl
+import logging
+import os
+from asyncio import Task, create_task, get_running_loop, sleep, CancelledError
+from threading import Lock
+from time import perf_counter
+from typing import Any
+import numpy as np
+from config import VECTOR_INDEX_FLUSH, VECTOR_SEARCH_CHUNK
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.dtype("<f4")
+ID_DTYPE = np.dtype("<i8")
+MIN_CAPACITY = 1024  # начальный размер буфера новых векторов, строк
+
+
+def pack(vector: np.ndarray) -> bytes:
+    """
+    Вектор -> float32 little-endian для Question.embedding (4 байта на значение).
+    """
+    return np.asarray(vector, dtype=DTYPE).tobytes()
+
+
+def unpack(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=DTYPE)
+
+
+def normalized(vectors) -> np.ndarray:
+    """
+    Копия векторов (матрица float32 по строкам) единичной длины, нулевые векторы не меняются.
+    """
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    vectors /= norms
+    return vectors
+
+
+class VectorIndex:
+    """
+    Индекс эмбеддингов для поиска ближайших по косинусному сходству. Векторы нормализуются при добавлении,
+    поэтому сходство - скалярное произведение, а поиск пачки запросов - умножение матриц частями по chunk строк
+    индекса (память на запрос не зависит от размера индекса).
+
+    Векторы, записанные в файлы, читаются через memory map: страницы в кеше ОС общие для всех процессов
+    и не занимают память воркера. Новые векторы копятся в буфере в памяти и дописываются в файлы flush
+    (периодически после start и при stop). Файлы {path}.f32 (матрица float32 по строкам) и {path}.ids
+    (id int64) дописываются под flock, поэтому индекс может пополнять несколько процессов.
+    """
+
+    def __init__(self, path: str | None, dim: int, chunk: int = VECTOR_SEARCH_CHUNK) -> None:
+        """
+        :param path: путь к файлам индекса без расширения, None - индекс только в памяти
+        :param dim: размерность векторов
+        :param chunk: сколько строк индекса умножается на запросы за раз
+        """
+        self.path = path
+        self.dim = dim
+        self.chunk = chunk
+        self._lock = Lock()  # поиск выполняется в пуле потоков, добавление и flush - в event loop
+        self._base = np.empty((0, dim), DTYPE)  # векторы из файла (memmap)
+        self._base_ids = np.empty(0, ID_DTYPE)
+        self._tail = np.empty((MIN_CAPACITY, dim), DTYPE)  # новые векторы, еще не записанные в файл
+        self._tail_ids = np.empty(MIN_CAPACITY, ID_DTYPE)
+        self._size = 0  # заполненных строк в _tail
+        self._task: Task | None = None
+        self.searches = self.queries = self.flushes = 0
+        self.search_time = 0.0
+
+    def __len__(self) -> int:
+        return len(self._base_ids) + self._size
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * DTYPE.itemsize
+
+    def add(self, ids, vectors) -> None:
+        """
+        :param ids: id векторов
+        :param vectors: матрица (len(ids), dim)
+        """
+        ids = np.asarray(ids, dtype=ID_DTYPE)
+        vectors = normalized(vectors)
+
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Ожидалась матрица ({len(ids)}, {self.dim}), получена {vectors.shape}")
+
+        with self._lock:
+            end = self._size + len(ids)
+
+            if end > len(self._tail_ids):
+                # Новый буфер вместо resize: поиск в другом потоке может читать старый
+                capacity = max(end, 2 * len(self._tail_ids))
+                tail, tail_ids = np.empty((capacity, self.dim), DTYPE), np.empty(capacity, ID_DTYPE)
+                tail[:self._size], tail_ids[:self._size] = self._tail[:self._size], self._tail_ids[:self._size]
+                self._tail, self._tail_ids = tail, tail_ids
+
+            self._tail[self._size:end] = vectors
+            self._tail_ids[self._size:end] = ids
+            self._size = end
+
+    def search(self, queries, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        k ближайших векторов для каждого запроса пачки.
+        :param queries: матрица запросов (n, dim) или один вектор
+        :param k: количество ближайших
+        :return: id (n, k) и сходство (n, k) по убыванию сходства. Если в индексе меньше k векторов,
+        недостающие id равны -1, сходство -inf
+        """
+        start_time = perf_counter()
+        queries = normalized(queries)
+
+        with self._lock:
+            segments = ((self._base, self._base_ids), (self._tail[:self._size], self._tail_ids[:self._size]))
+
+        best_scores = np.full((len(queries), k), -np.inf, np.float32)
+        best_ids = np.full((len(queries), k), -1, ID_DTYPE)
+
+        for matrix, ids in segments:
+            for start in range(0, len(ids), self.chunk):
+                scores = queries @ matrix[start:start + self.chunk].T
+                chunk_ids = ids[start:start + self.chunk]
+
+                if scores.shape[1] > k:
+                    # argmax в ~15 раз быстрее argpartition, а k=1 - основной случай (поиск повторов)
+                    top = scores.argmax(axis=1)[:, None] if k == 1 else np.argpartition(scores, -k, axis=1)[:, -k:]
+                    scores, chunk_ids = np.take_along_axis(scores, top, axis=1), chunk_ids[top]
+                else:
+                    chunk_ids = np.broadcast_to(chunk_ids, scores.shape)
+
+                scores = np.concatenate((best_scores, scores), axis=1)
+                chunk_ids = np.concatenate((best_ids, chunk_ids), axis=1)
+                top = np.argpartition(scores, -k, axis=1)[:, -k:]
+                best_scores, best_ids = np.take_along_axis(scores, top, axis=1), np.take_along_axis(chunk_ids, top, 1)
+
+        order = np.argsort(-best_scores, axis=1)
+        self.searches += 1
+        self.queries += len(queries)
+        self.search_time += perf_counter() - start_time
+
+        return np.take_along_axis(best_ids, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    async def search_async(self, queries, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        search в пуле потоков: умножение матриц не держит GIL и не останавливает event loop.
+        """
+        return await get_running_loop().run_in_executor(None, self.search, queries, k)
+
+    def _paths(self) -> tuple[str, str, str]:
+        return f"{self.path}.f32", f"{self.path}.ids", f"{self.path}.lock"
+
+    def _map(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Отображает в память записанные строки файлов индекса (вместе с дописанными другими процессами).
+        """
+        vectors_path, ids_path, _ = self._paths()
+
+        try:
+            rows = min(os.path.getsize(vectors_path) // self._row_bytes, os.path.getsize(ids_path) // ID_DTYPE.itemsize)
+        except FileNotFoundError:
+            rows = 0
+
+        if not rows:
+            return np.empty((0, self.dim), DTYPE), np.empty(0, ID_DTYPE)
+
+        return (np.memmap(vectors_path, dtype=DTYPE, mode="r", shape=(rows, self.dim)),
+                np.fromfile(ids_path, dtype=ID_DTYPE, count=rows))
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+
+        base, base_ids = self._map()
+
+        with self._lock:
+            self._base, self._base_ids = base, base_ids
+
+        logger.info("Индекс векторов %s: %s строк", self.path, len(base_ids))
+
+    def flush(self, if_empty: bool = False) -> int:
+        """
+        Дописывает новые векторы в файлы и перечитывает файлы.
+        :param if_empty: записать, только если файлы пусты (восстановление индекса несколькими процессами
+        одновременно), иначе новые векторы отбрасываются
+        :return: количество записанных строк
+        """
+        if self.path is None:
+            return 0
+
+        with self._lock:
+            size = self._size
+            vectors, ids = self._tail[:size], self._tail_ids[:size]
+
+        vectors_path, ids_path, lock_path = self._paths()
+        os.makedirs(os.path.dirname(vectors_path) or ".", exist_ok=True)
+        written = 0
+
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            with open(vectors_path, "ab") as vectors_file, open(ids_path, "ab") as ids_file:
+                rows = min(os.fstat(vectors_file.fileno()).st_size // self._row_bytes,
+                           os.fstat(ids_file.fileno()).st_size // ID_DTYPE.itemsize)
+                # Недописанный хвост после падения процесса посреди flush
+                vectors_file.truncate(rows * self._row_bytes)
+                ids_file.truncate(rows * ID_DTYPE.itemsize)
+
+                if size and not (if_empty and rows):
+                    vectors_file.write(vectors.tobytes())
+                    vectors_file.flush()
+                    ids_file.write(ids.tobytes())
+                    written = size
+
+        base, base_ids = self._map()
+
+        with self._lock:
+            remaining = self._size - size
+            capacity = max(MIN_CAPACITY, 2 * remaining)
+            tail, tail_ids = np.empty((capacity, self.dim), DTYPE), np.empty(capacity, ID_DTYPE)
+            tail[:remaining], tail_ids[:remaining] = self._tail[size:self._size], self._tail_ids[size:self._size]
+            self._base, self._base_ids = base, base_ids
+            self._tail, self._tail_ids, self._size = tail, tail_ids, remaining
+
+        self.flushes += 1
+        return written
+
+    async def _flush_forever(self, period: float) -> None:
+        while True:
+            await sleep(period)
+
+            try:
+                await get_running_loop().run_in_executor(None, self.flush)
+            except CancelledError:
+                raise
+            except Exception:
+                logger.exception("Не удалось записать индекс векторов %s", self.path)
+
+    def start(self, period: float = VECTOR_INDEX_FLUSH) -> None:
+        if self._task is None and self.path is not None:
+            self._task = create_task(self._flush_forever(period))
+
+    async def stop(self) -> None:
+        """
+        Останавливает периодическую запись и записывает новые векторы напоследок.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        try:
+            self.flush()
+        except OSError:
+            logger.exception("Не удалось записать индекс векторов %s", self.path)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "rows": len(self),
+            "mapped": len(self._base_ids),
+            "unflushed": self._size,
+            "dim": self.dim,
+            "searches": self.searches,
+            "queries": self.queries,
+            "avg_search_ms": round(self.search_time / self.searches * 1000, 2) if self.searches else None,
+            "flushes": self.flushes,
+        }
@@ -6,10 +6,76 @@ load_dotenv()
 
 REDIS_URL = environ['REDIS_URL']
 
+APP_REDIS_DB = 11  # db Redis для состояния приложения (членство юзеров, события между воркерами)
+
 PG_CONFIG = yaml.load(environ['PG_CONFIG'], Loader=yaml.Loader)
 
 TOKEN = environ['TOKEN']
 
+AVATARS_DIR = environ.get('AVATARS_DIR', 'avatars')  # хранилище аватаров, общее для всех воркеров
+
+# Кеш проверенных X-Telegram-Init-Data (на каждый воркер)
+INIT_DATA_CACHE_SIZE = 50000  # максимальное количество закешированных init data
+INIT_DATA_CACHE_TTL = 3600  # время жизни записи, сек
+INIT_DATA_CACHE_MAX_AGE = 86400  # init data с auth_date старше суток больше не кешируются, сек
+
+# Время жизни закешированных ответов эндпойнтов (components.cache), сек. Изменения юзера удаляют его записи
+# сразу, поэтому TTL ограничивает только устаревание от внешних изменений (админка, другие сервисы).
+PROFILE_CACHE_TTL = 300
+REWARDS_CACHE_TTL = 600
+TASKS_CACHE_TTL = 600
+QUESTIONS_CACHE_TTL = 300  # ответы AI записывает components.ai_queue с инвалидацией
+
+# L1 кеш эндпойнтов в памяти воркера перед Redis (components.cache_backend)
+CACHE_L1_SIZE = 20000  # максимальное количество записей
+CACHE_L1_MAX_BYTES = 64 * 1024 * 1024  # максимальный размер, байт
+CACHE_L1_TTL = 60  # запись живет в L1 не дольше, даже если событие об удалении потеряно, сек
+
+# Доля добычи майнинга реферала, начисляемая предкам по реферальной цепочке: реферреру, его реферреру и т.д.
+# Длина задает глубину User.referrer_path (при увеличении старые пути дополняются только миграцией).
+REFERRAL_MINING_INCOME = (0.05, 0.01)
+
+# Награды реферреру за количество приглашенных друзей: invited_friends -> монеты
+INVITE_FRIENDS_REWARDS = {1: 2000, 5: 5000, 100: 50000, 1000: 250000}
+
+REGISTRATION_BATCH_SIZE = 1000  # максимальное количество юзеров в одном запросе пакетной регистрации
+
+# Модерация вопросов AI (components.moderation)
+MODERATION_THREADS = 2  # потоки для проверки орфографии и мата (CPU, ограничены GIL)
+
+# Перевод текста юзеров (components.translation)
+TRANSLATION_BACKEND = environ.get('TRANSLATION_BACKEND', 'google')  # google или offline (без сети, для тестов)
+TRANSLATION_THREADS = 8  # потоки для запросов к переводчику (ожидание сети)
+TRANSLATION_TIMEOUT = 5  # время ожидания перевода, сек
+TRANSLATION_CACHE_SIZE = 10000  # максимальное количество переводов в памяти воркера
+TRANSLATION_LOCAL_TTL = 3600  # время жизни перевода в памяти воркера, сек
+TRANSLATION_CACHE_TTL = 30 * 86400  # время жизни перевода в Redis, сек
+
+# Минимальное сходство триграмм названия страны с опечаткой и названия из индекса (components.countries)
+COUNTRY_MATCH_THRESHOLD = 0.4
+
+# Очередь вопросов AI (components.ai_queue): Redis stream с группой потребителей
+AI_BACKEND_URL = environ.get('AI_BACKEND_URL')  # POST {"question": ...} -> {"answer": ...}
+AI_QUEUE_WORKER = environ.get('AI_QUEUE_WORKER', '0') == '1'  # обрабатывать очередь в воркерах API
+AI_QUEUE_BATCH = 32  # сколько вопросов забирать из очереди за раз
+AI_QUEUE_CONCURRENCY = 8  # сколько вопросов одного потребителя отвечаются параллельно
+AI_QUEUE_RETRY_DELAY = 30  # через сколько неподтвержденный вопрос забирается повторно, сек
+AI_QUEUE_MAX_ATTEMPTS = 3  # после стольких неудачных попыток вопрос уходит в dead-letter
+AI_ANSWER_TIMEOUT = 60  # время ожидания ответа модели, сек
+AI_QUESTION_REWARD = 1000  # монеты за вопрос, на который получен ответ
+
+# Ответы на похожие вопросы AI (components.vectors): эмбеддинги float32 в Question.embedding и индекс в памяти
+AI_EMBEDDING_URL = environ.get('AI_EMBEDDING_URL')  # POST {"texts": [...]} -> {"embeddings": [[...], ...]}
+EMBEDDING_DIM = int(environ.get('EMBEDDING_DIM', 384))  # размерность эмбеддингов модели
+VECTOR_INDEX_PATH = environ.get('VECTOR_INDEX_PATH', 'vectors/questions')  # файлы индекса, общие для потребителей
+VECTOR_INDEX_FLUSH = 60  # период записи новых векторов в файлы индекса, сек
+VECTOR_SEARCH_CHUNK = 65536  # строк индекса на одно умножение матриц при поиске (память на запрос)
+AI_DUPLICATE_THRESHOLD = 0.95  # косинусное сходство, с которого вопрос получает ответ на похожий вопрос
+
+TASK_CATALOG_REFRESH = 300  # период перезагрузки каталога задач из бд (изменения в обход ORM), сек
+
+METRICS_TOKEN = environ.get('METRICS_TOKEN')  # X-Metrics-Token для /metrics, без него эндпойнты отключены
+
 # используем 13 потоков для 500RPS:
 # -- Масштабируется --
 # 5 потоков -> psql = 20 connections
@@ -19,6 +85,38 @@ TOKEN = environ['TOKEN']
 # 1 поток -> redis
 # ~1 поток -> nginx
 
+# /game_actions/sync_clicks одним UPDATE ... RETURNING (только postgres), иначе через ORM
+ATOMIC_SYNC_CLICKS = True
+
+# Клики копятся в Redis (Lua скрипт на юзера) и пачками сбрасываются в stats фоновым flusher-ом (только postgres)
+CLICKS_WRITE_BEHIND = False
+WRITE_BEHIND_FLUSH_INTERVAL = 5  # период сброса в бд, сек
+WRITE_BEHIND_BATCH = 1000  # юзеров в одном UPDATE
+
+# Награды за серию ежедневных входов: (монеты, вдохновения, приливы) за 1-й, 2-й, ... день серии,
+# последняя строка повторяется для всех следующих дней
+LAUNCHES_SERIES_REWARDS = (
+    (500, 0, 0),
+    (1000, 0, 0),
+    (1000, 1, 0),
+    (1000, 1, 1),
+    (1000, 2, 1),
+    (5000, 2, 2),
+    (10000, 2, 2),
+)
+
+LEADERBOARD_SIZE = 50  # сколько лидеров недели выводить
+LEADERBOARD_REBUILD_PERIOD = 3600  # период пересборки лидерборда в Redis из бд (одним воркером), сек
+
+# Награды лидерам недели: (до места включительно, монеты, вдохновения, приливы), по возрастанию мест
+LEADERBOARD_REWARDS = (
+    (1, 100000, 5, 5),
+    (3, 50000, 3, 3),
+    (10, 20000, 2, 2),
+    (50, 5000, 1, 1),
+)
+SETTLEMENT_CHUNK = 5000  # строк в одном INSERT при подведении итогов недели
+
 PSQL_CPUS = 1  # RPS = PSQL_CPUS * 100 (5 = 500)
 
 TORTOISE_CONFIG = {
@@ -1,21 +1,19 @@
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from redis.asyncio import from_url
 from tortoise import Tortoise
-from components.coders import UJsonCoder
-from config import REDIS_URL
+from components import broker, accumulator, moderation
+from components.ai_queue import ai_queue
+from components.cache import init_cache
+from components.countries import countries
+from components.avatars import move_all_avatars
+from components.leaderboard import leaderboard
+from components.members import registered_users
+from components.migrations import migrate
+from components.ranks import ranks
+from components.task_catalog import task_catalog
+from config import CLICKS_WRITE_BEHIND, AI_QUEUE_WORKER
 from models import Rank, RankName, Task, Condition, VisitLinkCondition, InstantReward, Visibility, \
     RankVisibility, ConditionType, VisibilityType, User
 
 
-async def init_cache(enable: bool = True) -> None:
-    """
-    Функция инициализации кеша.
-    """
-    redis = await from_url(REDIS_URL, db=10, encoding="utf-8", decode_responses=False)
-    FastAPICache.init(backend=RedisBackend(redis), prefix="fastapi-cache", coder=UJsonCoder, enable=enable)
-
-
 async def create_necessary_db_objects() -> None:
     """
     Функция для создания необходимых для работы записей в бд.
@@ -126,3 +124,34 @@ async def init(enable_cache: bool = True) -> None:
     """
     await init_cache(enable_cache)  # инициализируем кеш
     await create_necessary_db_objects()  # создаем записи бд при необходимости
+    await migrate()  # дополняем схему существующей бд (индексы, новые колонки)
+    await move_all_avatars()  # переносим аватары из бд в хранилище файлов
+    await ranks.load()  # загружаем таблицу рангов в память воркера
+    await task_catalog.load()  # загружаем каталог задач (после рангов: видимость считается по лигам)
+    await registered_users.rebuild()  # собираем множество зарегистрированных юзеров
+    await leaderboard.rebuild()  # собираем лидерборд недели, если его еще нет в Redis
+    await moderation.load()  # загружаем словари проверок вопросов AI
+    await countries.load_async()  # строим индекс названий стран
+    broker.start_listener()  # слушаем события от других воркеров
+    task_catalog.start_refresher()
+    leaderboard.start_rebuilder()
+
+    if AI_QUEUE_WORKER and ai_queue is not None:
+        ai_queue.start()  # отвечаем на вопросы AI в воркере API (иначе отдельным процессом components.ai_queue)
+
+    if CLICKS_WRITE_BEHIND:
+        await accumulator.flush()  # дописываем в бд клики, оставшиеся в Redis после остановки/падения
+        accumulator.start_flusher()
+
+
+async def shutdown() -> None:
+    """
+    Функция остановки фоновых задач воркера.
+    """
+    await broker.stop_listener()
+    await task_catalog.stop_refresher()
+    await leaderboard.stop_rebuilder()
+    await accumulator.stop_flusher()
+
+    if ai_queue is not None:
+        await ai_queue.stop()
@@ -8,15 +8,16 @@ from tortoise.contrib.fastapi import register_tortoise
 from uvicorn import run
 from admin.auth import CustomAuthProvider
 from models import User, Rank, Stats, Activity, Reward, Question
-from routers import user, mining, rewarding, game_actions, tasks, questions
+from routers import user, mining, rewarding, game_actions, tasks, questions, metrics, registration
 from admin.views import UserView, RankView, ActivityView, RewardsView, StatsView, QuestionsView
 from config import TORTOISE_CONFIG, ADMIN_MW_SECRET_KEY, PSQL_CPUS
-from init import init
+from init import init, shutdown
 
 # Используемые базы данных Redis
 # db 0 - кеш для стейтов бота
 # db9 - Для asgi_limit
 # db10 - Кеш fastapi_cache
+# db11 - Состояние приложения (components.redis_db)
 
 # Ставим самый быстрый декодер Ujson
 app = FastAPI(title="2Eden API - Swagger UI", default_response_class=UJSONResponse)
@@ -44,6 +45,7 @@ app.add_middleware(
 
 # Инициализируем все
 app.add_event_handler("startup", init)
+app.add_event_handler("shutdown", shutdown)
 
 # Подключаем роутеры
 app.include_router(user.router, prefix="/api")
@@ -52,6 +54,8 @@ app.include_router(rewarding.router, prefix="/api")
 app.include_router(game_actions.router, prefix="/api")
 app.include_router(tasks.router, prefix="/api")
 app.include_router(questions.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
+app.include_router(registration.router, prefix="/api")
 
 # Настраиваем админку
 admin = BaseAdmin(title="2Eden Admin",
@@ -5,7 +5,7 @@ from pytz import timezone
 from tortoise import Model, Tortoise
 from tortoise.contrib.pydantic import pydantic_model_creator, pydantic_queryset_creator
 from tortoise.fields import BigIntField, DateField, CharEnumField, CharField, DatetimeField, \
-    OnDelete, ForeignKeyField, OneToOneField, OneToOneRelation, ReverseRelation, FloatField, BooleanField, TextField, \
+    OnDelete, ForeignKeyField, OneToOneField, OneToOneRelation, ReverseRelation, FloatField, BooleanField, \
     BinaryField
 
 
@@ -37,6 +37,7 @@ class QuestionStatus(str, Enum):
     IN_PROGRESS = "in_progress"
     HAVE_ANSWER = "have_answer"
     RECEIVED_REWARD = "received_reward"
+    FAILED = "failed"  # ответ не получен после всех попыток, можно задать новый вопрос
 
 
 class ConditionType(str, Enum):
@@ -68,6 +69,7 @@ class User(Model):
     id = BigIntField(pk=True)  # = chat_id в телеграм
     rank = ForeignKeyField(model_name="api.Rank", on_delete=OnDelete.CASCADE, related_name="users", default=1)
     referrer = ForeignKeyField(model_name="api.User", on_delete=OnDelete.CASCADE, related_name="leads", null=True)
+    referrer_path = CharField(max_length=255, null=True)  # id предков через запятую: реферрер, его реферрер, ...
     leads: ReverseRelation["User"]
     stats: OneToOneRelation["Stats"]
     activity: OneToOneRelation["Activity"]
@@ -77,7 +79,8 @@ class User(Model):
     country = CharField(max_length=50)  # -
     referral_code = CharField(max_length=40, default=uuid4, unique=True)
     username = CharField(max_length=50)
-    avatar = BinaryField(null=True)
+    avatar = BinaryField(null=True)  # пишет бот, при чтении профиля переносится в хранилище аватаров
+    avatar_hash = CharField(max_length=80, null=True)  # имя файла в хранилище аватаров (sha256 + расширение)
 
     def __str__(self):
         return self.id
@@ -125,6 +128,13 @@ class Leader(Model):
     earned_week_coins = BigIntField(default=0)
 
 
+class Settlement(Model):  # Подведенные итоги недели лидерборда, по одной записи на неделю
+    week = DateField(pk=True)  # понедельник недели
+    settled_at = DatetimeField(auto_now_add=True)
+    leaders = BigIntField(default=0)  # количество награжденных лидеров
+    reset_stats = BigIntField(default=0)  # количество обнуленных earned_week_coins
+
+
 class Question(Model):
     id = BigIntField(pk=True)
     user = ForeignKeyField('api.User', on_delete=OnDelete.CASCADE, related_name='questions')
@@ -132,7 +142,7 @@ class Question(Model):
     u_text = CharField(max_length=1000)  # На пользовательском языке
     text = CharField(max_length=1000)  # Всегда на английском
     answer = CharField(max_length=1000, null=True)  # Всегда на русском
-    embedding = TextField(null=True)
+    embedding = BinaryField(null=True)  # float32 little-endian, EMBEDDING_DIM значений (components.vectors.pack)
     secret = BooleanField(default=0)
     status = CharEnumField(enum_type=QuestionStatus, default=QuestionStatus.IN_PROGRESS, description='Статус')
 
@@ -207,6 +217,9 @@ class UserTask(Model):
     def is_completed(self):  # todo: не задействованный метод
         return self.completed_time is not None
 
+    class Meta:
+        unique_together = (("user", "task"),)  # задача берется юзером один раз
+
 
 # Pydantic -------------------------------------------------------------------------------------------------------------
 Tortoise.init_models(["models"], "api")
@@ -1,119 +1,119 @@
 from datetime import datetime, timedelta
-from math import floor
 from typing import Annotated
-from aiogram.utils.web_app import WebAppInitData
 from fastapi import APIRouter, Depends
 from pytz import timezone
 from starlette import status
 from components.requests import SyncClicksRequest
-from components.responses import CustomJSONResponse
-from components.tools import validate_telegram_hash, get_daily_reward, sync_energy
-from models import User
+from components.responses import CustomJSONResponse, StaticJSONResponse
+from components import accumulator
+from components.cache import invalidate
+from components.clicks import extract_clicks
+from components.daily import get_daily_reward
+from components.ranks import ranks
+from components.tools import user_loader, credit_stats, current_energy
+from config import ATOMIC_SYNC_CLICKS, CLICKS_WRITE_BEHIND
+from models import User, Activity
 
 router = APIRouter(prefix="/game_actions", tags=["Game Actions"])
 
+NOT_ENOUGH_ENERGY = StaticJSONResponse("Не хватает энергии.", status.HTTP_409_CONFLICT)
+CLICKS_SYNCED = StaticJSONResponse("Синхронизация завершена.")
+LOW_RANK = StaticJSONResponse("Маловат ранг.", status.HTTP_409_CONFLICT)
+NO_INSPIRATIONS = StaticJSONResponse("На счету кончились бустеры вдохновения.", status.HTTP_409_CONFLICT)
+INSPIRATION_ACTIVE = StaticJSONResponse("Вдохновение уже активно, дождитесь завершения.", status.HTTP_409_CONFLICT)
+INSPIRATION_STARTED = StaticJSONResponse("Вдохновение активировано.")
+NO_REPLENISHMENTS = StaticJSONResponse("На счету кончились бустеры прилива.", status.HTTP_409_CONFLICT)
+ENERGY_IS_FULL = StaticJSONResponse("У вас максимум энергии.", status.HTTP_409_CONFLICT)
+REPLENISHMENT_USED = StaticJSONResponse("Прилив энергии активирован.")
+
+# В атомарном режиме энергия и монеты считаются в SQL, поэтому stats не подгружается
+_sync_clicks_user = (user_loader("activity") if ATOMIC_SYNC_CLICKS and not CLICKS_WRITE_BEHIND
+                     else user_loader("stats", "activity"))
+
 
 @router.patch(path="/sync_clicks", description="Эндпойнт синхронизации кликов. Сколько бы кликов не отправили, все обрезается энергией, на счету у пользователя и дневными ограничениями.")
 async def sync_clicks(req: SyncClicksRequest,
-                      init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
+                      user: Annotated[User, Depends(_sync_clicks_user)]) -> CustomJSONResponse:
     """
     Эндпойнт синхронизации кликов. Сколько бы кликов не отправили, все обрезается энергией, на счету у
     пользователя и дневными ограничениями.
     @param req: request объект с кол-вом кликов SyncClicksRequest
-    @param init_data: данные юзера telegram
+    @param user: юзер с activity (+ stats без ATOMIC_SYNC_CLICKS)
     @return:
     """
-
-    user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
-    user = await User.filter(id=user_chat_id).select_related("rank", "stats", "activity", "rewards").first()
-
     await get_daily_reward(user)  # получаем ежедневную награду за вход
-    await sync_energy(user)  # синхронизируем энергию
-
-    if user.stats.energy < user.rank.press_force:
-        return CustomJSONResponse(message="Не хватает энергии.",
-                                  status_code=status.HTTP_409_CONFLICT)
 
-    extraction = req.clicks * user.rank.press_force
+    if await extract_clicks(user, req.clicks) is None:
+        return NOT_ENOUGH_ENERGY()
 
-    if extraction > user.stats.energy:  # Обрезаем энергию под количество доступных кликов ^^
-        extraction = floor(user.stats.energy / user.rank.press_force) * user.rank.press_force
+    await invalidate(user.id, "profile")
 
-    user.stats.coins += extraction
-    user.stats.energy -= extraction
-    user.stats.earned_week_coins += extraction
-
-    await user.stats.save()
-
-    return CustomJSONResponse(message="Синхронизация завершена.")
+    return CLICKS_SYNCED()
 
 
 @router.patch(path="/sync_inspiration", description="Эндпойнт синхронизации кликов под бустером - вдохновение. Сколько бы кликов не отправили, все обрезается по формуле user.rank.max_energy * 1.2.")
 async def sync_inspiration(req: SyncClicksRequest,
-                           init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
+                           user: Annotated[User, Depends(user_loader("stats", "activity"))]) -> CustomJSONResponse:
     """
     Эндпойнт синхронизации кликов под бустером - вдохновение. Сколько бы кликов не отправили,
     все обрезается по формуле user.rank.max_energy * 1.2.
     @param req: request объект с кол-вом кликов SyncClicksRequest
-    @param init_data: данные юзера telegram
+    @param user: юзер со stats, activity
     @return:
     """
-    user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
-    user = await User.filter(id=user_chat_id).select_related("activity", "stats", "rank").first()
-    max_extraction = int(user.rank.max_energy * 1.2)  # максимум можно заработать max_energy + 20%
+    rank = ranks[user.rank_id]
+    max_extraction = int(rank.max_energy * 1.2)  # максимум можно заработать max_energy + 20%
 
-    if user.rank.id < 2:
-        return CustomJSONResponse(message="Маловат ранг.",
-                                  status_code=status.HTTP_409_CONFLICT)
+    if rank.id < 2:
+        return LOW_RANK()
 
     if user.stats.inspirations == 0:
-        return CustomJSONResponse(message="На счету кончились бустеры вдохновения.",
-                                  status_code=status.HTTP_409_CONFLICT)
+        return NO_INSPIRATIONS()
 
     if user.activity.next_inspiration > datetime.now(tz=timezone("Europe/Moscow")):
-        return CustomJSONResponse(message="Вдохновение уже активно, дождитесь завершения.",
-                                  status_code=status.HTTP_409_CONFLICT)
+        return INSPIRATION_ACTIVE()
 
-    extraction = req.clicks * (user.rank.press_force * 3)
+    extraction = req.clicks * (rank.press_force * 3)
 
     if extraction > max_extraction:
         extraction = max_extraction
 
     user.activity.next_inspiration = datetime.now(tz=timezone("Europe/Moscow")) + timedelta(seconds=15)
-    await user.activity.save()
+    await user.activity.save(update_fields=["next_inspiration"])
 
-    user.stats.inspirations -= 1
-    user.stats.coins += extraction
-    user.stats.earned_week_coins += extraction
-    await user.stats.save()
+    await credit_stats(user.id, coins=int(extraction), inspirations=-1)
+    await invalidate(user.id, "profile")
 
-    return CustomJSONResponse(message="Вдохновение активировано.")
+    return INSPIRATION_STARTED()
 
 
 @router.post(path="/use_replenishment", description="Эндпойнт на использование бустера - прилива, полностью востанавливает энергию игрока.")
-async def use_replenishment(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
+async def use_replenishment(user: Annotated[User, Depends(user_loader("stats", "activity"))]) -> CustomJSONResponse:
     """
     Эндпойнт на использование бустера - прилива, полностью востанавливает энергию игрока.
-    @param init_data: данные юзера telegram
+    @param user: юзер со stats, activity
     @return:
     """
-    user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
-    user = await User.filter(id=user_chat_id).select_related("activity", "stats", "rank").first()
+    rank = ranks[user.rank_id]
+
+    if CLICKS_WRITE_BEHIND:
+        await accumulator.merge_pending(user)  # актуальная энергия в Redis
 
-    if user.rank.id < 3:
-        return CustomJSONResponse(message="Маловат ранг.",
-                                  status_code=status.HTTP_409_CONFLICT)
+    if rank.id < 3:
+        return LOW_RANK()
 
     if user.stats.replenishments == 0:
-        return CustomJSONResponse(message="На счету кончились бустеры прилива.",
-                                  status_code=status.HTTP_409_CONFLICT)
+        return NO_REPLENISHMENTS()
+
+    if current_energy(user) >= rank.max_energy:
+        return ENERGY_IS_FULL()
+
+    await credit_stats(user.id, replenishments=-1, energy=rank.max_energy)
+    await Activity.filter(id=user.activity.id).update(last_sync_energy=datetime.now(tz=timezone("Europe/Moscow")))
 
-    if user.stats.energy >= user.rank.max_energy:
-        return CustomJSONResponse(message="У вас максимум энергии.",
-                                  status_code=status.HTTP_409_CONFLICT)
+    if CLICKS_WRITE_BEHIND:
+        await accumulator.set_energy(user.id, rank.max_energy)
 
-    user.stats.energy = user.rank.max_energy
-    user.stats.replenishments -= 1
-    await user.stats.save()
+    await invalidate(user.id, "profile")
 
-    return CustomJSONResponse(message="Прилив энергии активирован.")
+    return REPLENISHMENT_USED()
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends
+from fastapi_cache import FastAPICache
+from components.ai_queue import ai_queue, queue_stats
+from components.cache_backend import TwoTierBackend
+from components.responses import CustomJSONResponse
+from components.tools import validate_metrics_token
+from components.translation import translator
+from config import AI_QUEUE_WORKER
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"], dependencies=[Depends(validate_metrics_token)],
+                   include_in_schema=False)
+
+
+@router.get(path="/cache", description="Эндпойнт на получение счетчиков кеша эндпойнтов воркера, обработавшего запрос.")
+async def get_cache_metrics() -> CustomJSONResponse:
+    """
+    Эндпойнт на получение счетчиков кеша эндпойнтов (L1 в памяти и L2 Redis) воркера, обработавшего запрос.
+    :return:
+    """
+    backend = FastAPICache.get_backend()
+
+    if not isinstance(backend, TwoTierBackend):
+        return CustomJSONResponse(message="Кеш работает без L1.")
+
+    return CustomJSONResponse(data=await backend.stats(), message="Выведены счетчики кеша.")
+
+
+@router.get(path="/translation", description="Эндпойнт на получение счетчиков перевода воркера, обработавшего запрос.")
+async def get_translation_metrics() -> CustomJSONResponse:
+    """
+    Эндпойнт на получение счетчиков перевода (попадания в кеш, объединенные запросы, время ответа переводчика)
+    воркера, обработавшего запрос.
+    :return:
+    """
+    return CustomJSONResponse(data=translator.stats(), message="Выведены счетчики перевода.")
+
+
+@router.get(path="/ai_queue", description="Эндпойнт на получение состояния очереди вопросов AI.")
+async def get_ai_queue_metrics() -> CustomJSONResponse:
+    """
+    Эндпойнт на получение состояния очереди вопросов AI (длина, неподтвержденные, dead-letter) и счетчиков
+    потребителя в воркере, обработавшем запрос (если он запущен в этом воркере).
+    :return:
+    """
+    consumer = ai_queue.stats() if ai_queue is not None and AI_QUEUE_WORKER else None
+    return CustomJSONResponse(data={"queue": await queue_stats(), "consumer": consumer},
+                              message="Выведено состояние очереди вопросов AI.")
@@ -1,43 +1,47 @@
 from datetime import timedelta, datetime
 from typing import Annotated
-from aiogram.utils.web_app import WebAppInitData
 from fastapi import APIRouter, Depends
 from pytz import timezone
 from starlette import status
-from components.responses import CustomJSONResponse
-from components.tools import send_referral_mining_reward, validate_telegram_hash
+from components.cache import invalidate
+from components.ranks import ranks
+from components.responses import CustomJSONResponse, StaticJSONResponse
+from components.tools import send_referral_mining_reward, user_loader, credit_stats
 from models import User
 
 router = APIRouter(prefix="/mining", tags=["Mining"])
 
+LOW_RANK = StaticJSONResponse("Маловат ранг.", status.HTTP_409_CONFLICT)
+MINING_ACTIVE = StaticJSONResponse("Майнинг уже активен.", status.HTTP_409_CONFLICT)
+CLAIM_FIRST = StaticJSONResponse("Сперва заберите награду.", status.HTTP_409_CONFLICT)
+MINING_NOT_FINISHED = StaticJSONResponse("Майнинг еще не завершен.", status.HTTP_409_CONFLICT)
+START_FIRST = StaticJSONResponse("Сперва начните майнинг.", status.HTTP_409_CONFLICT)
+
 
 @router.post(path="/start", description="Эндпойнт для начала майнинга. Изменяет время старта.")
-async def start_mining(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
+async def start_mining(user: Annotated[User, Depends(user_loader("activity"))]) -> CustomJSONResponse:
     """
     Эндпойнт для начала майнинга. Изменяет время старта.
-    :param init_data: данные юзера telegram
+    :param user: юзер с activity
     :return:
     """
-    user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
-    user = await User.filter(id=user_chat_id).select_related("rank", "activity").first()
+    rank = ranks[user.rank_id]
 
-    if user.rank.id < 4:
-        return CustomJSONResponse(message="Маловат ранг.",
-                                  status_code=status.HTTP_409_CONFLICT)
+    if rank.id < 4:
+        return LOW_RANK()
 
     if datetime.now(tz=timezone("Europe/Moscow")) < user.activity.next_mining:
-        return CustomJSONResponse(message="Майнинг уже активен.",
-                                  status_code=status.HTTP_409_CONFLICT)
+        return MINING_ACTIVE()
 
     if user.activity.is_active_mining:
-        return CustomJSONResponse(message="Сперва заберите награду.",
-                                  status_code=status.HTTP_409_CONFLICT)
+        return CLAIM_FIRST()
 
     user.activity.next_mining = datetime.now(tz=timezone("Europe/Moscow")) + timedelta(minutes=1)
     user.activity.is_active_mining = True
-    await user.activity.save()
+    await user.activity.save(update_fields=["next_mining", "is_active_mining"])
+    await invalidate(user.id, "profile")
 
-    resp_data = {"max_extraction": user.rank.max_energy, "next_mining_dt": user.activity.next_mining.isoformat()}
+    resp_data = {"max_extraction": rank.max_energy, "next_mining_dt": user.activity.next_mining.isoformat()}
 
     return CustomJSONResponse(message="Майнинг активирован.",
                               data=resp_data,
@@ -45,38 +49,32 @@ async def start_mining(init_data: Annotated[WebAppInitData, Depends(validate_tel
 
 
 @router.post(path="/claim", description="Эндпойнт для окончания майнинга.")
-async def end_mining(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
+async def end_mining(user: Annotated[User, Depends(user_loader("activity"))]) -> CustomJSONResponse:
     """
     Эндпойнт для окончания майнинга.
-    :param init_data: данные юзера telegram
+    :param user: юзер с activity
     :return:
     """
-    user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
-    user = await User.filter(id=user_chat_id).select_related("stats", "rank", "activity").first()
+    rank = ranks[user.rank_id]
 
-    if user.rank.id < 4:
-        return CustomJSONResponse(message="Маловат ранг.",
-                                  status_code=status.HTTP_409_CONFLICT)
+    if rank.id < 4:
+        return LOW_RANK()
 
     if datetime.now(tz=timezone("Europe/Moscow")) < user.activity.next_mining:
-        return CustomJSONResponse(message="Майнинг еще не завершен.",
-                                  status_code=status.HTTP_409_CONFLICT)
+        return MINING_NOT_FINISHED()
 
     if not user.activity.is_active_mining:
-        return CustomJSONResponse(message="Сперва начните майнинг.",
-                                  status_code=status.HTTP_409_CONFLICT)
+        return START_FIRST()
 
     user.activity.is_active_mining = False
-    await user.activity.save()
+    await user.activity.save(update_fields=["is_active_mining"])
 
     # Обновляем награду реферерров за майнинг реферала
-    await send_referral_mining_reward(referrer_id=user.referrer_id, extraction=user.rank.max_energy)
-
-    user.stats.coins += user.rank.max_energy
-    user.stats.earned_week_coins += user.rank.max_energy
+    await send_referral_mining_reward(user, extraction=rank.max_energy)
 
-    await user.stats.save()
+    await credit_stats(user.id, coins=int(rank.max_energy))
+    await invalidate(user.id, "profile")
 
     return CustomJSONResponse(message="Майнинг завершен.",
-                              data={"max_extraction": user.rank.max_energy},
+                              data={"max_extraction": rank.max_energy},
                               status_code=status.HTTP_202_ACCEPTED)
@@ -1,15 +1,26 @@
 from typing import Annotated
 from aiogram.utils.web_app import WebAppInitData
-from deep_translator import GoogleTranslator
 from fastapi import APIRouter, Depends
-from fastapi_cache.decorator import cache
 from starlette import status
-from components.responses import CustomJSONResponse
-from components.tools import validate_telegram_hash, ai_msg_base_check
+from components.ai_queue import enqueue
+from components.cache import user_cache, invalidate
+from components.moderation import check_question, ModerationError
+from components.responses import CustomJSONResponse, StaticJSONResponse
+from components.translation import translate, TranslationError
+from components.tools import validate_telegram_hash
+from config import QUESTIONS_CACHE_TTL
 from models import Question, Reward, Questions_Pydantic_List, RewardType, QuestionStatus, Question_Pydantic
 
 router = APIRouter(prefix="/questions", tags=["Questions"])
 
+QUESTION_ACCEPTED = StaticJSONResponse("Я пошел думать над твоим вопросом.")
+NO_QUESTIONS = StaticJSONResponse("Пользователь не задал ни одного вопроса.")
+EMPTY_HISTORY = StaticJSONResponse("Пока не задано ниодного вопроса.", status.HTTP_404_NOT_FOUND)
+TRANSLATION_UNAVAILABLE = StaticJSONResponse("Не удалось прочесть вопрос, попробуй позже.",
+                                             status.HTTP_503_SERVICE_UNAVAILABLE)
+QUEUE_UNAVAILABLE = StaticJSONResponse("Не удалось отправить вопрос, попробуй позже.",
+                                       status.HTTP_503_SERVICE_UNAVAILABLE)
+
 
 @router.post(path="/ask", description="Эндпойнт для создания нового вопроса для AI.")  #
 async def ask_question(question: str,
@@ -41,23 +52,30 @@ async def ask_question(question: str,
         #         message="Сегодня я не могу ответить на еще один твой вопрос, сын мой, приходи завтра.",
         #         status_code=status.HTTP_208_ALREADY_REPORTED)
 
-    # Переводим текст на английский
-    transl_question = GoogleTranslator(source='auto', target='en').translate(question)
-
-    # Проводим базовые проверки
+    # Переводим текст на английский и проводим базовые проверки (вне event loop)
     try:
-        await ai_msg_base_check(transl_question)
-    except Exception as e:
+        transl_question = await translate(question)
+        await check_question(transl_question)
+    except TranslationError:
+        return TRANSLATION_UNAVAILABLE()
+    except ModerationError as e:
         return CustomJSONResponse(message=str(e), status_code=status.HTTP_406_NOT_ACCEPTABLE)
 
     # Если вс окэй
-    await Question.create(user_id=user_id, text=transl_question, u_text=question)
+    new_question = await Question.create(user_id=user_id, text=transl_question, u_text=question)
+
+    # Без очереди вопрос остался бы IN_PROGRESS до перезапуска потребителя, а юзер получал бы "Я еще думаю."
+    if not await enqueue(new_question.id):
+        await new_question.delete()
+        return QUEUE_UNAVAILABLE()
+
+    await invalidate(user_id, "questions")
 
-    return CustomJSONResponse(message="Я пошел думать над твоим вопросом.")
+    return QUESTION_ACCEPTED()
 
 
 @router.get(path="/last_question", description="Эндпойнт на получение последнего сообщения со статусом вопроса к AI.")
-@cache(expire=30)
+@user_cache("questions", expire=QUESTIONS_CACHE_TTL)
 async def get_last_question(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
     """
     Эндпойнт на получение последнего сообщения со статусом вопроса к AI.
@@ -68,7 +86,7 @@ async def get_last_question(init_data: Annotated[WebAppInitData, Depends(validat
     last_question = await Question.filter(user_id=user_id).order_by("-id").first()
 
     if last_question is None:
-        return CustomJSONResponse(message="Пользователь не задал ни одного вопроса.")
+        return NO_QUESTIONS()
 
     from_orm = await Question_Pydantic.from_tortoise_orm(last_question)
     resp_data = from_orm.model_dump(mode='json')
@@ -81,7 +99,7 @@ async def get_last_question(init_data: Annotated[WebAppInitData, Depends(validat
 
 
 @router.get(path="/history", description="Эндпойнт для получения истории диалога с AI.")
-@cache(expire=10)
+@user_cache("questions", expire=QUESTIONS_CACHE_TTL)
 async def get_history(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
     """
     Эндпойнт для получения истории диалога с AI.
@@ -93,8 +111,7 @@ async def get_history(init_data: Annotated[WebAppInitData, Depends(validate_tele
     questions = await Questions_Pydantic_List.from_queryset(Question.filter(user_id=user_id))
 
     if not questions:
-        return CustomJSONResponse(message="Пока не задано ниодного вопроса.",
-                                  status_code=status.HTTP_404_NOT_FOUND)
+        return EMPTY_HISTORY()
 
     return CustomJSONResponse(message="Выведены вопросы пользователя.",
                               data={"questions": questions.model_dump(mode="json")})
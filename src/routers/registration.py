@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends
+from starlette import status
+from tortoise.exceptions import IntegrityError
+from components.registration import register_users, NewUser
+from components.requests import RegisterUsersRequest
+from components.responses import CustomJSONResponse, StaticJSONResponse
+from components.tools import validate_bot_token
+
+router = APIRouter(prefix="/registration", tags=["Registration"], dependencies=[Depends(validate_bot_token)],
+                   include_in_schema=False)
+
+CONFLICT = StaticJSONResponse("Часть юзеров зарегистрирована параллельно, повторите запрос.",
+                              status.HTTP_409_CONFLICT)
+
+
+@router.post(path="/bulk", description="Эндпойнт для пакетной регистрации юзеров ботом.")
+async def bulk_register(req: RegisterUsersRequest) -> CustomJSONResponse:
+    """
+    Эндпойнт для пакетной регистрации юзеров ботом (всплески /start). Повтор пакета безопасен:
+    уже зарегистрированные юзеры пропускаются.
+    :param req: юзеры с кодами реферальных ссылок
+    :return:
+    """
+    try:
+        result = await register_users([NewUser(**user.model_dump()) for user in req.users])
+    except IntegrityError:  # тот же chat_id вставлен другим запросом между проверкой и вставкой
+        return CONFLICT()
+
+    return CustomJSONResponse(message="Юзеры зарегистрированы.",
+                              data={"created": result.created, "existing": result.existing,
+                                    "unknown_referral_codes": result.unknown_referral_codes},
+                              status_code=status.HTTP_201_CREATED)
@@ -1,18 +1,25 @@
 from typing import Annotated
 from aiogram.utils.web_app import WebAppInitData
 from fastapi import APIRouter, Depends
-from fastapi_cache.decorator import cache
 from starlette import status
+from components.cache import user_cache, invalidate
 from components.requests import GetRewardRequest
-from components.responses import CustomJSONResponse
-from components.tools import validate_telegram_hash
-from models import Reward, Stats, Question, RewardType, QuestionStatus
+from components.responses import CustomJSONResponse, StaticJSONResponse
+from components.rewards import claim_all
+from components.tools import validate_telegram_hash, credit_stats
+from config import REWARDS_CACHE_TTL
+from models import Reward, Question, RewardType, QuestionStatus
 
 router = APIRouter(prefix="/reward", tags=["Reward"])
 
+NO_REWARDS = StaticJSONResponse("Вознаграждений 0.", status.HTTP_404_NOT_FOUND)
+REWARD_NOT_FOUND = StaticJSONResponse("У вас нет этого вознаграждения.", status.HTTP_404_NOT_FOUND)
+REWARD_RECEIVED = StaticJSONResponse("Награда выдана!")
+NOTHING_TO_RECEIVE = StaticJSONResponse("У вас нет вознаграждений.", status.HTTP_404_NOT_FOUND)
+
 
 @router.get(path="/list", description="Эндпойнт на получение списка наград юзера (приглашение, серия авторизаций, таск, лидерборд, реферал)")
-@cache(expire=10)
+@user_cache("rewards", expire=REWARDS_CACHE_TTL)
 async def get_reward_list(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
     """
     Эндпойнт на получение списка наград юзера (приглашение, серия авторизаций, таск, лидерборд, реферал)
@@ -24,8 +31,7 @@ async def get_reward_list(init_data: Annotated[WebAppInitData, Depends(validate_
                             .values("id", "type", "amount", "inspirations", "replenishments"))
 
     if not rewards_values:
-        return CustomJSONResponse(message="Вознаграждений 0.",
-                                  status_code=status.HTTP_404_NOT_FOUND)
+        return NO_REWARDS()
 
     return CustomJSONResponse(data={"rewards": rewards_values}, message="Выведен список вознаграждений.")
 
@@ -47,21 +53,19 @@ async def receive_reward(req: GetRewardRequest,
         if reward.type == RewardType.AI_QUESTION:
             await Question.filter(user_id=user_chat_id).update(status=QuestionStatus.RECEIVED_REWARD)
 
-        user_stats = await Stats.filter(user_id=user_chat_id).first()
-
-        user_stats.coins += reward.amount
-        user_stats.inspirations += reward.inspirations
-        user_stats.replenishments += reward.replenishments
-        user_stats.earned_week_coins += reward.amount
+        # Удаляем до начисления, чтобы параллельный запрос не получил ту же награду второй раз
+        if not await Reward.filter(id=reward.id).delete():
+            raise LookupError(reward.id)
 
-        await user_stats.save()
-        await reward.delete()
+        await credit_stats(user_chat_id, coins=reward.amount, inspirations=reward.inspirations,
+                           replenishments=reward.replenishments)
 
     except Exception:
-        return CustomJSONResponse(message="У вас нет этого вознаграждения.",
-                                  status_code=status.HTTP_404_NOT_FOUND)
+        return REWARD_NOT_FOUND()
 
-    return CustomJSONResponse(message="Награда выдана!")
+    await invalidate(user_chat_id, "rewards", "profile", "questions")
+
+    return REWARD_RECEIVED()
 
 
 @router.post(path="/receive/all", description="Эндпойнт на получение всех наград.")
@@ -72,25 +76,13 @@ async def receive_rewards(init_data: Annotated[WebAppInitData, Depends(validate_
     :return:
     """
     user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
+    claimed = await claim_all(user_chat_id)
 
-    try:
-        rewards = await Reward.filter(user_id=user_chat_id).all()
-        user_stats = await Stats.filter(user_id=user_chat_id).first()
-
-        for reward in rewards:
-            if reward.type == RewardType.AI_QUESTION:
-                await Question.filter(user_id=user_chat_id).update(status=QuestionStatus.RECEIVED_REWARD)
-
-            user_stats.coins += reward.amount
-            user_stats.inspirations += reward.inspirations
-            user_stats.replenishments += reward.replenishments
-            user_stats.earned_week_coins += reward.amount
+    if not claimed.count:
+        return NOTHING_TO_RECEIVE()
 
-        await user_stats.save()
-        await Reward.filter(user_id=user_chat_id).delete()
-
-    except Exception:
-        return CustomJSONResponse(message="У вас нет вознаграждений.",
-                                  status_code=status.HTTP_404_NOT_FOUND)
+    await invalidate(user_chat_id, "rewards", "profile", "questions")
 
-    return CustomJSONResponse(message="Награды выданы!")
+    return CustomJSONResponse(message="Награды выданы!",
+                              data={"received": claimed.count, "coins": claimed.coins,
+                                    "inspirations": claimed.inspirations, "replenishments": claimed.replenishments})
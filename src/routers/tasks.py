@@ -2,14 +2,18 @@ from datetime import datetime
 from typing import Annotated, List, Union
 from aiogram.utils.web_app import WebAppInitData
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi_cache.decorator import cache
 from pydantic import BaseModel
 from pytz import timezone
 from starlette import status
 from tortoise.exceptions import DoesNotExist
+from components.cache import user_cache, invalidate
 from components.responses import CustomJSONResponse
-from components.tools import check_task_visibility, validate_telegram_hash
-from models import User, Task, VisitLinkCondition, TgChannelCondition, UserTask, ConditionType
+from components.ranks import ranks
+from components.task_catalog import task_catalog
+from components.user_tasks import user_tasks
+from components.tools import validate_telegram_hash, user_loader, credit_stats
+from config import TASKS_CACHE_TTL
+from models import User, ConditionType
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
@@ -49,134 +53,85 @@ class CompleteTaskResponse(BaseModel):
 class StartTaskResponse(BaseModel):
     task: TaskResponse
 
-async def get_condition_response(task: Task) -> Union[VisitLinkConditionResponse, TgChannelConditionResponse]:
-    """
-    Преобразует условие задачи в соответствующий ответ API.
-    :param task: объект задачи
-    :return: объект ответа с условием задачи
-    """
-    if task.condition.type == ConditionType.VISIT_LINK:
-        visit_link = await VisitLinkCondition.get(condition=task.condition)
-        return VisitLinkConditionResponse(url=visit_link.url)
-    elif task.condition.type == ConditionType.TG_CHANNEL:
-        tg_channel = await TgChannelCondition.get(condition=task.condition)
-        return TgChannelConditionResponse(channel_id=tg_channel.channel_id)
-    else:
-        raise ValueError(f"Неизвестный тип условия: {task.condition.type}")
-
 @router.get("/", response_model=TaskListResponse)
-@cache(expire=10)
+@user_cache("tasks", expire=TASKS_CACHE_TTL)
 async def get_tasks(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]):
     """
     Метод для получения списка доступных задач.
     :param init_data: данные юзера telegram
     :return:
     """
-    user = await User.filter(id=init_data.user.id).select_related("rank").first()
-    all_tasks = await Task.all().prefetch_related("reward", "condition")
-    
-    user_tasks = await UserTask.filter(user=user).all()
-    started_task_ids = {ut.task_id for ut in user_tasks if not ut.is_completed}
-    completed_task_ids = {ut.task_id for ut in user_tasks if ut.is_completed}
-    
-    filtered_tasks = []
-    for task in all_tasks:
-        if await check_task_visibility(task, user) and task.id not in completed_task_ids:
-            condition_data = await get_condition_response(task)
-            
-            task_response = TaskResponse(
-                id=task.id,
-                description=task.description,
-                reward=RewardResponse(
-                    coins=task.reward.tokens,
-                    inspirations=task.reward.inspirations,
-                    replenishments=task.reward.replenishments
-                ),
-                condition=condition_data,
-                condition_type=task.condition.type,
-                is_started=task.id in started_task_ids
-            )
-            filtered_tasks.append(task_response)
-    
-    return TaskListResponse(tasks=filtered_tasks)
+    rank_id = await User.filter(id=init_data.user.id).first().values_list("rank_id", flat=True)
+    started_task_ids, completed_task_ids = await user_tasks.get(init_data.user.id)
+
+    # Видимые лиге задачи берутся из каталога, из бд читаются только задачи юзера
+    tasks = [task.response if task.id not in started_task_ids else {**task.response, "is_started": True}
+             for task in task_catalog.for_league(ranks[rank_id].league) if task.id not in completed_task_ids]
+
+    return {"tasks": tasks}
 
 @router.post("/{task_id}/start", response_model=StartTaskResponse)
-async def start_task(task_id: int, init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]):
+async def start_task(task_id: int, user: Annotated[User, Depends(user_loader())]):
     """
     Метод для начала Таска. Создает для пользователя задачу для выполнения.
     :param task_id: id задачи
-    :param init_data: данные юзера telegram
+    :param user: юзер
     :return:
     """
-    user = await User.filter(id=init_data.user.id).select_related("rank").first()
-    task = await Task.get_or_none(id=task_id).prefetch_related("reward", "condition")
+    task = task_catalog.get(task_id)
     
     if not task:
         raise HTTPException(status_code=404, detail="Задача не найдена")
     
-    if not await check_task_visibility(task, user):
+    if not task_catalog.visible(task, ranks[user.rank_id].league):
         raise HTTPException(status_code=403, detail="Задача недоступна")
     
-    user_task, created = await UserTask.get_or_create(user=user, task=task)
-    if not created:
+    if not await user_tasks.start(user.id, task.id, datetime.now(tz=timezone("Europe/Moscow"))):
         raise HTTPException(status_code=400, detail="Задача уже взята")
+
+    await invalidate(user.id, "tasks")
     
-    condition_data = await get_condition_response(task)
-    
-    task_response = TaskResponse(
-        id=task.id,
-        description=task.description,
-        reward=RewardResponse(
-            coins=task.reward.tokens,
-            inspirations=task.reward.inspirations,
-            replenishments=task.reward.replenishments
-        ),
-        condition=condition_data,
-        condition_type=task.condition.type,
-        is_started=True
-    )
-    
-    return StartTaskResponse(task=task_response)
+    return {"task": {**task.response, "is_started": True}}
 
 @router.post("/{task_id}/complete", response_model=CompleteTaskResponse)
-async def complete_task(task_id: int, init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]):
+async def complete_task(task_id: int, user: Annotated[User, Depends(user_loader("stats"))]):
     """
     Метод для завершения задачи. Отмечает задачу как выполненную и начисляет награду.
     :param task_id: id задачи
-    :param init_data: данные юзера telegram
+    :param user: юзер со stats
     :return:
     """
-    user = await User.filter(id=init_data.user.id).select_related("rank", "stats").first()
-    user_task = await UserTask.get_or_none(user=user, task_id=task_id).select_related("task__condition", "task__reward")
-    
-    if not user_task:
+    task = task_catalog.get(task_id)
+
+    if not task:
         raise HTTPException(status_code=404, detail="Задача не найдена или не взята")
-    if user_task.is_completed:
-        raise HTTPException(status_code=400, detail="Задача уже завершена")
 
-    task = user_task.task
-    
-    if task.condition.type == ConditionType.TG_CHANNEL:
+    if task.condition_type == ConditionType.TG_CHANNEL:
         # TODO: Реализовать проверку подписки на канал
         raise HTTPException(status_code=501, detail="Проверка подписки на канал пока не реализована")
 
-    # Отмечаем задачу как выполненную
-    user_task.completed_time = datetime.now(tz=timezone("Europe/Moscow"))
-    await user_task.save()
+    # Отмечаем задачу как выполненную (условное обновление, повторный запрос не начислит награду дважды)
+    completed_time = datetime.now(tz=timezone("Europe/Moscow"))
+    completed = await user_tasks.complete(user.id, task.id, completed_time)
+
+    if completed is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена или не взята")
+    if not completed:
+        raise HTTPException(status_code=400, detail="Задача уже завершена")
 
     # Начисляем награду
-    user.stats.coins += task.reward.tokens
-    user.stats.inspirations += task.reward.inspirations
-    user.stats.replenishments += task.reward.replenishments
-    await user.stats.save()
+    await credit_stats(user.id, coins=task.coins, inspirations=task.inspirations,
+                       replenishments=task.replenishments)
+    await user.stats.refresh_from_db(fields=["coins", "inspirations", "replenishments"])
+    await invalidate(user.id, "tasks", "profile")
 
     response_data = CompleteTaskResponse(
         task_id=task.id,
-        completion_time=user_task.completed_time.isoformat(),
+        completion_time=completed_time.isoformat(),
         reward=RewardResponse(
-            coins=task.reward.tokens,
-            inspirations=task.reward.inspirations,
-            replenishments=task.reward.replenishments
+            coins=task.coins,
+            inspirations=task.inspirations,
+            replenishments=task.replenishments
         ),
         user_stats=UserStatsResponse(
             coins=user.stats.coins,
@@ -1,115 +1,144 @@
-import base64
 from typing import Annotated
 from aiogram.utils.web_app import WebAppInitData
-from deep_translator import GoogleTranslator
-from fastapi import APIRouter, Depends
-from fastapi_cache.decorator import cache
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import FileResponse, Response
 from starlette import status
+from components import accumulator
+from components.avatars import avatar_path
+from components.cache import user_cache, invalidate
+from components.countries import countries
+from components.profile import get_profile
 from components.requests import ChangeRegionRequest
-from components.responses import CustomJSONResponse
-from components.tools import sync_energy, validate_telegram_hash, get_daily_reward
-from models import User, User_Pydantic, Stats, Rank
-import pycountry
+from components.responses import CustomJSONResponse, StaticJSONResponse
+from components.leaderboard import leaderboard
+from components.members import registered_users
+from components.ranks import ranks
+from components.tools import validate_telegram_hash, user_loader, credit_stats
+from config import CLICKS_WRITE_BEHIND, LEADERBOARD_SIZE, PROFILE_CACHE_TTL
+from models import User
 
 router = APIRouter(prefix="/user", tags=["User"])
 
+REGION_ALREADY_CHANGED = StaticJSONResponse("Вы уже меняли страну.", status.HTTP_409_CONFLICT)
+REGION_CHANGED = StaticJSONResponse("Страна изменена.")
+UNKNOWN_REGION = StaticJSONResponse("Страна задана неверно.", status.HTTP_409_CONFLICT)
+MAX_RANK = StaticJSONResponse("У вас максимальный ранг.", status.HTTP_409_CONFLICT)
+NOT_ENOUGH_COINS = StaticJSONResponse("Не хватает монет для повышения.", status.HTTP_409_CONFLICT)
+RANK_PROMOTED = StaticJSONResponse("Ранг повышен.", status.HTTP_202_ACCEPTED)
+
+AVATAR_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 
 @router.get(path="/profile", description="Эндпойнт на получение данных игрока.")
-@cache(expire=10)
+@user_cache("profile", expire=PROFILE_CACHE_TTL)
 async def get_user_profile(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
     """
     Эндпойнт на получение данных игрока.
     @param init_data: данные юзера telegram
     @return:
     """
-    user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
+    profile = await get_profile(init_data.user.id)
+
+    if profile is None:
+        await registered_users.discard(init_data.user.id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Для начала работы нажмите /start.")
+
+    return CustomJSONResponse(data=profile.model_dump(mode="json"), message="Выведены данные профиля.")
+
+
+@router.get(path="/avatar/{avatar_hash}", description="Эндпойнт на получение аватара игрока по имени из профиля (avatar_hash).")
+async def get_avatar(avatar_hash: str, if_none_match: Annotated[str | None, Header()] = None) -> Response:
+    """
+    Эндпойнт на получение аватара игрока по имени из профиля (avatar_hash). Имя = хеш содержимого, поэтому
+    ответ кешируется клиентом навсегда, а ETag совпадает с именем.
+    :param avatar_hash: имя аватара
+    :param if_none_match: ETag закешированного клиентом аватара
+    :return:
+    """
+    path = avatar_path(avatar_hash)
+    etag = f'"{avatar_hash}"'
+    headers = {"ETag": etag, "Cache-Control": AVATAR_CACHE_CONTROL}
 
-    user = await User.filter(id=user_chat_id).prefetch_related("activity", "stats", "rank", "leads",
-                                                               "rewards", "leader_place").first()
-    await get_daily_reward(user)  # получаем ежедневную награду за вход
-    await sync_energy(user)  # синхронизируем энергию
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Аватар не найден.")
 
-    from_orm = await User_Pydantic.from_tortoise_orm(user)
-    user_dump = from_orm.model_dump(mode="json")  # Мод как решение проблемы с сериализацией даты
-    user_dump["base64_avatar"] = base64.b64encode(user.avatar).decode("utf-8")
+    if if_none_match is not None and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    return CustomJSONResponse(data=user_dump, message="Выведены данные профиля.")
+    return FileResponse(path, headers=headers)
 
 
 @router.post(path="/change_region", description="Эндпойнт на изменение региона пользователя.")
 async def change_user_region(req: ChangeRegionRequest,
-                             init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
+                             user: Annotated[User, Depends(user_loader())]) -> CustomJSONResponse:
     """
     Эндпойнт на изменение региона пользователя (вводить в любом формате).
     @param req: request объект с названием региона ChangeRegionRequest
-    @param init_data: данные юзера telegram
+    @param user: юзер
     @return:
     """
-    user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
-    user = await User.filter(id=user_chat_id).first()
 
     if "(changed)" in user.country:
-        return CustomJSONResponse(message="Вы уже меняли страну.",
-                                  status_code=status.HTTP_409_CONFLICT)
-    else:
-        try:
-            transl_country = GoogleTranslator(source='auto', target='en').translate(req.country)
-            f_country = pycountry.countries.search_fuzzy(transl_country)[0]
-            user.country = f_country.alpha_2 + " (changed)"
-            await user.save()
-            return CustomJSONResponse(message="Страна изменена.")
-        except LookupError:
-            return CustomJSONResponse(message="Страна задана неверно.",
-                                      status_code=status.HTTP_409_CONFLICT)
-
-
-@router.get(path="/leaderboard", description="Эндпойнт на получение лидерборда (50 лидеров по количеству заработанных монет за неделю) earned_week_coins обнуляется и начисляет награды в воскресенье в таск менеджере (отдельный сервис).")
-@cache(expire=3600)
+        return REGION_ALREADY_CHANGED()
+
+    country_code = countries.resolve(req.country)  # локальный индекс названий на всех языках, без перевода
+
+    if country_code is None:
+        return UNKNOWN_REGION()
+
+    user.country = country_code + " (changed)"
+    await user.save(update_fields=["country"])
+    await invalidate(user.id, "profile")
+
+    return REGION_CHANGED()
+
+
+@router.get(path="/leaderboard", description="Эндпойнт на получение лидерборда (50 лидеров по количеству заработанных монет за неделю) и места игрока. Награды лидерам начисляются и earned_week_coins обнуляется в конце недели в components.settlement (python -m components.settlement по cron).")
 async def get_leaderboard(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
     """
-    Эндпойнт на получение лидерборда (50 лидеров по количеству заработанных монет за неделю)
-    earned_week_coins обнуляется и начисляет награды в воскресенье в таск менеджере (отдельный сервис).
+    Эндпойнт на получение лидерборда (50 лидеров по количеству заработанных монет за неделю) и места игрока
+    (place = null, если на этой неделе он ничего не заработал).
+    Награды лидерам начисляются и earned_week_coins обнуляется в конце недели в components.settlement
+    (python -m components.settlement по cron в воскресенье).
     :param init_data: данные юзера telegram
     :return:
     """
-    users_stats = (await Stats.all()
-                   .order_by('earned_week_coins')
-                   .limit(50)
-                   .select_related("user").values(id="user__id", coins="earned_week_coins",
-                                                  rank="user__rank_id", username="user__username"))
+    top = await leaderboard.top(LEADERBOARD_SIZE)
+    my_place = await leaderboard.place(init_data.user.id)
 
-    users_stats.reverse()
+    users = {row["id"]: row for row in await User.filter(id__in=[user_id for user_id, _ in top])
+                                                 .values("id", "rank_id", "username")}
+    leaders = [{"id": user_id, "coins": coins, "rank": users[user_id]["rank_id"],
+                "username": users[user_id]["username"]} for user_id, coins in top if user_id in users]
 
-    return CustomJSONResponse(data={"leaders": users_stats},
+    return CustomJSONResponse(data={"leaders": leaders,
+                                    "place": my_place and {"place": my_place[0], "coins": my_place[1]}},
                               message="Выведен список лидеров на текущую неделю.")
 
 
 @router.patch(path="/rank", description="Эндпойнт для повышения ранга (если хватает монет).")
-async def promote_rank(init_data: Annotated[WebAppInitData, Depends(validate_telegram_hash)]) -> CustomJSONResponse:
+async def promote_rank(user: Annotated[User, Depends(user_loader("stats"))]) -> CustomJSONResponse:
     """
     Эндпойнт для повышения ранга (если хватает монет).
-    :param init_data: данные юзера telegram
+    :param user: юзер со stats
     :return:
     """
-    user_chat_id = init_data.user.id  # узнаем chat_id юзера из init_data
-    user = await User.filter(id=user_chat_id).select_related("stats").first()
 
-    if user.rank_id >= 20:
-        return CustomJSONResponse(message="У вас максимальный ранг.",
-                                  status_code=status.HTTP_409_CONFLICT)
+    next_rank = ranks.get(user.rank_id + 1)
 
-    next_rank = await Rank.filter(id=(user.rank_id + 1)).first()
+    if next_rank is None:
+        return MAX_RANK()
 
-    if user.stats.coins < next_rank.price:
-        return CustomJSONResponse(message="Не хватает монет для повышения.",
-                                  status_code=status.HTTP_409_CONFLICT)
+    if CLICKS_WRITE_BEHIND:
+        await accumulator.merge_pending(user)  # монеты за клики, еще не записанные в бд
 
-    user.stats.coins -= next_rank.price
-    user.rank_id = next_rank.id
+    if user.stats.coins < next_rank.price:
+        return NOT_ENOUGH_COINS()
 
-    await user.stats.save()
-    await user.save()
+    # Условие на текущий ранг защищает от двойного списания при параллельных запросах
+    if await User.filter(id=user.id, rank_id=user.rank_id).update(rank_id=next_rank.id):
+        await credit_stats(user.id, coins=-next_rank.price, earned_week=False)
+        await invalidate(user.id, "profile", "tasks")  # видимость заданий зависит от лиги ранга
 
-    return CustomJSONResponse(message="Ранг повышен.",
-                              status_code=status.HTTP_202_ACCEPTED)
+    return RANK_PROMOTED()
 
@@ -0,0 +1,50 @@
+import hmac
+from hashlib import sha256
+from time import perf_counter, time
+from urllib.parse import urlencode
+from aiogram.utils.web_app import safe_parse_webapp_init_data
+from components.telegram_auth import InitDataVerifier
+
+# Запуск из src: python -m tests.bench.auth_bench
+token = "1234567890:AAE-bench-token-bench-token-bench-tok"
+iterations = 20000
+rps = 500
+
+
+def make_init_data() -> str:
+    """
+    Генерирует валидный init data, подписанный token.
+    """
+    fields = {
+        "query_id": "AAGdJCdOAgAAAJ0kJ04fz7iU",
+        "user": '{"id":5606155421,"first_name":"Anna","last_name":"","username":"sobored19",'
+                '"language_code":"en","allows_write_to_pm":true}',
+        "auth_date": str(int(time())),
+    }
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret = hmac.new(key=b"WebAppData", msg=token.encode(), digestmod=sha256).digest()
+    fields["hash"] = hmac.new(key=secret, msg=data_check_string.encode(), digestmod=sha256).hexdigest()
+    return urlencode(fields)
+
+
+def bench(name: str, func, init_data: str) -> float:
+    func(init_data)  # прогрев
+    start = perf_counter()
+
+    for _ in range(iterations):
+        func(init_data)
+
+    per_call = (perf_counter() - start) / iterations
+    print(f"{name:<40} {per_call * 1e6:8.2f} мкс/запрос")
+    return per_call
+
+
+if __name__ == "__main__":
+    init_data = make_init_data()
+    verifier = InitDataVerifier(token=token, maxsize=50000, ttl=3600, max_age=86400)
+
+    old = bench("safe_parse_webapp_init_data", lambda d: safe_parse_webapp_init_data(token, d), init_data)
+    new = bench("InitDataVerifier.parse (кеш)", verifier.parse, init_data)
+
+    print(f"Экономия CPU на {rps} RPS: {(old - new) * rps * 1000:.1f} мс/сек "
+          f"({(old - new) * rps * 100:.2f}% одного ядра), ускорение x{old / new:.0f}")
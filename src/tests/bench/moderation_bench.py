@@ -0,0 +1,91 @@
+from asyncio import run, gather, sleep, create_task
+from time import perf_counter, sleep as blocking_sleep
+from better_profanity import profanity
+from spellchecker import SpellChecker
+from components import moderation
+from components.redis_db import redis
+from components.translation import Translator, GoogleBackend
+from config import TRANSLATION_CACHE_SIZE, TRANSLATION_LOCAL_TTL, TRANSLATION_TIMEOUT
+
+# Запуск из src: python -m tests.bench.moderation_bench
+# Переводчик заменен задержкой translate_latency (блокирующий запрос без сети), проверки - настоящие.
+# Повторы вопросов после перевода берутся из кеша переводов под префиксом prefix (нужен Redis из .env),
+# кеш переводов приложения не затрагивается.
+questions = [
+    "What is the meaning of life and why are we here",
+    "Will I become rich if I keep tapping every day",
+    "Whta is teh bset wya to lern prgramming fsat",
+    "Tell me a secret about the ancient gods of the sea",
+] * 10
+translate_latency = 0.2  # время ответа переводчика, сек
+tick = 0.001  # период heartbeat-корутины, сек
+prefix = "bench:moderation"
+
+
+def translate_blocking(text: str, target: str = "en") -> str:
+    blocking_sleep(translate_latency)
+    return text
+
+
+async def ask_old(question: str) -> None:
+    """
+    Прежний обработчик: синхронный перевод и загрузка словарей на каждый вопрос прямо в event loop.
+    """
+    text = translate_blocking(question)
+    profanity.load_censor_words(whitelist_words=["god"])
+    spell = SpellChecker(language='en')
+    corrects_words = [spell.correction(word) for word in text.split()]
+    assert None not in corrects_words and "*" not in profanity.censor(text)
+
+
+class BlockingBackend(GoogleBackend):
+    _translate = staticmethod(translate_blocking)
+
+
+translator = Translator(BlockingBackend(threads=8), maxsize=TRANSLATION_CACHE_SIZE, local_ttl=TRANSLATION_LOCAL_TTL,
+                        ttl=3600, timeout=TRANSLATION_TIMEOUT, prefix=prefix)
+
+
+async def ask_new(question: str) -> None:
+    text = await translator.translate(question)
+    await moderation.check_question(text)
+
+
+async def heartbeat(lags: list[float], stop: list[bool]) -> None:
+    """
+    Засыпает на tick и записывает, насколько позже срока event loop вернул управление.
+    """
+    while not stop:
+        start = perf_counter()
+        await sleep(tick)
+        lags.append(perf_counter() - start - tick)
+
+
+async def bench(name: str, handler) -> None:
+    lags, stop = [], []
+    beat = create_task(heartbeat(lags, stop))
+    await sleep(0.01)
+    start = perf_counter()
+
+    await gather(*(handler(question) for question in questions), return_exceptions=True)
+
+    elapsed = perf_counter() - start
+    stop.append(True)
+    await beat
+    lags.sort()
+    print(f"{name:<10} {len(questions)} вопросов за {elapsed:6.2f} с | простой event loop: "
+          f"макс {lags[-1] * 1000:8.1f} мс, p99 {lags[int(len(lags) * 0.99)] * 1000:7.1f} мс, "
+          f"сумма {sum(lags):6.2f} с")
+
+
+async def main() -> None:
+    await redis.delete(*[key async for key in redis.scan_iter(f"{prefix}:*")] or [f"{prefix}:none"])
+    await moderation.load()
+
+    await bench("до", ask_old)
+    await bench("после", ask_new)
+    await redis.aclose()
+
+
+if __name__ == "__main__":
+    run(main())
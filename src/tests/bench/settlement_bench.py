@@ -0,0 +1,57 @@
+from asyncio import run
+from datetime import date
+from time import perf_counter
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+from components.settlement import settle_week
+from config import TORTOISE_CONFIG
+
+# Запуск из src (нужен postgres из .env): python -m tests.bench.settlement_bench
+# Все выполняется в одной транзакции, которая откатывается в конце, поэтому бд остается без изменений.
+# publish=False: клики из Redis, лидерборд и кеш ответов не трогаются.
+first_user_id = 8000000000
+rows = 2_000_000
+bench_week = date(2000, 1, 3)  # неделя, которой точно нет в Settlement
+
+INSERT_USERS_SQL = """
+INSERT INTO "user" (id, rank_id, country, referral_code, username)
+SELECT g, 1, 'RU', 'bench-' || g, 'bench' FROM generate_series($1::bigint, $2::bigint) g
+"""
+
+INSERT_STATS_SQL = """
+INSERT INTO "stats" (user_id, coins, energy, earned_week_coins, invited_friends, inspirations, replenishments)
+SELECT g, 1000, 2000, (random() * 1000000)::bigint, 0, 0, 0 FROM generate_series($1::bigint, $2::bigint) g
+"""
+
+
+class Rollback(Exception):
+    pass
+
+
+async def main() -> None:
+    await Tortoise.init(config=TORTOISE_CONFIG)
+
+    try:
+        async with in_transaction("api") as conn:
+            start = perf_counter()
+            await conn.execute_query(INSERT_USERS_SQL, [first_user_id, first_user_id + rows - 1])
+            await conn.execute_query(INSERT_STATS_SQL, [first_user_id, first_user_id + rows - 1])
+            print(f"Создано {rows} юзеров со stats за {perf_counter() - start:.1f} сек")
+
+            result = await settle_week(bench_week, publish=False)
+            print(f"Итоги недели: лидеров {result.leaders}, обнулено stats {result.reset_stats} за "
+                  f"{result.seconds:.2f} сек ({result.reset_stats / result.seconds:.0f} строк/сек)")
+
+            start = perf_counter()
+            repeated = await settle_week(bench_week, publish=False)
+            print(f"Повторный запуск: {repeated} за {(perf_counter() - start) * 1000:.1f} мс")
+
+            raise Rollback
+    except Rollback:
+        pass
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    run(main())
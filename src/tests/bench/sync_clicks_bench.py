@@ -0,0 +1,67 @@
+from asyncio import run, gather, Semaphore
+from statistics import quantiles
+from time import perf_counter
+from tortoise import Tortoise
+from components import clicks
+from components.ranks import ranks
+from components.daily import get_daily_reward
+from config import TORTOISE_CONFIG
+from models import User, Stats, Activity
+
+# Запуск из src (нужен postgres из .env): python -m tests.bench.sync_clicks_bench
+bench_user_id = 9000000001
+iterations = 5000
+concurrency = 20
+
+
+async def sync_clicks_orm() -> None:
+    user = await User.filter(id=bench_user_id).select_related("rank", "stats", "activity").first()
+    await get_daily_reward(user)
+    await clicks.extract_clicks(user, 10)
+
+
+async def sync_clicks_atomic() -> None:
+    user = await User.filter(id=bench_user_id).select_related("activity").first()
+    await get_daily_reward(user)
+    await clicks.extract_clicks(user, 10)
+
+
+async def bench(name: str, func, atomic: bool) -> None:
+    clicks.ATOMIC_SYNC_CLICKS = atomic
+    semaphore = Semaphore(concurrency)
+    latencies = []
+
+    async def timed() -> None:
+        async with semaphore:
+            start = perf_counter()
+            await func()
+            latencies.append(perf_counter() - start)
+
+    await Stats.filter(user_id=bench_user_id).update(energy=10 ** 9)
+    start = perf_counter()
+    await gather(*(timed() for _ in range(iterations)))
+    elapsed = perf_counter() - start
+
+    pct = quantiles(latencies, n=100)
+    print(f"{name:<8} {iterations / elapsed:8.0f} req/s   p50 {pct[49] * 1000:6.2f} мс   "
+          f"p95 {pct[94] * 1000:6.2f} мс   p99 {pct[98] * 1000:6.2f} мс")
+
+
+async def main() -> None:
+    await Tortoise.init(config=TORTOISE_CONFIG)
+    await ranks.load()
+
+    if not await User.exists(id=bench_user_id):
+        await User.create(id=bench_user_id, country="RU", username="bench")
+        await Stats.create(user_id=bench_user_id)
+        await Activity.create(user_id=bench_user_id)
+
+    await bench("orm", sync_clicks_orm, atomic=False)
+    await bench("atomic", sync_clicks_atomic, atomic=True)
+
+    await User.filter(id=bench_user_id).delete()
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    run(main())
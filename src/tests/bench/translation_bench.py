@@ -0,0 +1,41 @@
+from asyncio import run, gather
+from random import Random
+from time import perf_counter
+from components.redis_db import redis
+from components.translation import Translator, OfflineBackend
+from config import TRANSLATION_CACHE_SIZE, TRANSLATION_LOCAL_TTL, TRANSLATION_TIMEOUT
+
+# Запуск из src (нужен Redis из .env): python -m tests.bench.translation_bench
+# Переводы кешируются под префиксом prefix, кеш переводов приложения не затрагивается.
+requests = 5000
+distinct = 200  # разных текстов (страны, приветствия, повторы отклоненных вопросов)
+concurrency = 100
+latency = 0.3  # время ответа переводчика, сек
+prefix = "bench:translation"
+
+
+async def main() -> None:
+    rnd = Random(1)
+    texts = [f"  Text   number {rnd.randrange(distinct)} " for _ in range(requests)]  # пробелы схлопнутся
+    backend = OfflineBackend(latency=latency)
+    translator = Translator(backend, maxsize=TRANSLATION_CACHE_SIZE, local_ttl=TRANSLATION_LOCAL_TTL, ttl=3600,
+                            timeout=TRANSLATION_TIMEOUT, prefix=prefix)
+    await redis.delete(*[key async for key in redis.scan_iter(f"{prefix}:*")] or [f"{prefix}:none"])
+
+    start = perf_counter()
+
+    for i in range(0, requests, concurrency):
+        await gather(*(translator.translate(text) for text in texts[i:i + concurrency]))
+
+    elapsed = perf_counter() - start
+    stats = translator.stats()
+
+    print(f"{requests} переводов ({distinct} разных, по {concurrency} параллельно) за {elapsed:.2f} с, "
+          f"без кеша ~{requests / concurrency * latency:.0f} с")
+    print(f"запросов к переводчику: {backend.calls}, hit rate: {stats['hit_rate']:.2%}, "
+          f"объединено: {stats['coalesced']}, из памяти: {stats['local']['hits']}")
+    await redis.aclose()
+
+
+if __name__ == "__main__":
+    run(main())
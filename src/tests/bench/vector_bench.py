@@ -0,0 +1,86 @@
+import json
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+import numpy as np
+from components.vectors import VectorIndex, normalized, pack
+from config import EMBEDDING_DIM
+
+# Запуск из src: python -m tests.bench.vector_bench
+# Индекс из rows случайных векторов EMBEDDING_DIM (файлы во временной папке, ~1.5 Гб при 1M x 384).
+# Запросы - сохраненные векторы с шумом (сходство ~0.97), проверяется, что ближайшим находится исходный.
+rows = 1_000_000
+fill_batch = 100_000  # векторов на add + flush при заполнении
+noise = 0.012  # стандартное отклонение шума на значение нормализованного вектора
+rng = np.random.default_rng(0)
+
+
+def timed(function, *args, repeat: int = 5) -> tuple[float, object]:
+    """
+    Лучшее время из repeat запусков (первый запуск читает файл с диска, остальные - из кеша ОС), сек.
+    """
+    best, result = float("inf"), None
+
+    for _ in range(repeat):
+        start = perf_counter()
+        result = function(*args)
+        best = min(best, perf_counter() - start)
+
+    return best, result
+
+
+def main() -> None:
+    directory = mkdtemp()
+    path = os.path.join(directory, "questions")
+
+    try:
+        vector = normalized(rng.standard_normal(EMBEDDING_DIM))[0]
+        print(f"эмбеддинг {EMBEDDING_DIM}: текст JSON {len(json.dumps(vector.tolist()))} байт, "
+              f"float32 {len(pack(vector))} байт")
+
+        index = VectorIndex(path, EMBEDDING_DIM)
+        start, flush_time = perf_counter(), 0.0
+
+        for first in range(0, rows, fill_batch):
+            index.add(np.arange(first, first + fill_batch), rng.standard_normal((fill_batch, EMBEDDING_DIM),
+                                                                                dtype=np.float32))
+            flush_start = perf_counter()
+            index.flush()
+            flush_time += perf_counter() - flush_start
+
+        print(f"заполнение {len(index)} строк: {perf_counter() - start:.1f} с, из них flush {flush_time:.1f} с, "
+              f"файл {os.path.getsize(path + '.f32') / 2 ** 30:.2f} Гб")
+
+        index = VectorIndex(path, EMBEDDING_DIM)
+        elapsed, _ = timed(index.load, repeat=1)
+        print(f"открытие memory map: {elapsed * 1000:.1f} мс")
+
+        targets = rng.choice(rows, 256, replace=False)
+        queries = np.asarray(index._base[targets]) + rng.normal(0, noise, (256, EMBEDDING_DIM)).astype(np.float32)
+        elapsed, _ = timed(index.search, queries[:1], repeat=1)
+        print(f"первый поиск (чтение файла): {elapsed * 1000:.0f} мс")
+
+        for size in (1, 32, 256):
+            elapsed, (found, scores) = timed(index.search, queries[:size])
+            recall = np.mean(found[:, 0] == targets[:size])
+            print(f"пачка {size:>3}: {elapsed * 1000:7.1f} мс, {elapsed / size * 1000:6.2f} мс на запрос, "
+                  f"top-1 recall {recall:.3f}, сходство min {scores[:, 0].min():.3f}")
+
+        elapsed, _ = timed(lambda: [index.search(query) for query in queries[:32]], repeat=2)
+        print(f"32 запроса по одному: {elapsed * 1000:7.1f} мс")
+
+        elapsed, (found, _) = timed(index.search, queries[:32], 10)
+        print(f"пачка  32, top-10: {elapsed * 1000:7.1f} мс")
+
+        index.add([rows], queries[:1])
+        found, _ = index.search(queries[:1], 2)
+        elapsed, written = timed(index.flush, repeat=1)
+        print(f"добавленный вектор найден до flush: {rows in found[0]}, flush {written} строки: "
+              f"{elapsed * 1000:.1f} мс")
+    finally:
+        rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ from pytest import param
 from starlette.status import (HTTP_409_CONFLICT, HTTP_200_OK, HTTP_404_NOT_FOUND, HTTP_202_ACCEPTED,
                               HTTP_208_ALREADY_REPORTED, HTTP_201_CREATED, HTTP_401_UNAUTHORIZED)
 from conftest import init_data
+from models import QuestionStatus
 
 register_params = (
     param({"chat_id": 1, "token": "1", "country": "ru"}, "no_referral_code", HTTP_201_CREATED,
@@ -66,3 +67,32 @@ replenishment_params = (
     param("with_max_energy", HTTP_409_CONFLICT, id="with_max_energy"),
     param("without_constraints", HTTP_200_OK, id="without_constraints"),
 )
+
+get_avatar_params = (
+    param("with_avatar", HTTP_200_OK, id="with_avatar"),
+    param("with_unknown_hash", HTTP_404_NOT_FOUND, id="with_unknown_hash"),
+    param("with_invalid_hash", HTTP_404_NOT_FOUND, id="with_invalid_hash"),
+)
+
+bulk_register_params = (
+    param("without_token", HTTP_404_NOT_FOUND, id="without_token"),
+    param("with_referral_code", HTTP_201_CREATED, id="with_referral_code"),
+)
+
+change_region_params = (
+    param("with_unknown_region", "Атлантида", HTTP_409_CONFLICT, id="with_unknown_region"),
+    param("with_misspelled_region", "Германя", HTTP_200_OK, id="with_misspelled_region"),
+    param("with_changed_region", "France", HTTP_409_CONFLICT, id="with_changed_region"),
+)
+
+ai_queue_params = (
+    param("answered", QuestionStatus.HAVE_ANSWER, id="answered"),
+    param("retried", QuestionStatus.HAVE_ANSWER, id="retried"),
+    param("dead_letter", QuestionStatus.FAILED, id="dead_letter"),
+)
+
+translation_params = (
+    param("normalized", id="normalized"),
+    param("coalesced", id="coalesced"),
+    param("error_not_cached", id="error_not_cached"),
+)
@@ -1,10 +1,18 @@
+from asyncio import gather
 from datetime import datetime, timedelta
+from uuid import uuid4
 import pytest
 from httpx import AsyncClient
 from pytz import timezone
 from starlette.status import HTTP_200_OK
 from ...components.tools import assert_status_code
-from models import User, Activity, Stats, Reward
+from components.ai_queue import AIQueue, OfflineAnswerBackend, enqueue
+from components import avatars
+from components.avatars import save_avatar
+from components.redis_db import redis
+from components.translation import Translator, OfflineBackend, TranslationError
+from config import TOKEN
+from models import User, Activity, Stats, Reward, Question, QuestionStatus, RewardType
 import params as params
 from conftest import chat_id
 
@@ -153,3 +161,104 @@ async def test_use_replenishment(client: AsyncClient, variant: str, status_code:
 async def test_get_user_profile(client: AsyncClient) -> None:
     response = await client.get(url="/user/profile")
     await assert_status_code(response, HTTP_200_OK)
+
+
+@pytest.mark.parametrize("variant, status_code", params.get_avatar_params)
+async def test_get_avatar(client: AsyncClient, variant: str, status_code: int, monkeypatch, tmp_path) -> None:
+    # Аватары пишем во временный каталог, чтобы тесты не оставляли файлов в исходниках
+    monkeypatch.setattr(avatars, "AVATARS_DIR", str(tmp_path))
+    match variant:
+        case "with_avatar":
+            avatar_hash = await save_avatar(b"\x89PNG\r\n\x1a\n" + b"0" * 16)
+        case "with_unknown_hash":
+            avatar_hash = "0" * 64 + ".png"
+        case _:
+            avatar_hash = "..%2F..%2Fconfig.py"
+
+    response = await client.get(url=f"/user/avatar/{avatar_hash}")
+    assert response.status_code == status_code
+
+
+@pytest.mark.parametrize("variant, status_code", params.bulk_register_params)
+async def test_bulk_register(client: AsyncClient, variant: str, status_code: int) -> None:
+    referrer = await User.get(id=chat_id).select_related("stats")
+    users = [{"id": 1000 + i, "username": f"lead{i}", "country": "RU", "referral_code": referrer.referral_code}
+             for i in range(5)]
+
+    match variant:
+        case "without_token":
+            response = await client.post(url="/registration/bulk", json={"users": users})
+        case _:
+            response = await client.post(url="/registration/bulk", json={"users": users},
+                                         headers={"X-Bot-Token": TOKEN})
+            stats = await Stats.get(user_id=chat_id)
+            assert stats.invited_friends == referrer.stats.invited_friends + 5
+            assert await Activity.filter(user__referrer_id=chat_id).count() == 5
+
+    await assert_status_code(response, status_code)
+
+
+@pytest.mark.parametrize("variant, country, status_code", params.change_region_params)
+async def test_change_region(client: AsyncClient, variant: str, country: str, status_code: int) -> None:
+    match variant:
+        case "with_changed_region":
+            await User.filter(id=chat_id).update(country="DE (changed)")
+        case _:
+            await User.filter(id=chat_id).update(country="RU")
+
+    response = await client.post(url="/user/change_region", json={"country": country})
+    await assert_status_code(response, status_code)
+
+
+@pytest.mark.parametrize("variant, status", params.ai_queue_params)
+async def test_ai_queue(client: AsyncClient, variant: str, status: QuestionStatus) -> None:
+    question = await Question.create(user_id=chat_id, u_text=variant, text=f"Question {variant} for the model")
+    backend = OfflineAnswerBackend(fail=None if variant == "answered" else {question.text})
+    stream = f"test:ai_questions:{uuid4().hex}"  # без сообщений других потребителей и прошлых запусков
+    queue = AIQueue(backend, retry_delay=0, max_attempts=2, consumer=f"test-{variant}", stream=stream,
+                    group=f"{stream}:workers", dead_stream=f"{stream}:dead")
+    rewards = await Reward.filter(user_id=chat_id, type=RewardType.AI_QUESTION).count()
+    await queue.create_group()
+    await enqueue(question.id, stream=stream)
+
+    try:
+        match variant:
+            case "retried":
+                await queue.run_once()  # модель не ответила, сообщение осталось неподтвержденным
+                backend.fail.clear()
+                await queue.run_once()  # повторная доставка
+            case "dead_letter":
+                await queue.run_once()
+                await queue.run_once()  # вторая неудачная доставка из max_attempts
+            case _:
+                await queue.run_once()
+    finally:
+        await redis.delete(queue.stream, queue.dead_stream)
+
+    await question.refresh_from_db()
+    assert question.status == status
+    assert await Reward.filter(user_id=chat_id, type=RewardType.AI_QUESTION).count() == \
+           rewards + (status == QuestionStatus.HAVE_ANSWER)
+
+
+@pytest.mark.parametrize("variant", params.translation_params)
+async def test_translation(variant: str) -> None:
+    backend = OfflineBackend({"Hello world": "Привет мир"}, latency=0.01)
+    translator = Translator(backend, maxsize=100, local_ttl=60, ttl=60, timeout=1,
+                            prefix=f"test:translation:{uuid4().hex}")
+
+    match variant:
+        case "normalized":
+            assert await translator.translate("  Hello \n world ", "ru") == "Привет мир"
+            assert await translator.translate("Hello world", "ru") == "Привет мир"
+        case "coalesced":
+            assert await gather(*(translator.translate("Hello world", "ru") for _ in range(10))) == ["Привет мир"] * 10
+        case _:
+            backend.latency = 2  # дольше timeout
+            with pytest.raises(TranslationError):
+                await translator.translate("Hello world", "ru")
+
+            backend.latency = 0
+            assert await translator.translate("Hello world", "ru") == "Привет мир"
+
+    assert backend.calls == (2 if variant == "error_not_cached" else 1)